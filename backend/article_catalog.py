@@ -0,0 +1,183 @@
+import asyncio
+import csv
+import json
+import os
+import re
+import sys
+import time
+import urllib.parse
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from types import MappingProxyType
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from database import SessionLocal, Article, CatalogVersion
+from article_index import ArticleIndex
+
+# Article catalog store.
+# Articles live in the articles table; readers get an immutable, versioned snapshot
+# (frozen article mappings + retrieval index) cached in memory. Every import bumps
+# catalog_version, and readers rebuild their snapshot when they see a new version.
+
+SEED_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "articles_seed.json")
+
+# How often readers re-check catalog_version (seconds)
+VERSION_CHECK_INTERVAL = float(os.getenv("CATALOG_VERSION_CHECK_SECONDS", "1.0"))
+
+FIELDS = ("id", "category", "title", "source", "time", "image_prompt", "image")
+
+
+def image_url(image_prompt):
+    encoded_prompt = urllib.parse.quote(image_prompt or "")
+    return f"https://image.pollinations.ai/prompt/{encoded_prompt}?width=600&height=400&nologo=true"
+
+
+def _published_from_label(label, now):
+    """Turn labels like '30m ago', '2h ago', '1d ago' into a timestamp"""
+    match = re.match(r"\s*(\d+)\s*([mhd])", label or "")
+    if not match:
+        return now
+    amount, unit = int(match.group(1)), match.group(2)
+    return now - {"m": timedelta(minutes=amount), "h": timedelta(hours=amount), "d": timedelta(days=amount)}[unit]
+
+
+def _row(record, now):
+    published_at = record.get("published_at")
+    if isinstance(published_at, str) and published_at:
+        published_at = datetime.fromisoformat(published_at)
+    if not published_at:
+        published_at = _published_from_label(record.get("time"), now)
+    return {
+        "id": int(record["id"]),
+        "category": record.get("category", ""),
+        "title": record.get("title", ""),
+        "source": record.get("source", ""),
+        "time": record.get("time") or "Recently",
+        "image_prompt": record.get("image_prompt", ""),
+        "image": record.get("image") or image_url(record.get("image_prompt", "")),
+        "published_at": published_at,
+    }
+
+
+def upsert_articles(records, batch_size=1000):
+    """Insert or update article records in bulk and bump the catalog version"""
+    now = datetime.utcnow()
+    rows = [_row(record, now) for record in records]
+    if not rows:
+        return 0
+    db = SessionLocal()
+    try:
+        for start in range(0, len(rows), batch_size):
+            stmt = sqlite_insert(Article).values(rows[start:start + batch_size])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["id"],
+                set_={col: stmt.excluded[col] for col in rows[0] if col != "id"},
+            )
+            db.execute(stmt)
+        version = db.get(CatalogVersion, 1)
+        if version is None:
+            db.add(CatalogVersion(id=1, version=1))
+        else:
+            version.version += 1
+        db.commit()
+    finally:
+        db.close()
+    invalidate()
+    return len(rows)
+
+
+def read_records(path):
+    """Read article records from a .json (list of objects) or .csv (header row) file"""
+    if path.lower().endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as f:
+            return list(csv.DictReader(f))
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def import_file(path):
+    return upsert_articles(read_records(path))
+
+
+def ensure_seeded():
+    """Load the bundled seed catalog into an empty articles table"""
+    db = SessionLocal()
+    try:
+        empty = db.query(Article.id).first() is None
+    finally:
+        db.close()
+    if empty and os.path.exists(SEED_PATH):
+        import_file(SEED_PATH)
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    version: int
+    articles: tuple  # read-only article mappings, most recent first
+    by_id: MappingProxyType
+    index: ArticleIndex
+
+
+def _current_version(db):
+    row = db.get(CatalogVersion, 1)
+    return row.version if row else 0
+
+
+def _load_snapshot():
+    db = SessionLocal()
+    try:
+        version = _current_version(db)
+        rows = db.query(Article).order_by(Article.published_at.desc(), Article.id).all()
+        articles = tuple(MappingProxyType({f: getattr(row, f) for f in FIELDS}) for row in rows)
+    finally:
+        db.close()
+    return Snapshot(
+        version=version,
+        articles=articles,
+        by_id=MappingProxyType({a["id"]: a for a in articles}),
+        index=ArticleIndex(articles),
+    )
+
+
+_snapshot = None
+_checked_at = 0.0
+_lock = None
+
+
+def _version_changed():
+    db = SessionLocal()
+    try:
+        return _current_version(db) != _snapshot.version
+    finally:
+        db.close()
+
+
+async def snapshot():
+    """Current catalog snapshot; rebuilt off the event loop when the version changes"""
+    global _snapshot, _checked_at, _lock
+    if _snapshot is not None and time.monotonic() - _checked_at < VERSION_CHECK_INTERVAL:
+        return _snapshot
+    if _lock is None:
+        _lock = asyncio.Lock()
+    async with _lock:
+        if _snapshot is not None and time.monotonic() - _checked_at < VERSION_CHECK_INTERVAL:
+            return _snapshot
+        if _snapshot is None or await asyncio.to_thread(_version_changed):
+            _snapshot = await asyncio.to_thread(_load_snapshot)
+        _checked_at = time.monotonic()
+    return _snapshot
+
+
+def invalidate():
+    """Force the next snapshot() call to re-check the catalog version"""
+    global _checked_at
+    _checked_at = 0.0
+
+
+if __name__ == "__main__":
+    # Usage: python article_catalog.py import articles.json|articles.csv
+    if len(sys.argv) != 3 or sys.argv[1] != "import":
+        print("Usage: python article_catalog.py import <file.json|file.csv>")
+        sys.exit(1)
+    from database import init_db
+    init_db()
+    print(f"Imported {import_file(sys.argv[2])} articles")
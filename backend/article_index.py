@@ -0,0 +1,94 @@
+import math
+import re
+import zlib
+import numpy as np
+
+# Local retrieval engine for recommendations.
+# Article titles and categories are embedded as hashed TF-IDF vectors and stored
+# column-wise (CSC: one posting list per hashed dimension). A query only touches
+# the postings of its own few terms, so scoring 100k articles is a handful of
+# NumPy bincounts, and top-k is an argpartition.
+
+DIMENSIONS = 1 << 18
+STOPWORDS = {"a", "an", "and", "at", "by", "for", "from", "in", "is", "new", "of", "on", "the", "to", "vs", "with"}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+def _dim(token):
+    return zlib.crc32(token.encode("utf-8")) & (DIMENSIONS - 1)
+
+
+class ArticleIndex:
+    def __init__(self, articles):
+        """Build the index; articles need id, title and category"""
+        self.size = len(articles)
+        self.categories = {}
+        category_codes = []
+        rows, dims, counts = [], [], []
+        for row, article in enumerate(articles):
+            category = article.get("category", "")
+            category_codes.append(self.categories.setdefault(category.lower(), len(self.categories)))
+            tf = {}
+            for token in tokenize(f"{article.get('title', '')} {category}"):
+                d = _dim(token)
+                tf[d] = tf.get(d, 0) + 1
+            for d, n in tf.items():
+                rows.append(row)
+                dims.append(d)
+                counts.append(n)
+
+        self.category_codes = np.array(category_codes, dtype=np.int32)
+        rows = np.array(rows, dtype=np.int32)
+        dims = np.array(dims, dtype=np.int64)
+        weights = np.array(counts, dtype=np.float32)
+
+        # idf per dimension, then l2-normalize each article vector
+        df = np.bincount(dims, minlength=DIMENSIONS).astype(np.float32)
+        self.idf = np.log((1 + self.size) / (1 + df)) + 1
+        weights = (1 + np.log(weights)) * self.idf[dims]
+        norms = np.sqrt(np.bincount(rows, weights=weights * weights, minlength=self.size))
+        weights = weights / np.where(norms > 0, norms, 1)[rows]
+
+        order = np.argsort(dims, kind="stable")
+        self.rows = rows[order]
+        self.weights = weights[order].astype(np.float32)
+        self.indptr = np.searchsorted(dims[order], np.arange(DIMENSIONS + 1))
+
+    def search(self, interests, k=10):
+        """
+        Return [(row, score)] of the top-k articles for the interests.
+        Articles in a category named by an interest are preferred; other matches follow.
+        """
+        if self.size == 0:
+            return []
+        query = {}
+        for interest in interests:
+            for token in tokenize(interest):
+                d = _dim(token)
+                query[d] = query.get(d, 0) + 1
+
+        scores = np.zeros(self.size, dtype=np.float32)
+        if query:
+            qdims = np.fromiter(query.keys(), dtype=np.int64)
+            qweights = (1 + np.log(np.fromiter(query.values(), dtype=np.float32))) * self.idf[qdims]
+            qweights /= math.sqrt(float(np.dot(qweights, qweights))) or 1.0
+            for d, w in zip(qdims, qweights):
+                start, end = self.indptr[d], self.indptr[d + 1]
+                if start < end:
+                    scores += np.bincount(self.rows[start:end], weights=self.weights[start:end] * w, minlength=self.size).astype(np.float32)
+
+        wanted = [self.categories[i.lower()] for i in interests if i.lower() in self.categories]
+        if wanted:
+            # Category filter: matching categories rank above everything else
+            scores = scores + np.isin(self.category_codes, wanted).astype(np.float32)
+
+        k = min(k, self.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        # Highest score first; ties keep catalog order
+        top = top[np.lexsort((top, -scores[top]))]
+        return [(int(row), float(scores[row])) for row in top if scores[row] > 0]
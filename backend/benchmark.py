@@ -0,0 +1,249 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import numpy as np
+
+# Offline load test for the whole backend.
+# google.generativeai is replaced by gemini_standin (configurable latency, errors,
+# quota errors and malformed output). Every /feature-N and /dashboard/* endpoint is
+# driven in-process over ASGI at a fixed concurrency. Reported per endpoint:
+# throughput, p50/p95/p99 latency, failures (non-200 responses and 200 responses
+# carrying an endpoint's error result), fallbacks (the mediamind_fallbacks_total
+# increase, which includes per-item fallbacks in batch endpoints), and how long the
+# event loop was blocked (a probe task measures how late its 10 ms sleeps wake up).
+#
+# Usage: python benchmark.py [--requests 300] [--concurrency 32] [--latency-ms 200] ...
+# Runs in a temporary directory, so the real .mediamind.db is never touched.
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+PROBE_INTERVAL = 0.01
+BLOCKED_THRESHOLD = 0.005  # lag above this counts as blocked time
+
+# Text that only appears in the error results endpoints return with status 200
+ERROR_MARKERS = (
+    '"translated_text":"Error:',
+    '"summary":"Summary generation failed"',
+    '"type":"Analysis Failed"',
+    "event: error",
+    '"error":',
+)
+
+WORDS = (
+    "market election climate football vaccine startup rocket budget festival storm "
+    "bank river school court museum airline harvest protest satellite concert "
+    "report update analysis growth decline record policy launch review deal"
+).split()
+
+
+def sentence(rng, n=12):
+    return " ".join(rng.choice(WORDS) for _ in range(n)).capitalize() + "."
+
+
+def document(rng, sentences):
+    return " ".join(sentence(rng) for _ in range(sentences))
+
+
+class Corpus:
+    """Request bodies; repeat_ratio of them reuse a small pool of hot inputs"""
+
+    def __init__(self, seed, repeat_ratio):
+        self.rng = random.Random(seed)
+        self.repeat_ratio = repeat_ratio
+        self.hot = [sentence(self.rng) for _ in range(20)]
+
+    def text(self, sentences=1):
+        if self.rng.random() < self.repeat_ratio:
+            return self.rng.choice(self.hot)
+        return document(self.rng, sentences)
+
+
+def scenarios(corpus):
+    """(name, method, path, body factory) for every endpoint under test"""
+    return [
+        ("sentiment", "POST", "/feature-1/sentiment", lambda: {"text": corpus.text()}),
+        ("sentiment-batch", "POST", "/feature-1/sentiment/batch", lambda: {"texts": [corpus.text() for _ in range(20)]}),
+        ("recommend", "POST", "/feature-2/recommend", lambda: {
+            "user_interests": corpus.rng.sample(["Tech", "Sports", "Business", "Science", "market", "climate"], 2),
+            "available_articles": [],
+        }),
+        ("translate", "POST", "/feature-3/translate", lambda: {"text": corpus.text(3), "target_language": "Spanish"}),
+        ("translate-stream", "POST", "/feature-3/translate/stream", lambda: {"text": corpus.text(2), "target_language": "French"}),
+        ("safety", "POST", "/feature-4/safety", lambda: {"text": corpus.text()}),
+        ("safety-batch", "POST", "/feature-4/safety/batch", lambda: {"texts": [corpus.text() for _ in range(20)]}),
+        ("insights", "POST", "/feature-5/insights", lambda: {"topic": corpus.rng.choice(WORDS)}),
+        ("trending", "GET", "/feature-5/trending", None),
+        ("summary", "POST", "/feature-6/summary", lambda: {"text": corpus.text(8)}),
+        ("summary-chunked", "POST", "/feature-6/summary", lambda: {"text": corpus.text(40), "mode": "chunked"}),
+        ("summary-stream", "POST", "/feature-6/summary/stream", lambda: {"text": corpus.text(8)}),
+        ("dashboard-stats", "GET", "/dashboard/stats", None),
+        ("dashboard-performance", "GET", "/dashboard/performance", None),
+        ("dashboard-activity", "GET", "/dashboard/activity", None),
+    ]
+
+
+class LoopProbe:
+    """Measures event-loop blocking as the lateness of short periodic sleeps"""
+
+    def __init__(self):
+        self.lags = []
+        self.task = None
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(PROBE_INTERVAL)
+            self.lags.append(max(0.0, time.perf_counter() - start - PROBE_INTERVAL))
+
+    def start(self):
+        self.lags = []
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        lags = np.array(self.lags or [0.0])
+        return {
+            "loop_blocked_ms": round(float(lags[lags > BLOCKED_THRESHOLD].sum()) * 1000, 1),
+            "loop_lag_p99_ms": round(float(np.percentile(lags, 99)) * 1000, 2),
+            "loop_lag_max_ms": round(float(lags.max()) * 1000, 2),
+        }
+
+
+def is_error_body(text):
+    compact = text.replace('": "', '":"')
+    return any(marker in compact for marker in ERROR_MARKERS)
+
+
+def fallback_total():
+    import metrics
+    return sum(metrics.fallbacks.values.values())
+
+
+async def run_scenario(client, name, method, path, body, requests, concurrency):
+    latencies = []
+    failures = 0
+    fallbacks_before = fallback_total()
+    remaining = iter(range(requests))
+    probe = LoopProbe()
+
+    async def worker():
+        nonlocal failures
+        for _ in remaining:
+            payload = body() if body else None
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=payload)
+                if response.status_code != 200 or is_error_body(response.text):
+                    failures += 1
+            except Exception as e:
+                failures += 1
+                print(f"{name} request error: {e}")
+            latencies.append(time.perf_counter() - started)
+
+    probe.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    blocking = await probe.stop()
+
+    ms = np.array(latencies) * 1000
+    return {
+        "endpoint": name,
+        "requests": len(latencies),
+        "failures": failures,
+        "fallbacks": int(fallback_total() - fallbacks_before),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(float(np.percentile(ms, 50)), 1),
+        "p95_ms": round(float(np.percentile(ms, 95)), 1),
+        "p99_ms": round(float(np.percentile(ms, 99)), 1),
+        **blocking,
+    }
+
+
+def print_table(rows):
+    columns = ["endpoint", "requests", "failures", "fallbacks", "rps", "p50_ms", "p95_ms", "p99_ms", "loop_blocked_ms", "loop_lag_p99_ms", "loop_lag_max_ms"]
+    widths = {c: max(len(c), *(len(str(r[c])) for r in rows)) for c in columns}
+    print("  ".join(c.ljust(widths[c]) for c in columns))
+    for row in rows:
+        print("  ".join(str(row[c]).ljust(widths[c]) for c in columns))
+
+
+async def main(args):
+    import httpx
+    import gemini_standin
+    import main as app_main
+
+    corpus = Corpus(args.seed, args.repeat_ratio)
+    selected = [s for s in scenarios(corpus) if not args.only or s[0] in args.only]
+    rows = []
+    transport = httpx.ASGITransport(app=app_main.app)
+    async with app_main.app.router.lifespan_context(app_main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for name, method, path, body in selected:
+                rows.append(await run_scenario(client, name, method, path, body, args.requests, args.concurrency))
+    print_table(rows)
+    print(f"Stand-in Gemini calls: {gemini_standin.calls}")
+    return rows
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test with a local Gemini stand-in")
+    parser.add_argument("--requests", type=int, default=300, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="median stand-in latency")
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.01)
+    parser.add_argument("--quota-rate", type=float, default=0.01)
+    parser.add_argument("--malformed-rate", type=float, default=0.02)
+    parser.add_argument("--repeat-ratio", type=float, default=0.2, help="share of requests reusing hot inputs")
+    parser.add_argument("--rpm", type=int, default=None, help="scheduler requests/minute (default: unlimited)")
+    parser.add_argument("--tpm", type=int, default=None, help="scheduler tokens/minute (default: unlimited)")
+    parser.add_argument("--only", nargs="*", help="endpoint names to run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--fail-p95-ms", type=float, default=None, help="exit 1 if any endpoint p95 is above this")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    # Quotas are lifted unless asked for, so the run measures the backend itself
+    os.environ["GEMINI_RPM"] = str(args.rpm or 10**9)
+    os.environ["GEMINI_TPM"] = str(args.tpm or 10**12)
+    os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+    sys.path.insert(0, BACKEND_DIR)
+
+    import gemini_standin
+    gemini_standin.install(gemini_standin.StandinConfig(
+        latency_ms=args.latency_ms,
+        latency_sigma=args.latency_sigma,
+        error_rate=args.error_rate,
+        quota_rate=args.quota_rate,
+        malformed_rate=args.malformed_rate,
+        seed=args.seed,
+    ))
+
+    output = os.path.abspath(args.json) if args.json else None
+    with tempfile.TemporaryDirectory() as workdir:
+        # The database path is relative to the working directory
+        os.chdir(workdir)
+        rows = asyncio.run(main(args))
+        os.chdir(BACKEND_DIR)
+
+    if output:
+        with open(output, "w") as f:
+            json.dump({"config": vars(args), "results": rows}, f, indent=2)
+    if args.fail_p95_ms is not None:
+        slow = [r["endpoint"] for r in rows if r["p95_ms"] > args.fail_p95_ms]
+        if slow:
+            print(f"p95 above {args.fail_p95_ms} ms: {', '.join(slow)}")
+            sys.exit(1)
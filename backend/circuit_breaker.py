@@ -0,0 +1,128 @@
+import os
+import time
+from google.api_core import exceptions as g_api_exceptions
+
+# Per-model circuit breaker in front of every Gemini call.
+# closed: calls go through. FAILURE_THRESHOLD upstream failures in a row (errors,
+# timeouts, exhausted quota) open the circuit.
+# open: calls fail at once with CircuitOpen, so routers answer from their local
+# fallbacks (marked "degraded": true) instead of waiting on a failing upstream.
+# half-open: after the open period one probe call is let through while the others keep
+# failing fast. Success closes the circuit; failure opens it again for twice as long,
+# up to MAX_OPEN_SECONDS.
+
+FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+MAX_OPEN_SECONDS = float(os.getenv("CIRCUIT_MAX_OPEN_SECONDS", "300"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Errors that say the request itself was wrong; the upstream answered, so they are not failures
+_CALLER_ERRORS = (g_api_exceptions.InvalidArgument, g_api_exceptions.NotFound, g_api_exceptions.FailedPrecondition)
+
+
+class CircuitOpen(Exception):
+    """The model's circuit is open; use the local fallback"""
+
+
+class _Circuit:
+    def __init__(self):
+        self.state = CLOSED
+        self.failures = 0  # consecutive
+        self.open_for = OPEN_SECONDS
+        self.opened_at = 0.0
+        self.probing = False
+        self.stats = {"rejected": 0, "opened": 0, "probes": 0, "closed": 0}
+
+    def open(self, now):
+        self.state = OPEN
+        self.opened_at = now
+        self.probing = False
+        self.stats["opened"] += 1
+
+
+_circuits = {}
+
+
+def _circuit(model_name):
+    circuit = _circuits.get(model_name)
+    if circuit is None:
+        circuit = _circuits[model_name] = _Circuit()
+    return circuit
+
+
+def allow(model_name):
+    """
+    Raise CircuitOpen unless a call to model_name may go out now.
+    Returns True when the call is the half-open probe; the caller must then record
+    its outcome or call release().
+    """
+    circuit = _circuit(model_name)
+    if circuit.state == CLOSED:
+        return False
+    now = time.monotonic()
+    if circuit.state == OPEN and now - circuit.opened_at >= circuit.open_for:
+        circuit.state = HALF_OPEN
+    if circuit.state == HALF_OPEN and not circuit.probing:
+        circuit.probing = True
+        circuit.stats["probes"] += 1
+        return True
+    circuit.stats["rejected"] += 1
+    remaining = max(0.0, circuit.open_for - (now - circuit.opened_at))
+    raise CircuitOpen(f"{model_name}: circuit {circuit.state}, next probe in {remaining:.1f}s")
+
+
+def is_failure(error):
+    """Whether an exception from the upstream call should count against the circuit"""
+    return not isinstance(error, _CALLER_ERRORS)
+
+
+def record_success(model_name):
+    circuit = _circuit(model_name)
+    circuit.failures = 0
+    if circuit.state != CLOSED:
+        circuit.state = CLOSED
+        circuit.probing = False
+        circuit.open_for = OPEN_SECONDS
+        circuit.stats["closed"] += 1
+
+
+def record_failure(model_name):
+    circuit = _circuit(model_name)
+    circuit.failures += 1
+    now = time.monotonic()
+    if circuit.state == HALF_OPEN:
+        # The probe failed: back off before the next one
+        circuit.open_for = min(MAX_OPEN_SECONDS, circuit.open_for * 2)
+        circuit.open(now)
+    elif circuit.state == CLOSED and circuit.failures >= FAILURE_THRESHOLD:
+        circuit.open(now)
+
+
+def release(model_name):
+    """The call ended without reaching the upstream (e.g. shed by the scheduler); free the probe slot"""
+    circuit = _circuit(model_name)
+    if circuit.state == HALF_OPEN:
+        circuit.probing = False
+
+
+def degraded(result):
+    """Mark a fallback answer that was served because the circuit is open"""
+    result["degraded"] = True
+    return result
+
+
+def stats():
+    now = time.monotonic()
+    result = {}
+    for model_name, circuit in _circuits.items():
+        result[model_name] = {
+            **circuit.stats,
+            "state": circuit.state,
+            "consecutive_failures": circuit.failures,
+            "open_for": circuit.open_for,
+            "next_probe_in": round(max(0.0, circuit.open_for - (now - circuit.opened_at)), 1) if circuit.state == OPEN else 0.0,
+        }
+    return result
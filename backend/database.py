@@ -1,4 +1,6 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime
+import os
+from sqlalchemy import create_engine, event, Column, Integer, String, DateTime, Index, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
@@ -7,7 +9,32 @@ from datetime import datetime
 # Using a hidden file to prevent Live Server from auto-reloading when the DB updates
 DATABASE_URL = "sqlite:///./.mediamind.db"
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False, "timeout": 30},
+    pool_size=int(os.getenv("DB_POOL_SIZE", "8")),
+    max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "16")),
+)
+
+# Connection tuning: WAL lets readers run while the log writer commits,
+# and synchronous=NORMAL is durable in WAL mode without an fsync per commit
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": os.getenv("SQLITE_BUSY_TIMEOUT_MS", "30000"),
+    "cache_size": str(-int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))),  # negative = KiB
+    "temp_store": "MEMORY",
+    "mmap_size": os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)),
+    "wal_autocheckpoint": "1000",
+}
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -18,8 +45,130 @@ class ActivityLog(Base):
     feature = Column(String)  # e.g., sentiment, recommend, etc.
     input_text = Column(String)
     output_result = Column(String)
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
+
+    __table_args__ = (Index("ix_logs_feature_timestamp", "feature", "timestamp"),)
+
+# Per-feature, per-hour request counts, kept in step with logs on every insert
+# so the dashboard never has to scan the logs table
+class ActivityRollup(Base):
+    __tablename__ = "activity_rollup"
+    feature = Column(String, primary_key=True)
+    hour = Column(DateTime, primary_key=True)  # timestamp truncated to the hour
+    count = Column(Integer, default=0)
+
+# Per-term, per-hour counts of logged inputs mentioning the term, kept in step with
+# logs on every insert; /feature-5/insights builds topic time series from it
+class TopicRollup(Base):
+    __tablename__ = "topic_rollup"
+    term = Column(String, primary_key=True)
+    hour = Column(DateTime, primary_key=True)  # timestamp truncated to the hour
+    count = Column(Integer, default=0)
+
+# Article catalog for recommendations
+class Article(Base):
+    __tablename__ = "articles"
+    id = Column(Integer, primary_key=True)
+    category = Column(String, index=True)
+    title = Column(String)
+    source = Column(String)
+    time = Column(String)  # display label, e.g. "2h ago"
+    image_prompt = Column(String)
+    image = Column(String)  # precomputed at import
+    published_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+# Single row; bumped on every catalog change so readers know to refresh
+class CatalogVersion(Base):
+    __tablename__ = "catalog_version"
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, default=0)
+
+# Sentence-level translation memory for /feature-3/translate
+class TranslationSegment(Base):
+    __tablename__ = "translation_memory"
+    key = Column(String, primary_key=True)  # sha256 of target language + normalized segment
+    target_language = Column(String)
+    source_text = Column(String)
+    translated_text = Column(String)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+# Resume point of a bulk NDJSON ingestion run: every line up to `line` has been emitted
+class IngestCheckpoint(Base):
+    __tablename__ = "ingest_checkpoints"
+    job_id = Column(String, primary_key=True)
+    line = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+# Background jobs submitted through /jobs; request/result are JSON encoded
+class Job(Base):
+    __tablename__ = "jobs"
+    id = Column(String, primary_key=True)
+    kind = Column(String)
+    status = Column(String, index=True)  # queued, running, succeeded, failed, cancelled
+    owner = Column(String)  # shared_state.WORKER_ID of the process running it
+    dedupe_key = Column(String, index=True)  # same key = same work; see job_queue.submit
+    request = Column(String)
+    result = Column(String)
+    error = Column(String)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime, index=True)
+
+class LLMCacheEntry(Base):
+    __tablename__ = "llm_cache"
+    key = Column(String, primary_key=True)  # sha256 of feature/model/prompt version/input
+    value = Column(String)  # JSON encoded result
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+def update_rollups(db, rows):
+    """Add a batch of ActivityLog row dicts to activity_rollup (caller commits)"""
+    counts = {}
+    for row in rows:
+        hour = row["timestamp"].replace(minute=0, second=0, microsecond=0)
+        key = (row["feature"], hour)
+        counts[key] = counts.get(key, 0) + 1
+    if not counts:
+        return
+    stmt = sqlite_insert(ActivityRollup).values(
+        [{"feature": feature, "hour": hour, "count": n} for (feature, hour), n in counts.items()]
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["feature", "hour"],
+        set_={"count": ActivityRollup.count + stmt.excluded.count},
+    )
+    db.execute(stmt)
 
 # Create Tables
 def init_db():
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        # Databases created before the indexes existed
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_logs_timestamp ON logs (timestamp)"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_logs_feature_timestamp ON logs (feature, timestamp)"))
+        # Job tables created before jobs had an owner
+        job_columns = [row[1] for row in conn.execute(text("PRAGMA table_info(jobs)"))]
+        if "owner" not in job_columns:
+            conn.execute(text("ALTER TABLE jobs ADD COLUMN owner VARCHAR"))
+        # At most one queued/running job per dedupe key, so concurrent submits of the same
+        # work cannot both insert (job_queue relies on this instead of a lock)
+        conn.execute(text(
+            "UPDATE jobs SET status = 'cancelled', error = 'Duplicate of an active job' "
+            "WHERE status IN ('queued', 'running') AND rowid NOT IN ("
+            "SELECT MAX(rowid) FROM jobs WHERE status IN ('queued', 'running') GROUP BY dedupe_key)"
+        ))
+        conn.execute(text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS ux_jobs_active_dedupe_key ON jobs (dedupe_key) "
+            "WHERE status IN ('queued', 'running')"
+        ))
+
+def backfill_rollups():
+    """One-time backfill of the rollup from existing history (a full scan of logs)"""
+    with engine.begin() as conn:
+        has_rollup = conn.execute(text("SELECT 1 FROM activity_rollup LIMIT 1")).first()
+        if not has_rollup:
+            conn.execute(text(
+                "INSERT INTO activity_rollup (feature, hour, count) "
+                "SELECT feature, strftime('%Y-%m-%d %H:00:00.000000', timestamp), COUNT(*) "
+                "FROM logs WHERE feature IS NOT NULL AND timestamp IS NOT NULL "
+                "GROUP BY feature, strftime('%Y-%m-%d %H:00:00.000000', timestamp)"
+            ))
\ No newline at end of file
@@ -0,0 +1,204 @@
+import asyncio
+import os
+import time
+import google.generativeai as genai
+from dotenv import load_dotenv
+from google.api_core import exceptions as g_api_exceptions
+import quota_scheduler
+import single_flight
+import circuit_breaker
+import metrics
+from quota_scheduler import INTERACTIVE, BATCH, QuotaExceeded
+from circuit_breaker import CircuitOpen
+
+# Shared Gemini client for every router.
+# genai is configured once here and GenerativeModel objects are reused,
+# so handlers never build a new model (or block the event loop) per request.
+# Every call first gets quota from quota_scheduler; callers pass a priority
+# (INTERACTIVE or BATCH) and optionally a deadline in seconds. Identical prompts
+# in flight at the same time share one call (single_flight). While a model's
+# circuit is open (circuit_breaker) calls fail at once with CircuitOpen.
+
+load_dotenv()
+api_key = os.getenv("GEMINI_API_KEY")
+
+if api_key:
+    genai.configure(api_key=api_key)
+
+DEFAULT_MODEL = "gemini-2.5-flash"
+
+# Upper bound on Gemini calls in flight for this worker
+MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "256"))
+
+# Output tokens budgeted per call before the real usage is known
+OUTPUT_TOKEN_ALLOWANCE = int(os.getenv("GEMINI_OUTPUT_TOKEN_ALLOWANCE", "512"))
+
+# Attempts per call when the server reports exhausted quota
+QUOTA_ATTEMPTS = 2
+
+_models = {}
+_semaphore = None
+
+
+def estimate_tokens(text):
+    """Rough token count for budgeting prompts (~4 characters per token)"""
+    return len(text) // 4 + 1
+
+
+def get_model(model_name=DEFAULT_MODEL):
+    """Return the pooled GenerativeModel for model_name"""
+    model = _models.get(model_name)
+    if model is None:
+        model = genai.GenerativeModel(model_name)
+        _models[model_name] = model
+    return model
+
+
+def _get_semaphore():
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+    return _semaphore
+
+
+def _remaining(deadline, started):
+    if deadline is None:
+        return None
+    return max(0.0, deadline - (time.monotonic() - started))
+
+
+def _usage_tokens(response):
+    usage = getattr(response, "usage_metadata", None)
+    return getattr(usage, "total_token_count", 0) or 0
+
+
+def _response_tokens(response):
+    usage = getattr(response, "usage_metadata", None)
+    count = getattr(usage, "candidates_token_count", 0) or 0
+    if not count:
+        try:
+            count = estimate_tokens(response.text)
+        except ValueError:
+            count = 0
+    return count
+
+
+async def _acquire(model_name, tokens, priority, deadline, started):
+    try:
+        await quota_scheduler.acquire(model_name, tokens, priority, _remaining(deadline, started))
+    except QuotaExceeded:
+        metrics.llm_errors.inc(model_name, "shed")
+        raise
+
+
+def _allow(model_name):
+    """True if this call is the circuit's half-open probe; raises CircuitOpen while it is open"""
+    try:
+        return circuit_breaker.allow(model_name)
+    except CircuitOpen:
+        metrics.llm_errors.inc(model_name, "circuit_open")
+        raise
+
+
+def _record_failure(model_name, call_started, error):
+    quota = isinstance(error, g_api_exceptions.ResourceExhausted)
+    metrics.llm_latency.observe(time.perf_counter() - call_started, model_name, "quota" if quota else "error")
+    metrics.llm_errors.inc(model_name, "quota" if quota else "error")
+    if circuit_breaker.is_failure(error):
+        circuit_breaker.record_failure(model_name)
+    else:
+        circuit_breaker.record_success(model_name)
+
+
+async def generate(prompt, model_name=DEFAULT_MODEL, priority=INTERACTIVE, deadline=None):
+    """
+    Run one non-blocking generate_content call through the quota scheduler.
+    Concurrent identical prompts for the same model are coalesced into one call.
+    Raises QuotaExceeded when quota cannot be had within the deadline, and
+    CircuitOpen without calling out while the model's circuit is open.
+    """
+    key = single_flight.make_key(model_name, prompt)
+    return await single_flight.run(key, lambda: _generate(prompt, model_name, priority, deadline))
+
+
+async def _generate(prompt, model_name, priority, deadline):
+    model = get_model(model_name)
+    tokens = estimate_tokens(prompt) + OUTPUT_TOKEN_ALLOWANCE
+    metrics.llm_prompt_tokens.observe(tokens - OUTPUT_TOKEN_ALLOWANCE, model_name)
+    started = time.monotonic()
+    for attempt in range(QUOTA_ATTEMPTS):
+        probe = _allow(model_name)
+        try:
+            await _acquire(model_name, tokens, priority, deadline, started)
+            call_started = time.perf_counter()
+            try:
+                async with _get_semaphore():
+                    response = await model.generate_content_async(prompt)
+            except g_api_exceptions.ResourceExhausted as e:
+                _record_failure(model_name, call_started, e)
+                quota_scheduler.throttle(model_name, e)
+                if attempt + 1 == QUOTA_ATTEMPTS:
+                    raise
+                continue
+            except Exception as e:
+                _record_failure(model_name, call_started, e)
+                raise
+            circuit_breaker.record_success(model_name)
+        finally:
+            if probe:
+                # No-op once the probe's outcome was recorded
+                circuit_breaker.release(model_name)
+        metrics.llm_latency.observe(time.perf_counter() - call_started, model_name, "ok")
+        metrics.llm_response_tokens.observe(_response_tokens(response), model_name)
+        quota_scheduler.settle(model_name, tokens, _usage_tokens(response))
+        return response
+
+
+async def generate_stream(prompt, model_name=DEFAULT_MODEL, priority=INTERACTIVE, deadline=None):
+    """Yield text pieces as Gemini streams them; holds one concurrency slot until done"""
+    model = get_model(model_name)
+    tokens = estimate_tokens(prompt) + OUTPUT_TOKEN_ALLOWANCE
+    metrics.llm_prompt_tokens.observe(tokens - OUTPUT_TOKEN_ALLOWANCE, model_name)
+    started = time.monotonic()
+    for attempt in range(QUOTA_ATTEMPTS):
+        probe = _allow(model_name)
+        sent = False
+        streamed = 0
+        try:
+            await _acquire(model_name, tokens, priority, deadline, started)
+            call_started = time.perf_counter()
+            try:
+                async with _get_semaphore():
+                    response = await model.generate_content_async(prompt, stream=True)
+                    async for chunk in response:
+                        try:
+                            text = chunk.text
+                        except ValueError:
+                            # Chunks without text parts (e.g. the final finish_reason chunk)
+                            continue
+                        if text:
+                            if not sent:
+                                metrics.llm_first_token.observe(time.perf_counter() - call_started, model_name)
+                                # The upstream is answering; later client disconnects say nothing about it
+                                circuit_breaker.record_success(model_name)
+                            sent = True
+                            streamed += len(text)
+                            yield text
+            except g_api_exceptions.ResourceExhausted as e:
+                _record_failure(model_name, call_started, e)
+                quota_scheduler.throttle(model_name, e)
+                # Once text has been sent a retry would repeat it
+                if sent or attempt + 1 == QUOTA_ATTEMPTS:
+                    raise
+                continue
+            except Exception as e:
+                _record_failure(model_name, call_started, e)
+                raise
+            circuit_breaker.record_success(model_name)
+        finally:
+            if probe:
+                circuit_breaker.release(model_name)
+        metrics.llm_latency.observe(time.perf_counter() - call_started, model_name, "ok")
+        metrics.llm_response_tokens.observe(streamed // 4 + 1, model_name)
+        quota_scheduler.settle(model_name, tokens, _usage_tokens(response))
+        return
@@ -0,0 +1,173 @@
+import asyncio
+import json
+import random
+import re
+import sys
+import types
+from dataclasses import dataclass
+from google.api_core import exceptions as g_api_exceptions
+
+# Local stand-in for google.generativeai, used by benchmark.py.
+# It reads the prompt templates used by the routers and returns well-formed answers.
+# Latency, generic errors, quota errors and malformed output are configurable,
+# so throughput can be measured without spending Gemini quota.
+
+
+@dataclass
+class StandinConfig:
+    latency_ms: float = 200.0  # median latency of one call
+    latency_sigma: float = 0.5  # lognormal spread; 0 gives a fixed latency
+    error_rate: float = 0.0  # ServiceUnavailable
+    quota_rate: float = 0.0  # ResourceExhausted
+    quota_retry_delay: float = 1.0  # retry_delay attached to quota errors (seconds)
+    malformed_rate: float = 0.0  # text that is not the requested JSON
+    stream_chunks: int = 8
+    seed: int = 0
+
+
+config = StandinConfig()
+_random = random.Random(0)
+calls = {"total": 0, "errors": 0, "quota": 0, "malformed": 0}
+
+
+class _Usage:
+    def __init__(self, prompt, text):
+        self.prompt_token_count = len(prompt) // 4 + 1
+        self.candidates_token_count = len(text) // 4 + 1
+        self.total_token_count = self.prompt_token_count + self.candidates_token_count
+
+
+class _Response:
+    def __init__(self, prompt, text):
+        self.text = text
+        self.usage_metadata = _Usage(prompt, text)
+
+
+class _Stream:
+    def __init__(self, prompt, text, chunks):
+        size = max(1, len(text) // max(1, chunks) + 1)
+        self.pieces = [text[i:i + size] for i in range(0, len(text), size)]
+        self.delay = _latency() / max(1, len(self.pieces))
+        self.usage_metadata = _Usage(prompt, text)
+
+    async def __aiter__(self):
+        for piece in self.pieces:
+            await asyncio.sleep(self.delay)
+            yield _Response("", piece)
+
+
+def _latency():
+    if config.latency_sigma <= 0:
+        return config.latency_ms / 1000
+    return _random.lognormvariate(0, config.latency_sigma) * config.latency_ms / 1000
+
+
+def _payload(prompt, marker):
+    """The JSON list the routers embed after a marker line"""
+    start = prompt.find(marker)
+    if start < 0:
+        return []
+    # Decode only the value right after the marker; later format examples also contain [...]
+    body = prompt[start + len(marker):].lstrip()
+    try:
+        items, _ = json.JSONDecoder().raw_decode(body)
+    except json.JSONDecodeError:
+        return []
+    return items if isinstance(items, list) else []
+
+
+def answer(prompt):
+    """Plausible model output for each router prompt"""
+    if "Run these analyses on the text below" in prompt:
+        result = {}
+        if '"sentiment": {' in prompt:
+            result["sentiment"] = {"sentiment": "Neutral", "confidence": "70%", "tone": "Informative"}
+        if '"safety": {' in prompt:
+            result["safety"] = {"status": "Safe", "type": "Credible News", "confidence": "90%", "issues": []}
+        if '"summary": "' in prompt:
+            result["summary"] = "The text describes recent events and their likely impact. Key figures and dates are kept."
+        return json.dumps(result)
+    if '"translations"' in prompt:
+        items = _payload(prompt, "Input Segments (JSON):")
+        return json.dumps({"translations": [{"id": item["id"], "text": f"[tr] {item['text']}"} for item in items]})
+    if "Act as a professional translator" in prompt:
+        match = re.search(r'Input Text: "(.*?)"\n', prompt, re.DOTALL)
+        return f"[tr] {match.group(1) if match else ''}"
+    if "Analyze the sentiment of each text" in prompt:
+        items = _payload(prompt, "Texts to analyze (JSON):")
+        return json.dumps([{"id": item["id"], "sentiment": "Neutral", "confidence": "70%", "tone": "Informative"} for item in items])
+    if "Analyze the sentiment" in prompt:
+        return '{"sentiment":"Neutral","confidence":"70%","tone":"Informative"}'
+    if "Analyze each of the following content items" in prompt:
+        items = _payload(prompt, "Items to analyze (JSON):")
+        return json.dumps([{"id": item["id"], "status": "Safe", "type": "Credible News", "confidence": "90%", "issues": []} for item in items])
+    if "Analyze the following content for safety" in prompt:
+        return '{"status": "Safe", "type": "Credible News", "confidence": "90%", "issues": []}'
+    if "selected_ids" in prompt:
+        ids = [int(i) for i in re.findall(r"ID (\d+):", prompt)][:3]
+        return json.dumps({"selected_ids": ids})
+    if "sentiment forecast" in prompt:
+        return "Interest is expected to stay positive."
+    if "Summarize" in prompt:
+        return "The text describes recent events and their likely impact. Key figures and dates are kept."
+    return "OK"
+
+
+def _maybe_fail():
+    calls["total"] += 1
+    roll = _random.random()
+    if roll < config.quota_rate:
+        calls["quota"] += 1
+        error = g_api_exceptions.ResourceExhausted("stand-in quota exhausted")
+        error.retry_delay = config.quota_retry_delay
+        raise error
+    if roll < config.quota_rate + config.error_rate:
+        calls["errors"] += 1
+        raise g_api_exceptions.ServiceUnavailable("stand-in unavailable")
+
+
+def _text(prompt):
+    if _random.random() < config.malformed_rate:
+        calls["malformed"] += 1
+        return "Sure! Here is my analysis: {status: maybe"
+    return answer(prompt)
+
+
+class GenerativeModel:
+    def __init__(self, model_name="gemini-2.5-flash", **kwargs):
+        self.model_name = model_name
+
+    async def generate_content_async(self, prompt, stream=False, **kwargs):
+        if stream:
+            # Time to first byte is part of the per-chunk delay
+            _maybe_fail()
+            return _Stream(prompt, _text(prompt), config.stream_chunks)
+        await asyncio.sleep(_latency())
+        _maybe_fail()
+        return _Response(prompt, _text(prompt))
+
+    def generate_content(self, prompt, **kwargs):
+        _maybe_fail()
+        return _Response(prompt, _text(prompt))
+
+
+def configure(**kwargs):
+    pass
+
+
+def install(new_config=None):
+    """Replace google.generativeai with this stand-in; call before importing the app"""
+    global config, _random
+    config = new_config or StandinConfig()
+    _random = random.Random(config.seed)
+    module = types.ModuleType("google.generativeai")
+    module.GenerativeModel = GenerativeModel
+    module.configure = configure
+    sys.modules["google.generativeai"] = module
+    import google
+    google.generativeai = module
+    if "gemini_client" in sys.modules:
+        # Already imported: point it at the stand-in and drop pooled real models
+        sys.modules["gemini_client"].genai = module
+        sys.modules["gemini_client"]._models.clear()
+    return module
@@ -0,0 +1,365 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+from database import SessionLocal, IngestCheckpoint
+
+# Bulk NDJSON ingestion.
+# Input lines ({"id": ..., "text": ...}) are read incrementally. They flow through
+# pipelined stages (sentiment -> safety -> summary) connected by bounded queues.
+# Each stage runs a few workers that take micro-batches and call the existing
+# endpoint logic. Results come back in input order, so the number of the last
+# emitted line is a safe checkpoint: a run with the same job_id skips everything
+# up to it. At most MAX_IN_FLIGHT lines are buffered at once.
+
+STAGE_NAMES = ("sentiment", "safety", "summary")
+QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "256"))
+BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "20"))
+STAGE_CONCURRENCY = int(os.getenv("INGEST_STAGE_CONCURRENCY", "4"))
+MAX_IN_FLIGHT = int(os.getenv("INGEST_MAX_IN_FLIGHT", "2000"))
+CHECKPOINT_EVERY = int(os.getenv("INGEST_CHECKPOINT_EVERY", "500"))
+READ_CHUNK_BYTES = 1 << 20
+
+_DONE = object()  # end-of-input marker passed down the queues
+
+
+def load_checkpoint(job_id):
+    db = SessionLocal()
+    try:
+        row = db.get(IngestCheckpoint, job_id)
+        return row.line if row else 0
+    finally:
+        db.close()
+
+
+def save_checkpoint(job_id, line):
+    db = SessionLocal()
+    try:
+        db.merge(IngestCheckpoint(job_id=job_id, line=line, updated_at=datetime.utcnow()))
+        db.commit()
+    finally:
+        db.close()
+
+
+async def read_lines(chunks):
+    """Split an async stream of byte chunks into text lines without buffering the whole input"""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8", errors="replace")
+    if buffer:
+        yield buffer.decode("utf-8", errors="replace")
+
+
+async def file_chunks(f):
+    """Read an open binary file in READ_CHUNK_BYTES pieces off the event loop"""
+    while True:
+        chunk = await asyncio.to_thread(f.read, READ_CHUNK_BYTES)
+        if not chunk:
+            return
+        yield chunk
+
+
+async def spool(chunks):
+    """
+    Copy an async byte stream to an anonymous temporary file and return it rewound.
+    Used for HTTP uploads: the response cannot start streaming until the request body
+    has been received, and the body should not be held in memory.
+    """
+    f = tempfile.TemporaryFile()
+    try:
+        async for chunk in chunks:
+            await asyncio.to_thread(f.write, chunk)
+        f.seek(0)
+    except BaseException:
+        f.close()
+        raise
+    return f
+
+
+def _strip_text(result):
+    return {k: v for k, v in result.items() if k != "text"}
+
+
+async def _sentiment(records):
+    from routers import f1_sentiment
+    response = await f1_sentiment.analyze_sentiment_batch({"texts": [r["text"] for r in records]})
+    results = response.get("results", [])
+    for i, record in enumerate(records):
+        record["sentiment"] = _strip_text(results[i]) if i < len(results) else {"error": "sentiment batch failed"}
+
+
+async def _safety(records):
+    from routers import f4_safety
+    response = await f4_safety.batch_verify({"texts": [r["text"] for r in records]})
+    results = response.get("results", [])
+    for i, record in enumerate(records):
+        record["safety"] = _strip_text(results[i]) if i < len(results) else {"error": "safety batch failed"}
+
+
+async def _summary(records):
+    from routers import f6_summary
+    results = await asyncio.gather(*(
+        f6_summary.summarize_text({"text": r["text"], "priority": "batch"}) for r in records
+    ))
+    for record, result in zip(records, results):
+        record["summary"] = result
+
+
+STAGES = {"sentiment": _sentiment, "safety": _safety, "summary": _summary}
+
+
+class Stage:
+    def __init__(self, name, inbox, outbox, batch_size, concurrency):
+        self.name = name
+        self.func = STAGES[name]
+        self.inbox = inbox
+        self.outbox = outbox
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.running = concurrency
+        self.stats = {"items": 0, "batches": 0, "busy_seconds": 0.0, "errors": 0}
+
+    def _take_more(self, batch):
+        while len(batch) < self.batch_size:
+            try:
+                item = self.inbox.get_nowait()
+            except asyncio.QueueEmpty:
+                return False
+            if item is _DONE:
+                return True
+            batch.append(item)
+        return False
+
+    async def worker(self):
+        done = False
+        while not done:
+            first = await self.inbox.get()
+            if first is _DONE:
+                break
+            batch = [first]
+            done = self._take_more(batch)
+            started = time.perf_counter()
+            try:
+                await self.func(batch)
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"Ingest {self.name} error: {e}")
+                for record in batch:
+                    record[self.name] = {"error": str(e)}
+            self.stats["busy_seconds"] += time.perf_counter() - started
+            self.stats["items"] += len(batch)
+            self.stats["batches"] += 1
+            for record in batch:
+                await self.outbox.put(record)
+        # Let sibling workers see the marker too; the last one passes it downstream
+        await self.inbox.put(_DONE)
+        self.running -= 1
+        if self.running == 0:
+            await self.outbox.put(_DONE)
+
+    def report(self, elapsed):
+        return {
+            "stage": self.name,
+            **self.stats,
+            "busy_seconds": round(self.stats["busy_seconds"], 3),
+            "items_per_second": round(self.stats["items"] / elapsed, 1) if elapsed > 0 else 0.0,
+        }
+
+
+class Pipeline:
+    def __init__(self, stages=STAGE_NAMES, job_id=None, batch_size=BATCH_SIZE, concurrency=STAGE_CONCURRENCY,
+                 before_checkpoint=None):
+        self.stage_names = list(stages)
+        self.job_id = job_id
+        # Called in a worker thread before each checkpoint, to make the records yielded so far durable
+        self.before_checkpoint = before_checkpoint
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+
+    def _checkpoint(self, line):
+        if self.before_checkpoint is not None:
+            self.before_checkpoint()
+        save_checkpoint(self.job_id, line)
+
+    async def run(self, lines):
+        """
+        Async generator of result records in input order, then one final
+        {"done": true, ...} record with counts and per-stage throughput.
+        """
+        started = time.perf_counter()
+        resume_from = await asyncio.to_thread(load_checkpoint, self.job_id) if self.job_id else 0
+        queues = [asyncio.Queue(maxsize=QUEUE_SIZE) for _ in range(len(self.stage_names) + 1)]
+        stages = [
+            Stage(name, queues[i], queues[i + 1], self.batch_size, self.concurrency)
+            for i, name in enumerate(self.stage_names)
+        ]
+        results = queues[-1]
+        window = asyncio.Semaphore(MAX_IN_FLIGHT)
+        counts = {"skipped": 0, "invalid": 0}
+        reader_error = []
+
+        async def reader():
+            try:
+                number = 0
+                async for line in lines:
+                    number += 1
+                    if number <= resume_from:
+                        counts["skipped"] += 1
+                        continue
+                    await window.acquire()
+                    record = {"line": number}
+                    try:
+                        if not line.strip():
+                            record["blank"] = True
+                            await results.put(record)
+                            continue
+                        item = json.loads(line)
+                        text = item.get("text") if isinstance(item, dict) else None
+                        if not isinstance(text, str):
+                            raise ValueError("expected an object with a string \"text\" field")
+                    except ValueError as e:
+                        counts["invalid"] += 1
+                        record["error"] = f"invalid line: {e}"
+                        await results.put(record)
+                        continue
+                    record["id"] = item.get("id")
+                    record["text"] = text
+                    await queues[0].put(record)
+            except Exception as e:
+                reader_error.append(e)
+            finally:
+                await queues[0].put(_DONE)
+
+        tasks = [asyncio.create_task(reader())]
+        for stage in stages:
+            tasks.extend(asyncio.create_task(stage.worker()) for _ in range(stage.concurrency))
+
+        emitted = 0
+        checkpoint = resume_from
+        pending = {}
+        next_line = resume_from + 1
+        try:
+            while True:
+                record = await results.get()
+                if record is _DONE:
+                    break
+                pending[record["line"]] = record
+                while next_line in pending:
+                    ready = pending.pop(next_line)
+                    window.release()
+                    next_line += 1
+                    if ready.pop("blank", False):
+                        continue
+                    ready.pop("text", None)
+                    emitted += 1
+                    yield ready
+                if self.job_id and next_line - 1 - checkpoint >= CHECKPOINT_EVERY:
+                    checkpoint = next_line - 1
+                    await asyncio.to_thread(self._checkpoint, checkpoint)
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        if self.job_id and next_line - 1 > checkpoint:
+            checkpoint = next_line - 1
+            await asyncio.to_thread(self._checkpoint, checkpoint)
+        if reader_error:
+            raise reader_error[0]
+
+        elapsed = time.perf_counter() - started
+        yield {
+            "done": True,
+            "job_id": self.job_id,
+            "emitted": emitted,
+            "skipped": counts["skipped"],
+            "invalid": counts["invalid"],
+            "checkpoint": next_line - 1,
+            "elapsed_seconds": round(elapsed, 3),
+            "lines_per_second": round(emitted / elapsed, 1) if elapsed > 0 else 0.0,
+            "stages": [stage.report(elapsed) for stage in stages],
+        }
+
+
+def truncate_output(path, line):
+    """Drop result records after input line `line` (written after the last checkpoint) from an output file"""
+    keep = 0
+    with open(path, "rb") as f:
+        for raw in f:
+            try:
+                record = json.loads(raw)
+            except ValueError:
+                break  # torn last write
+            if not raw.endswith(b"\n") or record.get("line", 0) > line:
+                break
+            keep += len(raw)
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+    if keep < size:
+        with open(path, "r+b") as f:
+            f.truncate(keep)
+    return size - keep
+
+
+def parse_stages(value):
+    """Comma-separated stage names in pipeline order; raises ValueError on unknown names"""
+    names = [name.strip() for name in (value or "").split(",") if name.strip()]
+    unknown = [name for name in names if name not in STAGES]
+    if unknown:
+        raise ValueError(f"unknown stages: {', '.join(unknown)}")
+    return [name for name in STAGE_NAMES if name in names]
+
+
+async def _main(args):
+    import log_writer
+    import llm_cache
+    log_writer.start()
+    llm_cache.start()
+    checkpoint = load_checkpoint(args.job_id) if args.job_id else 0
+    resuming = checkpoint > 0 and args.output and os.path.exists(args.output)
+    if resuming:
+        # Results written after the last checkpoint are produced again
+        truncate_output(args.output, checkpoint)
+    out = open(args.output, "a" if resuming else "w", encoding="utf-8") if args.output else sys.stdout
+
+    def sync_output():
+        out.flush()
+        if out is not sys.stdout:
+            os.fsync(out.fileno())
+
+    pipeline = Pipeline(parse_stages(args.stages), args.job_id, args.batch_size, args.concurrency, sync_output)
+    try:
+        with open(args.input, "rb") as f:
+            async for result in pipeline.run(read_lines(file_chunks(f))):
+                if result.get("done"):
+                    print(json.dumps(result, indent=2), file=sys.stderr)
+                else:
+                    out.write(json.dumps(result, ensure_ascii=False) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        await log_writer.stop()
+        await llm_cache.stop()
+
+
+if __name__ == "__main__":
+    # Usage: python ingest_pipeline.py posts.ndjson [-o results.ndjson] [--job-id nightly-2024-06-01]
+    parser = argparse.ArgumentParser(description="Run sentiment, safety and summary over an NDJSON file")
+    parser.add_argument("input")
+    parser.add_argument("-o", "--output", help="results file (default: stdout); appended to when resuming")
+    parser.add_argument("--job-id", help="checkpoint name; rerunning with it resumes after the last emitted line")
+    parser.add_argument("--stages", default=",".join(STAGE_NAMES))
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=STAGE_CONCURRENCY, help="workers per stage")
+    args = parser.parse_args()
+    from database import init_db, backfill_rollups
+    init_db()
+    backfill_rollups()
+    asyncio.run(_main(args))
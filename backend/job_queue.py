@@ -0,0 +1,400 @@
+import asyncio
+import hashlib
+import json
+import os
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from database import SessionLocal, Job
+import shared_state
+
+# Background jobs for long-running analyses.
+# Submitted work is stored in the jobs table and picked up by a pool of asyncio
+# workers, so the HTTP request returns at once and clients poll for the result.
+# Submitting the same work again (same kind + payload, or the same idempotency key)
+# returns the existing queued, running or finished job instead of redoing it.
+# A handler answer that is only an error or fallback result (the routes return those
+# with HTTP 200) finishes the job as failed, so submitting the same work retries it.
+# Handlers run at batch priority, so queued work waits behind live requests for quota.
+# Workers claim queued rows from the table, so with several server processes any
+# process can run any job. Running jobs record their owner; jobs of an owner that
+# stopped heartbeating (or of this process before a restart) are queued again.
+
+WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# How often idle workers look for jobs submitted to other processes
+POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", "1"))
+RESULT_TTL_SECONDS = int(os.getenv("JOB_RESULT_TTL_SECONDS", str(7 * 24 * 3600)))
+
+ACTIVE = ("queued", "running")
+FINISHED = ("succeeded", "failed", "cancelled")
+
+
+async def _sentiment(payload):
+    from routers import f1_sentiment
+    return await f1_sentiment.analyze_sentiment(payload)
+
+
+async def _sentiment_batch(payload):
+    from routers import f1_sentiment
+    return await f1_sentiment.analyze_sentiment_batch(payload)
+
+
+async def _recommend(payload):
+    from routers import f2_recommend
+    return await f2_recommend.get_recommendations(f2_recommend.RecRequest(**payload))
+
+
+async def _translate(payload):
+    from routers import f3_translate
+    return await f3_translate.translate_text(f3_translate.TranslateRequest(**payload))
+
+
+async def _safety(payload):
+    from routers import f4_safety
+    return await f4_safety.verify_content(payload)
+
+
+async def _safety_batch(payload):
+    from routers import f4_safety
+    return await f4_safety.batch_verify(payload)
+
+
+async def _insights(payload):
+    from routers import f5_insights
+    return await f5_insights.get_insights(payload)
+
+
+async def _summary(payload):
+    from routers import f6_summary
+    return await f6_summary.summarize_text(payload)
+
+
+async def _analyze(payload):
+    from routers import analyze
+    return await analyze.analyze(payload)
+
+
+HANDLERS = {
+    "sentiment": _sentiment,
+    "sentiment_batch": _sentiment_batch,
+    "recommend": _recommend,
+    "translate": _translate,
+    "safety": _safety,
+    "safety_batch": _safety_batch,
+    "insights": _insights,
+    "summary": _summary,
+    "analyze": _analyze,
+}
+
+_wake = None  # set when this process queues a job
+_loop = None
+_workers = []
+_running = {}  # job id -> asyncio.Task of the handler
+_stats = {"submitted": 0, "deduplicated": 0, "succeeded": 0, "failed": 0, "cancelled": 0}
+
+
+def dedupe_key(kind, payload, idempotency_key=None):
+    raw = f"{kind}\x1fkey\x1f{idempotency_key}" if idempotency_key else f"{kind}\x1f{json.dumps(payload, sort_keys=True)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def as_dict(job, include_result=True):
+    data = {
+        "job_id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+    if include_result and (job.status == "succeeded" or job.result):
+        # Failed jobs keep the handler's error or fallback answer, if there was one
+        data["result"] = json.loads(job.result) if job.result else None
+    if job.error:
+        data["error"] = job.error
+    return data
+
+
+def failure_reason(result):
+    """Why a handler result is an error or fallback answer rather than a real one, else None"""
+    if isinstance(result, list):
+        return next((reason for reason in map(failure_reason, result) if reason), None)
+    if not isinstance(result, dict):
+        return None
+    if "error" in result:
+        return str(result["error"])
+    if result.get("degraded"):
+        return "Gemini unavailable: degraded answer"
+    if result.get("answered_by") == "fallback":
+        return "Gemini answer unusable: fallback answer"
+    if result.get("type") == "Analysis Failed" or result.get("summary") == "Summary generation failed":
+        return "Analysis failed"
+    translated = result.get("translated_text")
+    if isinstance(translated, str) and translated.startswith("Error:"):
+        return translated
+    return next((reason for reason in map(failure_reason, result.values()) if reason), None)
+
+
+def _find(db, key):
+    return db.query(Job).filter(
+        Job.dedupe_key == key, Job.status.in_(ACTIVE + ("succeeded",))
+    ).order_by(Job.created_at.desc()).first()
+
+
+def _create(kind, payload, key):
+    """Return (job dict, created); reuses a live or successful job with the same key"""
+    db = SessionLocal()
+    try:
+        existing = _find(db, key)
+        if existing is not None:
+            return as_dict(existing, include_result=False), False
+        job = Job(
+            id=uuid.uuid4().hex,
+            kind=kind,
+            status="queued",
+            dedupe_key=key,
+            request=json.dumps(payload),
+            created_at=datetime.utcnow(),
+        )
+        db.add(job)
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another request or worker queued the same work first (unique active dedupe_key)
+            db.rollback()
+            existing = _find(db, key)
+            if existing is None:
+                raise
+            return as_dict(existing, include_result=False), False
+        return as_dict(job, include_result=False), True
+    finally:
+        db.close()
+
+
+def _get(job_id):
+    db = SessionLocal()
+    try:
+        job = db.get(Job, job_id)
+        return as_dict(job) if job else None
+    finally:
+        db.close()
+
+
+def _claim_next():
+    """Mark the oldest queued job running for this process; returns (id, kind, payload) or None"""
+    db = SessionLocal()
+    try:
+        while True:
+            job = db.query(Job).filter(Job.status == "queued").order_by(Job.created_at).first()
+            if job is None:
+                return None
+            # Conditional update: only one process wins a job
+            won = db.query(Job).filter(Job.id == job.id, Job.status == "queued").update(
+                {"status": "running", "owner": shared_state.WORKER_ID, "started_at": datetime.utcnow()},
+                synchronize_session=False,
+            )
+            db.commit()
+            if won:
+                return job.id, job.kind, json.loads(job.request)
+            db.expire_all()
+    finally:
+        db.close()
+
+
+def _finish(job_id, status, result=None, error=None):
+    db = SessionLocal()
+    try:
+        job = db.get(Job, job_id)
+        if job is None or job.status in FINISHED:
+            return
+        job.status = status
+        job.result = json.dumps(result) if result is not None else None
+        job.error = error
+        job.finished_at = datetime.utcnow()
+        db.commit()
+    finally:
+        db.close()
+
+
+def _cancel(job_id):
+    """
+    Mark a queued or running job cancelled; returns its status afterwards (None if unknown).
+    A process running it elsewhere notices on its next housekeeping pass.
+    """
+    db = SessionLocal()
+    try:
+        job = db.get(Job, job_id)
+        if job is None:
+            return None
+        if job.status in ACTIVE:
+            job.status = "cancelled"
+            job.finished_at = datetime.utcnow()
+            db.commit()
+        return job.status
+    finally:
+        db.close()
+
+
+def _recover(live_owners, local_ids):
+    """
+    Queue running jobs again when their owner is gone, or is this process but no
+    longer running them (a restart). Returns how many were requeued.
+    """
+    db = SessionLocal()
+    try:
+        requeued = 0
+        for job in db.query(Job).filter(Job.status == "running").all():
+            if job.owner not in live_owners or (job.owner == shared_state.WORKER_ID and job.id not in local_ids):
+                job.status = "queued"
+                job.owner = None
+                job.started_at = None
+                requeued += 1
+        db.commit()
+        return requeued
+    finally:
+        db.close()
+
+
+def _cancelled(job_ids):
+    """Which of these jobs were cancelled (possibly through another process)"""
+    db = SessionLocal()
+    try:
+        rows = db.query(Job.id).filter(Job.id.in_(job_ids), Job.status == "cancelled").all()
+        return [row[0] for row in rows]
+    finally:
+        db.close()
+
+
+def purge_finished():
+    """Delete finished jobs older than the result TTL"""
+    cutoff = datetime.utcnow() - timedelta(seconds=RESULT_TTL_SECONDS)
+    db = SessionLocal()
+    try:
+        deleted = db.query(Job).filter(Job.status.in_(FINISHED), Job.finished_at < cutoff).delete(synchronize_session=False)
+        db.commit()
+        return deleted
+    finally:
+        db.close()
+
+
+async def _run_job(job_id, kind, payload):
+    task = asyncio.ensure_future(HANDLERS[kind]({**payload, "priority": "batch"}))
+    _running[job_id] = task
+    try:
+        result = await task
+        reason = failure_reason(result)
+        if reason:
+            await asyncio.to_thread(_finish, job_id, "failed", result, reason)
+            _stats["failed"] += 1
+        else:
+            await asyncio.to_thread(_finish, job_id, "succeeded", result)
+            _stats["succeeded"] += 1
+    except asyncio.CancelledError:
+        if not task.cancelled():
+            # The worker itself is shutting down: leave the job for recovery
+            task.cancel()
+            raise
+        await asyncio.to_thread(_finish, job_id, "cancelled")
+        _stats["cancelled"] += 1
+    except Exception as e:
+        print(f"Job {job_id} ({kind}) error: {e}")
+        await asyncio.to_thread(_finish, job_id, "failed", None, str(e))
+        _stats["failed"] += 1
+    finally:
+        _running.pop(job_id, None)
+
+
+async def _worker():
+    while True:
+        try:
+            claimed = await asyncio.to_thread(_claim_next)
+            if claimed is None:
+                _wake.clear()
+                try:
+                    await asyncio.wait_for(_wake.wait(), POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await _run_job(*claimed)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Job worker error: {e}")
+            await asyncio.sleep(POLL_INTERVAL)
+
+
+async def _housekeeping():
+    """Take over jobs of stopped processes and stop jobs cancelled from another process"""
+    while True:
+        await asyncio.sleep(shared_state.HEARTBEAT_SECONDS)
+        try:
+            if await asyncio.to_thread(_recover, await asyncio.to_thread(shared_state.live_workers), set(_running)):
+                _wake.set()
+            for job_id in await asyncio.to_thread(_cancelled, list(_running)) if _running else []:
+                task = _running.get(job_id)
+                if task is not None:
+                    task.cancel()
+        except Exception as e:
+            print(f"Job housekeeping error: {e}")
+
+
+async def start():
+    """Start the worker pool on the running loop and requeue interrupted jobs"""
+    global _wake, _loop, _workers
+    loop = asyncio.get_running_loop()
+    if _loop is loop and _workers:
+        return
+    _loop = loop
+    _wake = asyncio.Event()
+    await asyncio.to_thread(_recover, await asyncio.to_thread(shared_state.live_workers), set())
+    _workers = [loop.create_task(_worker()) for _ in range(max(1, WORKERS))]
+    if shared_state.ENABLED:
+        _workers.append(loop.create_task(_housekeeping()))
+
+
+async def stop():
+    """Stop the workers; jobs still running are picked up again on the next start"""
+    global _workers
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers = []
+
+
+async def submit(kind, payload, idempotency_key=None):
+    """Queue a job, or return the existing job for the same work"""
+    if kind not in HANDLERS:
+        raise ValueError(f"unknown job kind: {kind}")
+    # Two identical submissions racing past the lookup are settled by the unique index
+    job, created = await asyncio.to_thread(_create, kind, payload, dedupe_key(kind, payload, idempotency_key))
+    if created:
+        _stats["submitted"] += 1
+        if _wake is not None:
+            _wake.set()
+    else:
+        _stats["deduplicated"] += 1
+    job["deduplicated"] = not created
+    return job
+
+
+async def get(job_id):
+    return await asyncio.to_thread(_get, job_id)
+
+
+async def cancel(job_id):
+    """Cancel a queued or running job; finished jobs are left as they are"""
+    task = _running.get(job_id)
+    if task is not None:
+        task.cancel()
+        await asyncio.to_thread(_finish, job_id, "cancelled")
+    else:
+        await asyncio.to_thread(_cancel, job_id)
+    return await get(job_id)
+
+
+def stats():
+    return {
+        **_stats,
+        "workers": WORKERS if _workers else 0,
+        "running": len(_running),
+    }
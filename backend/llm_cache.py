@@ -0,0 +1,203 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from database import SessionLocal, LLMCacheEntry
+
+# Content-addressed cache for LLM results.
+# Tier 1: in-memory LRU (size bounded). Tier 2: llm_cache table in .mediamind.db (TTL).
+# Results are keyed on (feature, model, prompt version, normalized input),
+# so changing a prompt template only needs a version bump to invalidate old entries.
+# The memory tier is used on the event loop; disk reads run in a worker thread and disk
+# writes are write-behind: a background task upserts them in batches, like log_writer.
+
+MEMORY_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000"))
+TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+WRITE_BATCH_SIZE = int(os.getenv("LLM_CACHE_WRITE_BATCH_SIZE", "200"))
+WRITE_FLUSH_INTERVAL = float(os.getenv("LLM_CACHE_WRITE_FLUSH_INTERVAL", "0.5"))
+WRITE_QUEUE_MAX_SIZE = int(os.getenv("LLM_CACHE_WRITE_QUEUE_MAX_SIZE", "10000"))
+
+_memory = OrderedDict()  # key -> (expires_at, json string)
+_pending = {}  # key -> (json string, created_at) queued for disk but not yet written
+_queue = None
+_task = None
+_loop = None
+_stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0,
+          "disk_writes": 0, "disk_batches": 0, "disk_errors": 0}
+
+
+def normalize(text):
+    """Collapse whitespace and unicode variants so trivially different inputs share a key"""
+    return " ".join(unicodedata.normalize("NFC", text or "").split())
+
+
+def make_key(feature, model_name, prompt_version, *parts):
+    raw = "\x1f".join([feature, model_name, prompt_version] + [normalize(p) for p in parts])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _remember(key, value_json, expires_at):
+    _memory[key] = (expires_at, value_json)
+    _memory.move_to_end(key)
+    while len(_memory) > MEMORY_MAX_ENTRIES:
+        _memory.popitem(last=False)
+        _stats["evictions"] += 1
+
+
+def _read_disk(key):
+    """Look key up in the llm_cache table (runs in a worker thread); returns (json, age) or None"""
+    db = SessionLocal()
+    try:
+        row = db.get(LLMCacheEntry, key)
+        if row is None:
+            return None
+        age = (datetime.utcnow() - row.created_at).total_seconds()
+        if age < TTL_SECONDS:
+            return row.value, age
+        db.delete(row)
+        db.commit()
+        return None
+    finally:
+        db.close()
+
+
+async def get(key):
+    """Return a fresh copy of the cached result for key, or None on a miss"""
+    entry = _memory.get(key)
+    if entry is not None:
+        expires_at, value_json = entry
+        if expires_at > time.time():
+            _memory.move_to_end(key)
+            _stats["memory_hits"] += 1
+            return json.loads(value_json)
+        del _memory[key]
+
+    pending = _pending.get(key)
+    if pending is not None:
+        # Evicted from memory before its disk write landed
+        value_json, created_at = pending
+        _remember(key, value_json, time.time() + TTL_SECONDS - (datetime.utcnow() - created_at).total_seconds())
+        _stats["memory_hits"] += 1
+        return json.loads(value_json)
+
+    try:
+        found = await asyncio.to_thread(_read_disk, key)
+        if found is not None:
+            value_json, age = found
+            _remember(key, value_json, time.time() + TTL_SECONDS - age)
+            _stats["disk_hits"] += 1
+            return json.loads(value_json)
+    except Exception as e:
+        print(f"Cache read error: {e}")
+
+    _stats["misses"] += 1
+    return None
+
+
+def _write_batch(entries):
+    """Upsert (key, json, created_at) entries in one transaction (runs in a worker thread)"""
+    db = SessionLocal()
+    try:
+        for key, value_json, created_at in entries:
+            db.merge(LLMCacheEntry(key=key, value=value_json, created_at=created_at))
+        db.commit()
+    finally:
+        db.close()
+
+
+async def _flush(keys):
+    entries = [(key, *_pending[key]) for key in keys if key in _pending]
+    try:
+        if entries:
+            await asyncio.to_thread(_write_batch, entries)
+            _stats["disk_writes"] += len(entries)
+            _stats["disk_batches"] += 1
+    except Exception as e:
+        _stats["disk_errors"] += 1
+        print(f"Cache write error ({len(entries)} entries dropped): {e}")
+    for key, value_json, created_at in entries:
+        # A newer put of the same key stays pending for its own flush
+        if _pending.get(key) == (value_json, created_at):
+            del _pending[key]
+
+
+async def _run():
+    while True:
+        keys = [await _queue.get()]
+        deadline = time.monotonic() + WRITE_FLUSH_INTERVAL
+        while len(keys) < WRITE_BATCH_SIZE:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                keys.append(await asyncio.wait_for(_queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        await _flush(dict.fromkeys(keys))
+        for _ in keys:
+            _queue.task_done()
+
+
+def start():
+    """Start the background disk writer on the running event loop"""
+    global _queue, _task, _loop
+    loop = asyncio.get_running_loop()
+    if _loop is not loop:
+        # New event loop (e.g. app restarted in-process): the old queue is unusable
+        _loop = loop
+        _queue = asyncio.Queue(maxsize=WRITE_QUEUE_MAX_SIZE)
+        _task = None
+    if _task is None or _task.done():
+        _task = loop.create_task(_run())
+
+
+async def stop():
+    """Write everything still queued to disk, then stop the writer"""
+    global _task
+    if _task is None:
+        return
+    await _queue.join()
+    _task.cancel()
+    try:
+        await _task
+    except asyncio.CancelledError:
+        pass
+    _task = None
+
+
+async def put(key, value):
+    """Store value in memory now and queue it for disk; waits only if the write queue is full"""
+    value_json = json.dumps(value)
+    _remember(key, value_json, time.time() + TTL_SECONDS)
+    _stats["writes"] += 1
+    start()
+    _pending[key] = (value_json, datetime.utcnow())
+    await _queue.put(key)
+
+
+def purge_expired():
+    """Delete disk entries older than the TTL"""
+    cutoff = datetime.utcnow() - timedelta(seconds=TTL_SECONDS)
+    db = SessionLocal()
+    deleted = db.query(LLMCacheEntry).filter(LLMCacheEntry.created_at < cutoff).delete()
+    db.commit()
+    db.close()
+    return deleted
+
+
+def stats():
+    hits = _stats["memory_hits"] + _stats["disk_hits"]
+    lookups = hits + _stats["misses"]
+    return {
+        **_stats,
+        "hits": hits,
+        "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        "memory_entries": len(_memory),
+        "memory_max_entries": MEMORY_MAX_ENTRIES,
+        "disk_queued": len(_pending),
+        "ttl_seconds": TTL_SECONDS,
+    }
@@ -0,0 +1,134 @@
+import os
+import re
+import numpy as np
+
+# Local lexicon sentiment model.
+# Weighted word lexicon with negation and intensifier handling, scored for a
+# whole batch at once with NumPy. Used as a fast path ahead of Gemini: only
+# texts it is unsure about are sent to the LLM.
+
+# Minimum local confidence (0-1) needed to answer without calling Gemini
+CONFIDENCE_THRESHOLD = float(os.getenv("SENTIMENT_LOCAL_THRESHOLD", "0.85"))
+
+LEXICON = {
+    # Positive
+    "love": 3.0, "loved": 3.0, "loving": 2.5, "adore": 3.0, "amazing": 3.0, "awesome": 3.0,
+    "excellent": 3.0, "fantastic": 3.0, "wonderful": 3.0, "outstanding": 3.0, "brilliant": 3.0,
+    "perfect": 3.0, "superb": 3.0, "incredible": 2.5, "great": 2.5, "best": 2.5, "beautiful": 2.5,
+    "delighted": 2.5, "thrilled": 2.5, "happy": 2.0, "glad": 2.0, "enjoy": 2.0, "enjoyed": 2.0,
+    "impressive": 2.0, "recommend": 2.0, "recommended": 2.0, "pleased": 2.0, "exciting": 2.0,
+    "excited": 2.0, "good": 1.5, "nice": 1.5, "like": 1.0, "liked": 1.5, "helpful": 1.5,
+    "fun": 1.5, "win": 1.5, "wins": 1.5, "success": 1.5, "successful": 1.5, "thanks": 1.5,
+    "thank": 1.5, "cool": 1.0, "fine": 0.5, "ok": 0.3, "okay": 0.3, "better": 1.0,
+    "improved": 1.5, "smooth": 1.0, "fast": 1.0, "reliable": 1.5, "favorite": 2.0,
+    # Negative
+    "hate": -3.0, "hated": -3.0, "terrible": -3.0, "awful": -3.0, "horrible": -3.0,
+    "worst": -3.0, "disgusting": -3.0, "atrocious": -3.0, "pathetic": -2.5, "useless": -2.5,
+    "garbage": -2.5, "trash": -2.5, "scam": -2.5, "furious": -2.5, "angry": -2.0,
+    "disappointed": -2.0, "disappointing": -2.0, "annoying": -2.0, "annoyed": -2.0,
+    "sad": -2.0, "broken": -2.0, "fail": -2.0, "failed": -2.0, "failure": -2.0, "poor": -2.0,
+    "bad": -2.0, "ugly": -2.0, "hurt": -1.5, "wrong": -1.5, "problem": -1.0, "problems": -1.0,
+    "issue": -0.8, "issues": -0.8, "slow": -1.0, "boring": -1.5, "waste": -2.0,
+    "crash": -1.5, "crashes": -1.5, "bug": -1.0, "bugs": -1.0, "lose": -1.5, "lost": -1.5,
+    "worse": -1.5, "unfortunately": -1.0, "sucks": -2.5, "refund": -1.0,
+}
+
+NEGATORS = {
+    "not", "no", "never", "none", "nobody", "nothing", "neither", "nor", "without", "hardly",
+    "isn't", "wasn't", "aren't", "weren't", "don't", "doesn't", "didn't", "can't", "cannot",
+    "couldn't", "won't", "wouldn't", "shouldn't", "ain't", "isnt", "dont", "doesnt", "didnt", "cant",
+}
+
+INTENSIFIERS = {
+    "very": 1.5, "really": 1.4, "extremely": 1.8, "so": 1.3, "super": 1.5, "absolutely": 1.6,
+    "totally": 1.4, "incredibly": 1.7, "truly": 1.3, "highly": 1.4, "most": 1.3,
+    "slightly": 0.6, "somewhat": 0.7, "barely": 0.5, "kinda": 0.7,
+}
+
+# Contrast words mean the overall sentiment depends on clause structure: leave those to the LLM
+CONTRASTS = {"but", "however", "although", "though", "yet", "except"}
+
+NEGATION_WINDOW = 3  # a negator flips the next N tokens
+NORMALIZE_ALPHA = 15.0  # compound = s / sqrt(s^2 + alpha), as in VADER
+
+_TOKEN_RE = re.compile(r"[a-z']+")
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(text.lower())
+
+
+def score_batch(texts):
+    """
+    Score texts in one vectorized pass.
+    Returns a list of dicts: sentiment, tone, confidence (0-1), compound (-1..1).
+    """
+    if not texts:
+        return []
+    token_lists = [tokenize(t) for t in texts]
+    lengths = np.array([len(tokens) for tokens in token_lists], dtype=np.int64)
+    tokens = [tok for tokens in token_lists for tok in tokens]
+    n_docs = len(texts)
+
+    if not tokens:
+        return [_label(0.0, 0.0, 0, False) for _ in texts]
+
+    doc_ids = np.repeat(np.arange(n_docs), lengths)
+    doc_start = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    positions = np.arange(len(tokens))
+
+    weights = np.array([LEXICON.get(tok, 0.0) for tok in tokens])
+    is_negator = np.array([tok in NEGATORS for tok in tokens], dtype=np.int64)
+    intensity = np.array([INTENSIFIERS.get(tok, 1.0) for tok in tokens])
+    is_contrast = np.array([tok in CONTRASTS for tok in tokens], dtype=np.float64)
+
+    # Negators in the previous NEGATION_WINDOW tokens of the same document (parity flips the sign)
+    negators_before = np.concatenate(([0], np.cumsum(is_negator)))
+    window_start = np.maximum(positions - NEGATION_WINDOW, doc_start)
+    negations = negators_before[positions] - negators_before[window_start]
+    weights = np.where(negations % 2 == 1, -0.75 * weights, weights)
+
+    # Intensifier directly before a sentiment word in the same document
+    previous_intensity = np.concatenate(([1.0], intensity[:-1]))
+    previous_intensity = np.where(positions > doc_start, previous_intensity, 1.0)
+    weights = weights * previous_intensity
+
+    totals = np.bincount(doc_ids, weights=weights, minlength=n_docs)
+    magnitudes = np.bincount(doc_ids, weights=np.abs(weights), minlength=n_docs)
+    hits = np.bincount(doc_ids, weights=(weights != 0).astype(np.float64), minlength=n_docs)
+    contrasts = np.bincount(doc_ids, weights=is_contrast, minlength=n_docs)
+
+    compound = totals / np.sqrt(totals * totals + NORMALIZE_ALPHA)
+    # Agreement is 1 when every sentiment word points the same way
+    agreement = np.divide(np.abs(totals), magnitudes, out=np.zeros(n_docs), where=magnitudes > 0)
+    confidence = np.abs(compound) * agreement
+
+    return [
+        _label(float(compound[i]), float(confidence[i]), int(hits[i]), bool(contrasts[i]))
+        for i in range(n_docs)
+    ]
+
+
+def _label(compound, confidence, hits, has_contrast):
+    if hits == 0 or has_contrast:
+        confidence = 0.0
+    if compound >= 0.05:
+        sentiment, tone = "Positive", "Enthusiastic"
+    elif compound <= -0.05:
+        sentiment, tone = "Negative", "Frustrated"
+    else:
+        sentiment, tone = "Neutral", "Informative"
+    return {"sentiment": sentiment, "tone": tone, "confidence": confidence, "compound": compound}
+
+
+def classify(text):
+    return score_batch([text])[0]
+
+
+def as_response(score):
+    """Convert a local score into the /feature-1/sentiment response shape"""
+    return {
+        "sentiment": score["sentiment"],
+        "confidence": f"{int(round(score['confidence'] * 100))}%",
+        "tone": score["tone"],
+    }
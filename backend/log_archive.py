@@ -0,0 +1,167 @@
+import asyncio
+import gzip
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from database import SessionLocal, ActivityLog, engine
+import llm_cache
+import job_queue
+import shared_state
+
+# Retention for the logs table.
+# Rows older than LOG_RETENTION_DAYS are appended to gzip NDJSON files, one per day
+# (.log_archive/logs-YYYY-MM-DD.ndjson.gz), and deleted from the hot table in batches.
+# Dashboard and trend counts come from the rollup tables, so they keep full history.
+# Archiving is at-least-once: a crash between the file write and the delete can
+# repeat a batch in the archive, but never loses rows.
+
+RETENTION_DAYS = int(os.getenv("LOG_RETENTION_DAYS", "30"))  # 0 disables archiving
+ARCHIVE_DIR = os.getenv("LOG_ARCHIVE_DIR", "./.log_archive")  # hidden, like the DB file
+BATCH_SIZE = int(os.getenv("LOG_ARCHIVE_BATCH_SIZE", "5000"))
+MAINTENANCE_INTERVAL = float(os.getenv("LOG_MAINTENANCE_INTERVAL_SECONDS", str(6 * 3600)))
+# VACUUM once this share of the database file is free pages
+VACUUM_FREE_RATIO = float(os.getenv("SQLITE_VACUUM_FREE_RATIO", "0.25"))
+
+_task = None
+_stats = {"archived": 0, "runs": 0, "vacuums": 0, "last_run": None, "errors": 0}
+
+
+def archive_path(day):
+    return os.path.join(ARCHIVE_DIR, f"logs-{day}.ndjson.gz")
+
+
+def _append(day, rows):
+    # Each append adds a gzip member; gzip.open reads the members back as one stream
+    with gzip.open(archive_path(day), "at", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def archive_old_logs(retention_days=None, now=None):
+    """Move logs older than the retention window into the daily archives; returns rows moved"""
+    retention_days = RETENTION_DAYS if retention_days is None else retention_days
+    if retention_days <= 0:
+        return 0
+    cutoff = (now or datetime.utcnow()) - timedelta(days=retention_days)
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+
+    moved = 0
+    db = SessionLocal()
+    try:
+        while True:
+            batch = db.query(ActivityLog).filter(ActivityLog.timestamp < cutoff).order_by(ActivityLog.id).limit(BATCH_SIZE).all()
+            if not batch:
+                break
+            by_day = {}
+            for row in batch:
+                by_day.setdefault(row.timestamp.strftime("%Y-%m-%d"), []).append({
+                    "id": row.id,
+                    "feature": row.feature,
+                    "input_text": row.input_text,
+                    "output_result": row.output_result,
+                    "timestamp": row.timestamp.isoformat(),
+                })
+            for day, rows in by_day.items():
+                _append(day, rows)
+            db.query(ActivityLog).filter(ActivityLog.id.in_([row.id for row in batch])).delete(synchronize_session=False)
+            db.commit()
+            moved += len(batch)
+    finally:
+        db.close()
+    _stats["archived"] += moved
+    return moved
+
+
+def read_archive(day):
+    """Yield the archived rows of one day"""
+    path = archive_path(day)
+    if not os.path.exists(path):
+        return
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def compact(full=False):
+    """Checkpoint the WAL, refresh planner stats, and VACUUM when enough pages are free"""
+    with engine.connect() as conn:
+        conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.exec_driver_sql("PRAGMA optimize")
+        page_count = conn.exec_driver_sql("PRAGMA page_count").scalar() or 0
+        free_pages = conn.exec_driver_sql("PRAGMA freelist_count").scalar() or 0
+    vacuumed = False
+    if full or (page_count and free_pages / page_count >= VACUUM_FREE_RATIO):
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("VACUUM"))
+            conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+        vacuumed = True
+        _stats["vacuums"] += 1
+    return {"page_count": page_count, "free_pages": free_pages, "vacuumed": vacuumed}
+
+
+def run_maintenance(full_vacuum=False):
+    """Archive old logs, drop expired cache entries and job results, then compact the database"""
+    result = {
+        "archived": archive_old_logs(),
+        "cache_purged": llm_cache.purge_expired(),
+        "jobs_purged": job_queue.purge_finished(),
+    }
+    result.update(compact(full=full_vacuum))
+    _stats["runs"] += 1
+    _stats["last_run"] = datetime.utcnow().isoformat()
+    return result
+
+
+async def _run():
+    while True:
+        try:
+            # With several server processes only one of them runs each round
+            if await asyncio.to_thread(shared_state.claim, "log-maintenance", MAINTENANCE_INTERVAL):
+                result = await asyncio.to_thread(run_maintenance)
+                if result["archived"] or result["vacuumed"]:
+                    print(f"Log maintenance: {result}")
+        except Exception as e:
+            _stats["errors"] += 1
+            print(f"Log maintenance error: {e}")
+        await asyncio.sleep(MAINTENANCE_INTERVAL)
+
+
+def start():
+    """Run maintenance now and then every MAINTENANCE_INTERVAL seconds"""
+    global _task
+    if MAINTENANCE_INTERVAL > 0 and (_task is None or _task.done()):
+        _task = asyncio.get_running_loop().create_task(_run())
+
+
+async def stop():
+    global _task
+    if _task is None:
+        return
+    _task.cancel()
+    try:
+        await _task
+    except asyncio.CancelledError:
+        pass
+    _task = None
+
+
+def stats():
+    return {**_stats, "retention_days": RETENTION_DAYS, "archive_dir": ARCHIVE_DIR}
+
+
+if __name__ == "__main__":
+    # Usage: python log_archive.py archive|compact|vacuum
+    if len(sys.argv) != 2 or sys.argv[1] not in ("archive", "compact", "vacuum"):
+        print("Usage: python log_archive.py archive|compact|vacuum")
+        sys.exit(1)
+    from database import init_db, backfill_rollups
+    init_db()
+    backfill_rollups()
+    if sys.argv[1] == "archive":
+        print(f"Archived {archive_old_logs()} rows to {ARCHIVE_DIR}")
+    else:
+        print(compact(full=sys.argv[1] == "vacuum"))
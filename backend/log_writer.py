@@ -0,0 +1,129 @@
+import asyncio
+import os
+import time
+from datetime import datetime
+from database import SessionLocal, ActivityLog, update_rollups
+import topic_trends
+import metrics
+
+# Batched ActivityLog writer.
+# Routers only enqueue rows; one background task drains the queue and
+# bulk-inserts them in a single transaction per batch (flush on size or interval).
+# Rows queued together by log_activities always land in the same transaction.
+# A bounded queue gives backpressure: when the DB falls behind, log_activity waits.
+
+BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "500"))
+FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "0.5"))
+QUEUE_MAX_SIZE = int(os.getenv("LOG_QUEUE_MAX_SIZE", "10000"))
+# Hard cap on stored input/output text so one oversized row cannot bloat the table
+TEXT_MAX_CHARS = int(os.getenv("LOG_TEXT_MAX_CHARS", "1024"))
+
+_queue = None
+_task = None
+_loop = None
+_stats = {"enqueued": 0, "written": 0, "batches": 0, "errors": 0}
+
+
+def _write_batch(rows):
+    """
+    Insert rows and their rollup counts in one transaction (runs in a worker thread).
+    Returns the transaction time in seconds.
+    """
+    started = time.perf_counter()
+    db = SessionLocal()
+    try:
+        db.bulk_insert_mappings(ActivityLog, rows)
+        update_rollups(db, rows)
+        topic_trends.update_rollups(db, rows)
+        db.commit()
+    finally:
+        db.close()
+    return time.perf_counter() - started
+
+
+async def _flush(rows):
+    try:
+        elapsed = await asyncio.to_thread(_write_batch, rows)
+        metrics.db_write_latency.observe(elapsed, "logs")
+        metrics.db_write_rows.observe(len(rows), "logs")
+        _stats["written"] += len(rows)
+        _stats["batches"] += 1
+    except Exception as e:
+        _stats["errors"] += 1
+        print(f"Log writer error ({len(rows)} rows dropped): {e}")
+
+
+async def _run():
+    # Queue items are lists of rows that must be written together
+    while True:
+        groups = [await _queue.get()]
+        rows = list(groups[0])
+        deadline = time.monotonic() + FLUSH_INTERVAL
+        while len(rows) < BATCH_SIZE:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                group = await asyncio.wait_for(_queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            groups.append(group)
+            rows.extend(group)
+        await _flush(rows)
+        for _ in groups:
+            _queue.task_done()
+
+
+def start():
+    """Start the background writer on the running event loop"""
+    global _queue, _task, _loop
+    loop = asyncio.get_running_loop()
+    if _loop is not loop:
+        # New event loop (e.g. app restarted in-process): the old queue is unusable
+        _loop = loop
+        _queue = asyncio.Queue(maxsize=QUEUE_MAX_SIZE)
+        _task = None
+    if _task is None or _task.done():
+        _task = loop.create_task(_run())
+
+
+async def stop():
+    """Flush everything still queued, then stop the writer"""
+    global _task
+    if _task is None:
+        return
+    await _queue.join()
+    _task.cancel()
+    try:
+        await _task
+    except asyncio.CancelledError:
+        pass
+    _task = None
+
+
+def _row(feature, input_text, output_result, timestamp):
+    return {
+        "feature": feature,
+        "input_text": input_text[:TEXT_MAX_CHARS] if input_text else input_text,
+        "output_result": output_result[:TEXT_MAX_CHARS] if output_result else output_result,
+        "timestamp": timestamp,
+    }
+
+
+async def log_activity(feature, input_text, output_result):
+    """Queue one ActivityLog row; waits only if the queue is full"""
+    await log_activities([(feature, input_text, output_result)])
+
+
+async def log_activities(entries):
+    """Queue several (feature, input_text, output_result) rows to be committed in one transaction"""
+    if not entries:
+        return
+    start()
+    now = datetime.utcnow()
+    await _queue.put([_row(feature, input_text, output_result, now) for feature, input_text, output_result in entries])
+    _stats["enqueued"] += len(entries)
+
+
+def stats():
+    return {**_stats, "queued": _queue.qsize() if _queue is not None else 0}
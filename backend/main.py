@@ -1,15 +1,55 @@
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 # Import all routers
-from routers import f1_sentiment, f2_recommend, f3_translate, f4_safety, f5_insights, f6_summary
+from routers import f1_sentiment, f2_recommend, f3_translate, f4_safety, f5_insights, f6_summary, ingest, jobs, analyze
 import uvicorn
-from database import SessionLocal, init_db
+import asyncio
+from database import SessionLocal, init_db, backfill_rollups
+import llm_cache
+import quota_scheduler
+import single_flight
 from datetime import datetime, timedelta
-
-app = FastAPI()
-
-# Initialize database
-init_db()
+from sqlalchemy import func
+from contextlib import asynccontextmanager
+import log_writer
+import log_archive
+import job_queue
+import shared_state
+import circuit_breaker
+import metrics
+import article_catalog
+import topic_trends
+
+def backfill():
+    """One-time rollup backfills; later workers wait for the first one, then find nothing to do"""
+    with shared_state.task_lock("backfill"):
+        backfill_rollups()
+        topic_trends.ensure_backfilled()
+
+@asynccontextmanager
+async def lifespan(app):
+    # Before this worker serves (and logs) anything, so no new rows are counted twice
+    await asyncio.to_thread(backfill)
+    await shared_state.start()
+    log_writer.start()
+    llm_cache.start()
+    log_archive.start()
+    await job_queue.start()
+    yield
+    await job_queue.stop()
+    await log_archive.stop()
+    # Flush queued activity logs and cache writes before the process exits
+    await log_writer.stop()
+    await llm_cache.stop()
+    await shared_state.stop()
+
+app = FastAPI(lifespan=lifespan)
+
+# Initialize database (one worker process at a time in multi-worker mode)
+with shared_state.task_lock("init"):
+    init_db()
+    article_catalog.ensure_seeded()
 
 # IMPORTANT: CORS SETUP (For UI)
 app.add_middleware(
@@ -19,6 +59,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Outermost, so route latency includes every other middleware
+app.add_middleware(metrics.MetricsMiddleware)
 
 # Connect Routers
 app.include_router(f1_sentiment.router)
@@ -27,38 +69,71 @@ app.include_router(f3_translate.router)
 app.include_router(f4_safety.router)
 app.include_router(f5_insights.router)
 app.include_router(f6_summary.router)
+app.include_router(ingest.router)
+app.include_router(jobs.router)
+app.include_router(analyze.router)
 
 @app.get("/")
 def home():
     return {"status": "MediaMind Backend Running"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Prometheus text format: latency/size histograms and fallback counters"""
+    # Only the shared-store read leaves the loop; the values are rendered where they are written
+    others = await asyncio.to_thread(metrics.other_workers)
+    return PlainTextResponse(metrics.render(others), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/stats")
+def cache_stats():
+    """LLM response cache hit/miss counters"""
+    return llm_cache.stats()
+
+@app.get("/scheduler/stats")
+async def scheduler_stats():
+    """Per-model Gemini quota usage, queue depth and shed counts"""
+    return quota_scheduler.stats()
+
+@app.get("/coalescing/stats")
+def coalescing_stats():
+    """In-flight deduplication counters; coalesced = upstream Gemini calls saved"""
+    return single_flight.stats()
+
+@app.get("/storage/stats")
+def storage_stats():
+    """Log retention/archival and compaction counters"""
+    return log_archive.stats()
+
+@app.get("/workers/stats")
+def worker_stats():
+    """Multi-worker mode: this process's id, live workers and shared-store activity"""
+    return shared_state.stats()
+
+@app.get("/circuit/stats")
+def circuit_stats():
+    """Per-model circuit breaker state; while a circuit is open, answers are marked degraded"""
+    return circuit_breaker.stats()
+
 # Dashboard Endpoints
+def feature_counts(db, since=None):
+    """Per-feature request counts from the hourly rollup in a single GROUP BY"""
+    from database import ActivityRollup
+    query = db.query(ActivityRollup.feature, func.sum(ActivityRollup.count))
+    if since is not None:
+        query = query.filter(ActivityRollup.hour >= since.replace(minute=0, second=0, microsecond=0))
+    return {feature: int(total or 0) for feature, total in query.group_by(ActivityRollup.feature).all()}
+
 @app.get("/dashboard/stats")
 def dashboard_stats():
     """Fetch dashboard statistics from database"""
     try:
         db = SessionLocal()
-        from database import ActivityLog
-        
-        # Get total activity count
-        total_logs = db.query(ActivityLog).count()
-        
-        # Get sentiment-related logs
-        sentiment_logs = db.query(ActivityLog).filter(ActivityLog.feature == "sentiment").count()
-        
-        # Get translation logs
-        translation_logs = db.query(ActivityLog).filter(ActivityLog.feature == "translate").count()
-        
-        # Get safety logs
-        safety_logs = db.query(ActivityLog).filter(ActivityLog.feature == "safety").count()
-        
-        # Get insights logs
-        insights_logs = db.query(ActivityLog).filter(ActivityLog.feature == "insights").count()
-        
-        # Get summary logs
-        summary_logs = db.query(ActivityLog).filter(ActivityLog.feature == "summary").count()
-        
+        counts = feature_counts(db)
         db.close()
+
+        sentiment_logs = counts.get("sentiment", 0)
+        translation_logs = counts.get("translate", 0)
+        safety_logs = counts.get("safety", 0)
         
         return {
             "system_status": "Operational",
@@ -84,19 +159,19 @@ def dashboard_performance():
     """Fetch API performance metrics for the last 24 hours"""
     try:
         db = SessionLocal()
-        from database import ActivityLog
         cutoff = datetime.utcnow() - timedelta(days=1)
 
-        # Get usage stats per feature in the last 24h
-        sentiment_usage = db.query(ActivityLog).filter(ActivityLog.feature == "sentiment", ActivityLog.timestamp >= cutoff).count()
-        translation_usage = db.query(ActivityLog).filter(ActivityLog.feature == "translate", ActivityLog.timestamp >= cutoff).count()
-        safety_usage = db.query(ActivityLog).filter(ActivityLog.feature == "safety", ActivityLog.timestamp >= cutoff).count()
-        recommend_usage = db.query(ActivityLog).filter(ActivityLog.feature == "recommend", ActivityLog.timestamp >= cutoff).count()
-        insights_usage = db.query(ActivityLog).filter(ActivityLog.feature == "insights", ActivityLog.timestamp >= cutoff).count()
-        summary_usage = db.query(ActivityLog).filter(ActivityLog.feature == "summary", ActivityLog.timestamp >= cutoff).count()
-
+        # Get usage stats per feature in the last 24h (hour granularity)
+        counts = feature_counts(db, since=cutoff)
         db.close()
 
+        sentiment_usage = counts.get("sentiment", 0)
+        translation_usage = counts.get("translate", 0)
+        safety_usage = counts.get("safety", 0)
+        recommend_usage = counts.get("recommend", 0)
+        insights_usage = counts.get("insights", 0)
+        summary_usage = counts.get("summary", 0)
+
         total = sentiment_usage + translation_usage + safety_usage + recommend_usage + insights_usage + summary_usage
         if total == 0:
             return [
@@ -172,4 +247,6 @@ def dashboard_activity():
         return [{"icon": "activity", "text": "No activity recorded", "time": "Now", "color": "text-gray-400"}]
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # WEB_CONCURRENCY=4 python main.py runs four worker processes sharing state through shared_state
+    workers = shared_state.WORKERS
+    uvicorn.run("main:app" if workers > 1 else app, host="0.0.0.0", port=8000, workers=workers)
\ No newline at end of file
@@ -0,0 +1,194 @@
+import bisect
+import json
+import time
+import shared_state
+
+# In-process metrics with a Prometheus text exposition (/metrics).
+# Counters and histograms are plain dicts keyed by label values; observing is one
+# bisect and two additions on the event loop thread, cheap enough to leave on.
+# Worker threads time their own work and the result is observed back on the loop.
+# With several worker processes each one publishes its values through shared_state
+# and /metrics reports the sum over all live workers.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (16, 64, 256, 1024, 4096, 16384, 65536, 262144)
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.values = {}
+        _registry.append(self)
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def combined(self, others):
+        """These values plus other workers' published [labels, value] pairs"""
+        values = dict(self.values)
+        for labels, value in others:
+            labels = tuple(labels)
+            values[labels] = values.get(labels, 0) + value
+        return values
+
+    def render(self, values=None):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in (self.values if values is None else values).items():
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self.values = {}  # labels -> [per-bucket counts (+Inf last), sum]
+        _registry.append(self)
+
+    def observe(self, value, *labels):
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def combined(self, others):
+        """These values plus other workers' published [labels, [counts, sum]] pairs"""
+        values = {labels: [list(counts), total] for labels, (counts, total) in self.values.items()}
+        for labels, (counts, total) in others:
+            labels = tuple(labels)
+            entry = values.get(labels)
+            if entry is None:
+                values[labels] = [list(counts), total]
+            elif len(counts) == len(entry[0]):
+                entry[0] = [a + b for a, b in zip(entry[0], counts)]
+                entry[1] += total
+        return values
+
+    def render(self, values=None):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in (self.values if values is None else values).items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+http_latency = Histogram(
+    "mediamind_http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status"))
+llm_latency = Histogram(
+    "mediamind_llm_request_duration_seconds", "Gemini call latency by model", ("model", "outcome"))
+llm_first_token = Histogram(
+    "mediamind_llm_time_to_first_token_seconds", "Streaming Gemini time to first token", ("model",))
+llm_prompt_tokens = Histogram(
+    "mediamind_llm_prompt_tokens", "Prompt size in tokens", ("model",), SIZE_BUCKETS)
+llm_response_tokens = Histogram(
+    "mediamind_llm_response_tokens", "Response size in tokens", ("model",), SIZE_BUCKETS)
+llm_errors = Counter(
+    "mediamind_llm_errors_total", "Failed Gemini calls (quota = ResourceExhausted, shed = scheduler deadline)", ("model", "reason"))
+db_write_latency = Histogram(
+    "mediamind_db_write_duration_seconds", "Database write transaction latency", ("table",))
+db_write_rows = Histogram(
+    "mediamind_db_write_rows", "Rows per database write transaction", ("table",), SIZE_BUCKETS)
+fallbacks = Counter(
+    "mediamind_fallbacks_total", "Responses served by a fallback path", ("feature", "reason"))
+
+
+def error_reason(error):
+    """Fallback reason label for an exception"""
+    name = type(error).__name__
+    if name == "CircuitOpen":
+        return "circuit_open"
+    if name in ("ResourceExhausted", "QuotaExceeded", "TooManyRequests"):
+        return "quota"
+    if name in ("JSONDecodeError", "ValueError", "KeyError", "TypeError"):
+        return "parse_error"
+    return "error"
+
+
+def fallback(feature, reason):
+    fallbacks.inc(feature, reason)
+
+
+def snapshot():
+    """(meta, bytes) of this process's values for the other workers"""
+    data = {metric.name: [[list(labels), value] for labels, value in metric.values.items()] for metric in _registry}
+    return {}, json.dumps(data).encode("utf-8")
+
+
+shared_state.register_snapshot("metrics", snapshot)
+
+
+def other_workers():
+    """Values published by the other worker processes (reads the shared store)"""
+    return [json.loads(data) for _, data in shared_state.other_snapshots("metrics")]
+
+
+def render(others=()):
+    """
+    Prometheus text of this process's values plus `others`.
+    Call on the event loop: it is the only writer of the values being iterated.
+    """
+    lines = []
+    for metric in _registry:
+        if others:
+            merged = metric.combined([item for other in others for item in other.get(metric.name, [])])
+            lines.extend(metric.render(merged))
+        else:
+            lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request until its last body chunk is sent"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        status = [500]
+        recorded = [False]
+
+        def record():
+            if not recorded[0]:
+                recorded[0] = True
+                route = scope.get("route")
+                http_latency.observe(
+                    time.perf_counter() - started,
+                    scope["method"], getattr(route, "path", "unmatched"), str(status[0]))
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                record()
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            record()
@@ -0,0 +1,252 @@
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import time
+import shared_state
+
+# Quota-aware scheduler for every Gemini call.
+# Each model has a requests-per-minute and a tokens-per-minute token bucket.
+# Callers wait in a priority queue (interactive work ahead of batch work) until both
+# buckets can cover them. When the server answers ResourceExhausted, its retry_delay
+# pauses that model for everyone instead of each handler sleeping on its own.
+# If the projected wait is longer than the caller's deadline, acquire() fails fast.
+# With several worker processes (shared_state.ENABLED) the buckets live in the shared
+# store: each process draws a lease of at most QUOTA_LEASE_SECONDS of the model's rate
+# into its local buckets, and ResourceExhausted pauses the model for every process.
+# Draws run in a worker thread, and only once the local lease runs below half of that
+# (or has not been synced for a lease period), so most acquires never touch the file.
+
+INTERACTIVE = 0
+BATCH = 1
+
+DEFAULT_RPM = int(os.getenv("GEMINI_RPM", "1000"))
+DEFAULT_TPM = int(os.getenv("GEMINI_TPM", "1000000"))
+# Per-model overrides, e.g. {"gemini-2.5-flash": {"rpm": 1000, "tpm": 1000000}}
+MODEL_LIMITS = json.loads(os.getenv("GEMINI_MODEL_LIMITS", "{}"))
+
+# Longest a caller is willing to queue, per priority (seconds)
+DEFAULT_DEADLINES = {
+    INTERACTIVE: float(os.getenv("GEMINI_INTERACTIVE_DEADLINE", "10")),
+    BATCH: float(os.getenv("GEMINI_BATCH_DEADLINE", "120")),
+}
+
+# Used when ResourceExhausted carries no retry hint
+DEFAULT_RETRY_DELAY = 15.0
+
+# Multi-worker mode: most of the per-minute budget a process holds locally at once
+LEASE_SECONDS = float(os.getenv("QUOTA_LEASE_SECONDS", "1"))
+
+
+class QuotaExceeded(Exception):
+    """The projected wait for quota is longer than the caller's deadline"""
+
+
+class _ModelQuota:
+    def __init__(self, model_name):
+        limits = MODEL_LIMITS.get(model_name, {})
+        self.model_name = model_name
+        self.rpm = float(limits.get("rpm", DEFAULT_RPM))
+        self.tpm = float(limits.get("tpm", DEFAULT_TPM))
+        # In multi-worker mode the local buckets only hold what was drawn from the shared ones
+        self.requests = 0.0 if shared_state.ENABLED else self.rpm
+        self.tokens = 0.0 if shared_state.ENABLED else self.tpm
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.synced = 0.0  # last draw from the shared buckets
+        self.drawing = None  # task drawing from the shared buckets, if one is running
+        self.starved = False  # the last draw got less than half of what it asked for
+        self.waiters = []  # heap of (priority, seq, tokens, future)
+        self.timer = None
+        self.stats = {"granted": 0, "shed": 0, "throttled": 0, "queued": 0}
+
+    def refill(self, now, tokens_needed=None):
+        """tokens_needed: size of the call about to be granted (None when only reading)"""
+        if shared_state.ENABLED:
+            if tokens_needed is not None:
+                self.top_up(now, tokens_needed)
+            return
+        self.requests, self.tokens = self.available(now)
+        self.updated = now
+
+    def available(self, now):
+        """(requests, tokens) the buckets would hold after a refill at `now`, without refilling"""
+        if shared_state.ENABLED:
+            return self.requests, self.tokens
+        elapsed = now - self.updated
+        return (min(self.rpm, self.requests + elapsed * self.rpm / 60),
+                min(self.tpm, self.tokens + elapsed * self.tpm / 60))
+
+    def top_up(self, now, tokens_needed):
+        """Start a background draw when the local lease runs low; idle processes draw nothing"""
+        if self.drawing is not None:
+            return
+        lease_requests = max(1.0, self.rpm * LEASE_SECONDS / 60)
+        lease_tokens = max(min(tokens_needed, self.tpm), self.tpm * LEASE_SECONDS / 60)
+        short = self.requests < max(1.0, lease_requests / 2) or self.tokens < max(min(tokens_needed, self.tpm), lease_tokens / 2)
+        if self.starved and now - self.synced < LEASE_SECONDS / 2:
+            # The shared buckets were nearly empty: give them time to refill before asking again
+            return
+        if not short and now - self.synced < LEASE_SECONDS:
+            return
+        self.drawing = asyncio.get_running_loop().create_task(
+            self.draw(max(0.0, lease_requests - self.requests), max(0.0, lease_tokens - self.tokens)))
+
+    async def draw(self, want_requests, want_tokens):
+        """Take up to the wanted amounts from the shared buckets, then grant whoever they cover"""
+        try:
+            requests, tokens, blocked_for = await asyncio.to_thread(
+                shared_state.draw_quota, self.model_name, self.rpm, self.tpm, want_requests, want_tokens)
+            now = time.monotonic()
+            self.synced = now
+            self.starved = requests < want_requests / 2 or tokens < want_tokens / 2
+            self.requests += requests
+            self.tokens += tokens
+            self.blocked_until = max(self.blocked_until, now + blocked_for)
+        except Exception as e:
+            # Keep serving from the local lease; the next pump tries again
+            print(f"Shared quota error: {e}")
+            self.synced = time.monotonic()
+            self.starved = True
+        finally:
+            self.drawing = None
+        if self.waiters:
+            if self.timer is not None:
+                self.timer.cancel()
+            _pump(self)
+
+    def wait_for(self, requests, tokens, now):
+        """Seconds until the buckets could cover this much demand"""
+        wait = max(0.0, self.blocked_until - now)
+        if requests > self.requests:
+            wait = max(wait, (requests - self.requests) * 60 / self.rpm)
+        # A single prompt bigger than the whole minute budget still gets through once the bucket is full
+        tokens = min(tokens, self.tpm)
+        if tokens > self.tokens:
+            wait = max(wait, (tokens - self.tokens) * 60 / self.tpm)
+        return wait
+
+
+_quotas = {}
+_seq = itertools.count()
+
+
+def _quota(model_name):
+    quota = _quotas.get(model_name)
+    if quota is None:
+        quota = _ModelQuota(model_name)
+        _quotas[model_name] = quota
+    return quota
+
+
+def _pump(quota):
+    """Grant queued callers in priority order while the buckets allow"""
+    quota.timer = None
+    now = time.monotonic()
+    while quota.waiters and quota.waiters[0][3].done():
+        heapq.heappop(quota.waiters)
+    quota.refill(now, quota.waiters[0][2] if quota.waiters else None)
+    while quota.waiters:
+        _, _, tokens, future = quota.waiters[0]
+        if future.done():
+            heapq.heappop(quota.waiters)
+            continue
+        wait = quota.wait_for(1, tokens, now)
+        if wait > 0:
+            quota.timer = asyncio.get_running_loop().call_later(wait, _pump, quota)
+            return
+        heapq.heappop(quota.waiters)
+        quota.requests -= 1
+        quota.tokens -= min(tokens, quota.tpm)
+        quota.stats["granted"] += 1
+        future.set_result(None)
+
+
+async def acquire(model_name, tokens, priority=INTERACTIVE, deadline=None):
+    """Wait for quota to send `tokens` tokens to model_name, or raise QuotaExceeded"""
+    quota = _quota(model_name)
+    now = time.monotonic()
+    quota.refill(now, tokens)
+    if deadline is None:
+        deadline = DEFAULT_DEADLINES.get(priority, DEFAULT_DEADLINES[BATCH])
+
+    # Everyone already queued at the same or higher priority goes first
+    ahead = [w for w in quota.waiters if w[0] <= priority and not w[3].done()]
+    projected = quota.wait_for(1 + len(ahead), tokens + sum(w[2] for w in ahead), now)
+    if projected > deadline:
+        quota.stats["shed"] += 1
+        raise QuotaExceeded(f"{model_name}: projected quota wait {projected:.1f}s exceeds deadline {deadline:.1f}s")
+
+    future = asyncio.get_running_loop().create_future()
+    heapq.heappush(quota.waiters, (priority, next(_seq), tokens, future))
+    if quota.waiters[0][3] is not future or projected > 0:
+        quota.stats["queued"] += 1
+    if quota.timer is not None:
+        quota.timer.cancel()
+    _pump(quota)
+    try:
+        await future
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+
+
+def settle(model_name, estimated_tokens, actual_tokens):
+    """Correct the token bucket once the real usage of a call is known"""
+    if actual_tokens:
+        quota = _quota(model_name)
+        quota.tokens -= actual_tokens - estimated_tokens
+
+
+def retry_delay_seconds(error):
+    """Server suggested retry delay from a ResourceExhausted error"""
+    retry_delay = getattr(error, "retry_delay", None)
+    if retry_delay is None:
+        for detail in getattr(error, "details", None) or []:
+            retry_delay = getattr(detail, "retry_delay", None)
+            if retry_delay is not None:
+                break
+    if hasattr(retry_delay, "total_seconds"):
+        return max(1.0, retry_delay.total_seconds())
+    if hasattr(retry_delay, "seconds"):
+        return max(1.0, float(retry_delay.seconds) + getattr(retry_delay, "nanos", 0) / 1e9)
+    if isinstance(retry_delay, (int, float)):
+        return max(1.0, float(retry_delay))
+    return DEFAULT_RETRY_DELAY
+
+
+def throttle(model_name, error):
+    """Pause model_name for every caller after the server reported exhausted quota"""
+    quota = _quota(model_name)
+    delay = retry_delay_seconds(error)
+    quota.blocked_until = max(quota.blocked_until, time.monotonic() + delay)
+    quota.stats["throttled"] += 1
+    if shared_state.ENABLED:
+        asyncio.get_running_loop().create_task(_block_shared(quota, delay))
+    return delay
+
+
+async def _block_shared(quota, delay):
+    try:
+        await asyncio.to_thread(shared_state.block_quota, quota.model_name, delay, quota.rpm, quota.tpm)
+    except Exception as e:
+        print(f"Shared quota error: {e}")
+
+
+def stats():
+    now = time.monotonic()
+    result = {}
+    for model_name, quota in list(_quotas.items()):
+        # Read-only: the buckets are only changed on the loop, by grants and refills
+        requests, tokens = quota.available(now)
+        result[model_name] = {
+            **quota.stats,
+            "waiting": sum(1 for w in quota.waiters if not w[3].done()),
+            "rpm_limit": quota.rpm,
+            "tpm_limit": quota.tpm,
+            "requests_available": round(requests, 1),
+            "tokens_available": round(tokens),
+            "blocked_for": round(max(0.0, quota.blocked_until - now), 1),
+        }
+    return result
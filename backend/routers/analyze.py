@@ -0,0 +1,223 @@
+from fastapi import APIRouter
+import json
+import re
+from log_writer import log_activities
+from gemini_client import generate, estimate_tokens, DEFAULT_MODEL, INTERACTIVE, BATCH, CircuitOpen
+import circuit_breaker
+from routers import f1_sentiment, f4_safety, f6_summary
+import llm_cache
+import local_sentiment
+import safety_filter
+import trending_terms
+import metrics
+
+router = APIRouter()
+
+# Sentiment, safety and summary of one text from a single Gemini call.
+# Each analysis first tries the same shortcuts as its own endpoint (local model,
+# pre-filter, per-feature cache); only what is left goes into one combined prompt.
+# Results have the exact /feature-1, /feature-4 and /feature-6 response shapes,
+# share their caches, and are logged as one ActivityLog row per analysis.
+
+ANALYSES = ("sentiment", "safety", "summary")
+
+FIELD_SPECS = {
+    "sentiment": '"sentiment": {"sentiment": "Positive|Negative|Neutral", "confidence": "85%", "tone": "Enthusiastic"}',
+    "safety": '"safety": {"status": "Safe|Unsafe", "type": "content_type", "confidence": "XX%", "issues": ["issue1", "issue2"]}',
+    "summary": '"summary": "2-3 sentence summary, concise and clear"',
+}
+
+def combined_prompt(text, analyses):
+    fields = ",\n".join(FIELD_SPECS[name] for name in analyses)
+    return f"""Run these analyses on the text below: {", ".join(analyses)}.
+
+Respond ONLY with one JSON object (no markdown, no extra text) with exactly these keys:
+{{{fields}}}
+
+Where:
+- sentiment.tone: one word describing the tone
+- safety.status: Safe if content is appropriate, Unsafe if it contains hate speech, misinformation, or harmful content
+- safety.type: Brief description (e.g., "Credible News", "Potential Misinformation", "Hate Speech", "Cyberbullying", "Spam")
+- safety.issues: Array of detected issues (empty if safe)
+
+Text to analyze:
+"{text}"
+
+Respond with JSON only."""
+
+def parse_combined(response_text):
+    """The JSON object in the model output, or {} if there is none"""
+    match = re.search(r'\{.*\}', response_text, re.DOTALL)
+    if not match:
+        return {}
+    try:
+        parsed = json.loads(match.group(0))
+    except json.JSONDecodeError as e:
+        print(f"Combined JSON Parse Error: {e}")
+        return {}
+    return parsed if isinstance(parsed, dict) else {}
+
+def sentiment_result(entry):
+    if isinstance(entry, dict) and entry.get("sentiment") in ("Positive", "Negative", "Neutral"):
+        return {
+            "sentiment": entry["sentiment"],
+            "confidence": entry.get("confidence", "75%"),
+            "tone": entry.get("tone", "Informative")
+        }
+    return None
+
+def safety_result(entry, flagged):
+    if isinstance(entry, dict) and entry.get("status") in ("Safe", "Unsafe"):
+        return f4_safety.add_flagged({
+            "status": entry["status"],
+            "type": entry.get("type", "Unknown"),
+            "confidence": entry.get("confidence", "75%"),
+            "issues": entry.get("issues", []),
+            "sources": entry.get("sources", ["Gemini AI", "Content Filter"])
+        }, flagged)
+    return None
+
+def summary_result(entry, text):
+    if isinstance(entry, str) and entry.strip():
+        summary = entry.strip()
+        return {"summary": summary, "compression_ratio": f"{round(len(summary)/len(text)*100, 1)}%"}
+    return None
+
+# Results when the request itself fails, as each endpoint returns them
+FAILED = {
+    "sentiment": lambda: f1_sentiment.answered_by({"sentiment": "Neutral", "confidence": "50%", "tone": "Unknown"}, "fallback"),
+    "safety": lambda: {"status": "Safe", "type": "Analysis Failed", "confidence": "50%", "sources": ["Fallback"]},
+    "summary": lambda: {"summary": "Summary generation failed", "compression_ratio": "0%"},
+}
+
+def degraded_result(name, text):
+    """Local answer for one analysis while Gemini's circuit is open"""
+    if name == "sentiment":
+        return circuit_breaker.degraded(f1_sentiment.answered_by(f1_sentiment.keyword_sentiment(text), "fallback"))
+    if name == "safety":
+        return circuit_breaker.degraded(f4_safety.keyword_verdict(text))
+    return f6_summary.lead_summary(text)
+
+def log_entry(name, text, result):
+    """The ActivityLog row each feature's own endpoint would write"""
+    if name == "sentiment":
+        return ("sentiment", text[:256], json.dumps(result))
+    if name == "safety":
+        return ("safety", text[:256], "Error" if result.get("type") == "Analysis Failed" else result.get("status", "Unknown"))
+    failed = result["summary"] == "Summary generation failed"
+    return ("summary", text[:256], "Error" if failed else result["summary"][:256])
+
+@router.post("/analyze")
+async def analyze(request: dict):
+    """
+    Run several analyses on one text with a single Gemini call.
+    Body: {"text": ..., "analyses": ["sentiment", "safety", "summary"], "priority": "batch"?}
+    A single analysis name may be given as a string.
+    Returns one key per requested analysis, shaped like that feature's own response.
+    """
+    # The body is untyped JSON: non-string text is analyzed as its string form
+    text = str(request.get("text") or "")
+    requested = request.get("analyses") or list(ANALYSES)
+    if isinstance(requested, str):
+        requested = [requested]
+    if not isinstance(requested, list):
+        return {"error": "analyses must be a list of analysis names", "available_analyses": list(ANALYSES)}
+    analyses = [name for name in ANALYSES if name in requested]
+    unknown = [name for name in requested if name not in ANALYSES]
+    if unknown:
+        return {"error": f"unknown analyses: {', '.join(map(str, unknown))}", "available_analyses": list(ANALYSES)}
+    priority = BATCH if request.get("priority") == "batch" else INTERACTIVE
+    trending_terms.observe(text)
+
+    results = {}
+    cache_keys = {}
+    flagged = []
+    logged = set(analyses)
+    try:
+        # Answer what the per-feature shortcuts can
+        if "sentiment" in analyses:
+            if not text:
+                results["sentiment"] = f1_sentiment.answered_by({"sentiment": "Neutral", "confidence": "0%", "tone": "Neutral"}, "local")
+            else:
+                score = local_sentiment.classify(text)
+                if score["confidence"] >= local_sentiment.CONFIDENCE_THRESHOLD:
+                    results["sentiment"] = f1_sentiment.answered_by(local_sentiment.as_response(score), "local")
+                else:
+                    cache_keys["sentiment"] = llm_cache.make_key("sentiment", DEFAULT_MODEL, f1_sentiment.PROMPT_VERSION, text)
+        if "safety" in analyses:
+            if not text:
+                # Like /feature-4/safety, empty content is not logged
+                logged.discard("safety")
+                results["safety"] = {"status": "Safe", "type": "Empty Content", "confidence": "100%", "sources": ["System Default"]}
+            else:
+                verdict, flagged = safety_filter.prefilter(text)
+                if verdict is not None:
+                    results["safety"] = verdict
+                else:
+                    cache_keys["safety"] = llm_cache.make_key("safety", DEFAULT_MODEL, f4_safety.PROMPT_VERSION, text)
+        if "summary" in analyses:
+            if not text or len(text) < 50:
+                logged.discard("summary")
+                results["summary"] = {"summary": text}
+            else:
+                cache_keys["summary"] = llm_cache.make_key("summary", DEFAULT_MODEL, f6_summary.PROMPT_VERSION, text)
+
+        for name, key in list(cache_keys.items()):
+            cached = await llm_cache.get(key)
+            if cached is not None:
+                results[name] = f1_sentiment.answered_by(cached, "cache") if name == "sentiment" else cached
+                del cache_keys[name]
+
+        # Documents too long for one prompt keep the map-reduce summary path
+        if "summary" in cache_keys and estimate_tokens(text) > f6_summary.CHUNK_TOKENS:
+            summary, chunk_count = await f6_summary.map_reduce_summary(text, priority)
+            results["summary"] = {**summary_result(summary, text), "chunks": chunk_count}
+            await llm_cache.put(cache_keys.pop("summary"), results["summary"])
+
+        pending = [name for name in analyses if name in cache_keys]
+        if pending:
+            parsed = {}
+            failure = "parse_error"
+            degraded = False
+            try:
+                response = await generate(combined_prompt(text, pending), priority=priority)
+                parsed = parse_combined(response.text)
+            except CircuitOpen as e:
+                failure = metrics.error_reason(e)
+                degraded = True
+            except Exception as e:
+                print(f"Combined analysis error: {e}")
+                failure = metrics.error_reason(e)
+
+            for name in pending:
+                if name == "sentiment":
+                    result = sentiment_result(parsed.get("sentiment"))
+                elif name == "safety":
+                    result = safety_result(parsed.get("safety"), flagged)
+                else:
+                    result = summary_result(parsed.get("summary"), text)
+                if result is not None:
+                    await llm_cache.put(cache_keys[name], result)
+                    results[name] = f1_sentiment.answered_by(result, "llm") if name == "sentiment" else result
+                    continue
+                # This analysis is missing or malformed: same fallbacks as its own endpoint
+                metrics.fallback(name, failure)
+                if degraded:
+                    results[name] = degraded_result(name, text)
+                elif name == "sentiment":
+                    results[name] = f1_sentiment.answered_by(f1_sentiment.keyword_sentiment(text), "fallback")
+                elif name == "safety":
+                    results[name] = f4_safety.keyword_verdict(text)
+                else:
+                    results[name] = FAILED["summary"]()
+    except Exception as e:
+        if not isinstance(e, CircuitOpen):
+            print(f"Error: {e}")
+        for name in analyses:
+            if name not in results:
+                metrics.fallback(name, metrics.error_reason(e))
+                results[name] = degraded_result(name, text) if isinstance(e, CircuitOpen) else FAILED[name]()
+
+    # One transaction for all rows of this request
+    await log_activities([log_entry(name, text, results[name]) for name in analyses if name in logged])
+    return {name: results[name] for name in analyses}
@@ -1,38 +1,91 @@
 from fastapi import APIRouter
-import google.generativeai as genai
-import os
+import asyncio
 import json
+import os
 import re
-from database import SessionLocal, ActivityLog
+from log_writer import log_activity
+from gemini_client import generate, estimate_tokens, DEFAULT_MODEL, INTERACTIVE, BATCH, CircuitOpen
+import circuit_breaker
+import llm_cache
+import local_sentiment
+import trending_terms
+import metrics
 
 router = APIRouter()
 
-# Configure Gemini API
-api_key = os.getenv("GEMINI_API_KEY", "your-key-here")
-genai.configure(api_key=api_key)
+# Bump when the prompt below changes so cached results are not reused
+PROMPT_VERSION = "v1"
+
+# Batch scoring: rough input-token budget per packed prompt (~4 chars per token),
+# hard cap on items per prompt, and packed prompts in flight per request
+BATCH_TOKEN_BUDGET = int(os.getenv("SENTIMENT_BATCH_TOKEN_BUDGET", "6000"))
+BATCH_MAX_ITEMS = int(os.getenv("SENTIMENT_BATCH_MAX_ITEMS", "100"))
+BATCH_CONCURRENCY = int(os.getenv("SENTIMENT_BATCH_CONCURRENCY", "8"))
+
+POSITIVE_WORDS = ['love', 'great', 'amazing', 'excellent', 'wonderful', 'awesome', 'fantastic']
+NEGATIVE_WORDS = ['hate', 'terrible', 'awful', 'bad', 'horrible', 'worst', 'disgusting']
+
+def keyword_sentiment(text):
+    """Infer sentiment from keywords when the model output cannot be used"""
+    text_lower = text.lower()
+    if any(word in text_lower for word in POSITIVE_WORDS):
+        return {"sentiment": "Positive", "confidence": "70%", "tone": "Enthusiastic"}
+    elif any(word in text_lower for word in NEGATIVE_WORDS):
+        return {"sentiment": "Negative", "confidence": "70%", "tone": "Frustrated"}
+    return {"sentiment": "Neutral", "confidence": "60%", "tone": "Informative"}
+
+# Which path answered each request: local model, LLM cache, Gemini, or keyword fallback
+path_counts = {"local": 0, "cache": 0, "llm": 0, "fallback": 0}
+
+def answered_by(result, path):
+    """Tag a result with the path that produced it and count it"""
+    path_counts[path] += 1
+    result["answered_by"] = path
+    return result
 
 @router.get("/feature-1")
 async def feature_one_test():
     return {"message": "Sentiment Analysis Ready"}
 
+@router.get("/feature-1/stats")
+async def sentiment_stats():
+    """How often requests were answered without a Gemini call"""
+    total = sum(path_counts.values())
+    avoided = path_counts["local"] + path_counts["cache"]
+    return {
+        **path_counts,
+        "total": total,
+        "llm_avoidance_rate": round(avoided / total, 4) if total else 0.0,
+        "local_threshold": local_sentiment.CONFIDENCE_THRESHOLD
+    }
+
 @router.post("/feature-1/sentiment")
 async def analyze_sentiment(request: dict):
     try:
         text = request.get("text", "")
+        trending_terms.observe(text)
+        # Background jobs queue behind interactive requests
+        priority = BATCH if request.get("priority") == "batch" else INTERACTIVE
         if not text:
-            result = {"sentiment": "Neutral", "confidence": "0%", "tone": "Neutral"}
+            result = answered_by({"sentiment": "Neutral", "confidence": "0%", "tone": "Neutral"}, "local")
             # Log activity even for empty input
-            try:
-                db = SessionLocal()
-                log = ActivityLog(feature="sentiment", input_text=text[:256], output_result=json.dumps(result))
-                db.add(log)
-                db.commit()
-                db.close()
-            except Exception as e:
-                print(f"Log error (empty input): {e}")
+            await log_activity(feature="sentiment", input_text=text[:256], output_result=json.dumps(result))
+            return result
+
+        # Clear-cut text is answered by the local model without touching Gemini
+        score = local_sentiment.classify(text)
+        if score["confidence"] >= local_sentiment.CONFIDENCE_THRESHOLD:
+            result = answered_by(local_sentiment.as_response(score), "local")
+            await log_activity(feature="sentiment", input_text=text[:256], output_result=json.dumps(result))
             return result
+
+        cache_key = llm_cache.make_key("sentiment", DEFAULT_MODEL, PROMPT_VERSION, text)
+        cached = await llm_cache.get(cache_key)
+        if cached is not None:
+            cached = answered_by(cached, "cache")
+            await log_activity(feature="sentiment", input_text=text[:256], output_result=json.dumps(cached))
+            return cached
         
-        model = genai.GenerativeModel('gemini-2.5-flash')
         prompt = f"""Analyze the sentiment of this text in ONE line JSON format:
 {{"sentiment":"Positive","confidence":"85%","tone":"Enthusiastic"}}
 
@@ -40,7 +93,7 @@ Only respond with valid JSON, no other text.
 
 Text to analyze: {text}"""
         
-        response = model.generate_content(prompt)
+        response = await generate(prompt, priority=priority)
         
         try:
             # Extract JSON from response
@@ -50,56 +103,131 @@ Text to analyze: {text}"""
             if json_match:
                 json_str = json_match.group(0)
                 result = json.loads(json_str)
+                await llm_cache.put(cache_key, result)
+                answered_by(result, "llm")
                 # Log activity
-                try:
-                    db = SessionLocal()
-                    log = ActivityLog(feature="sentiment", input_text=text[:256], output_result=json.dumps(result))
-                    db.add(log)
-                    db.commit()
-                    db.close()
-                except Exception as e:
-                    print(f"Log error: {e}")
+                await log_activity(feature="sentiment", input_text=text[:256], output_result=json.dumps(result))
                 return result
             else:
-                result = {"sentiment": "Neutral", "confidence": "75%", "tone": "Informative"}
-                try:
-                    db = SessionLocal()
-                    log = ActivityLog(feature="sentiment", input_text=text[:256], output_result=json.dumps(result))
-                    db.add(log)
-                    db.commit()
-                    db.close()
-                except Exception as e:
-                    print(f"Log error: {e}")
+                metrics.fallback("sentiment", "parse_error")
+                result = answered_by({"sentiment": "Neutral", "confidence": "75%", "tone": "Informative"}, "llm")
+                await log_activity(feature="sentiment", input_text=text[:256], output_result=json.dumps(result))
                 return result
         except Exception as parse_error:
             print(f"Parse error: {parse_error}")
             print(f"Response text: {response.text}")
+            metrics.fallback("sentiment", "parse_error")
             # Fallback: try to infer sentiment from text
-            text_lower = text.lower()
-            if any(word in text_lower for word in ['love', 'great', 'amazing', 'excellent', 'wonderful', 'awesome', 'fantastic']):
-                result = {"sentiment": "Positive", "confidence": "70%", "tone": "Enthusiastic"}
-            elif any(word in text_lower for word in ['hate', 'terrible', 'awful', 'bad', 'horrible', 'worst', 'disgusting']):
-                result = {"sentiment": "Negative", "confidence": "70%", "tone": "Frustrated"}
-            else:
-                result = {"sentiment": "Neutral", "confidence": "60%", "tone": "Informative"}
-            try:
-                db = SessionLocal()
-                log = ActivityLog(feature="sentiment", input_text=text[:256], output_result=json.dumps(result))
-                db.add(log)
-                db.commit()
-                db.close()
-            except Exception as e:
-                print(f"Log error (fallback): {e}")
+            result = answered_by(keyword_sentiment(text), "fallback")
+            await log_activity(feature="sentiment", input_text=text[:256], output_result=json.dumps(result))
             return result
+    except CircuitOpen as e:
+        # Gemini is failing: answer from keywords right away
+        metrics.fallback("sentiment", metrics.error_reason(e))
+        result = circuit_breaker.degraded(answered_by(keyword_sentiment(text), "fallback"))
+        await log_activity(feature="sentiment", input_text=text[:256], output_result=json.dumps(result))
+        return result
     except Exception as e:
         print(f"Error: {e}")
-        result = {"sentiment": "Neutral", "confidence": "50%", "tone": "Unknown"}
-        try:
-            db = SessionLocal()
-            log = ActivityLog(feature="sentiment", input_text=str(request)[:256], output_result=json.dumps(result))
-            db.add(log)
-            db.commit()
-            db.close()
-        except Exception as le:
-            print(f"Log error (exception): {le}")
-        return result
\ No newline at end of file
+        metrics.fallback("sentiment", metrics.error_reason(e))
+        result = answered_by({"sentiment": "Neutral", "confidence": "50%", "tone": "Unknown"}, "fallback")
+        await log_activity(feature="sentiment", input_text=str(request)[:256], output_result=json.dumps(result))
+        return result
+
+def pack_texts(items):
+    """Group (index, text) pairs into packs that fit the token budget"""
+    packs, current, used = [], [], 0
+    for i, text in items:
+        cost = estimate_tokens(text)
+        if current and (used + cost > BATCH_TOKEN_BUDGET or len(current) >= BATCH_MAX_ITEMS):
+            packs.append(current)
+            current, used = [], 0
+        current.append((i, text))
+        used += cost
+    if current:
+        packs.append(current)
+    return packs
+
+async def score_pack(items, semaphore):
+    """Score one pack of (index, text) pairs with a single Gemini call"""
+    payload = json.dumps([{"id": i, "text": text} for i, text in items], ensure_ascii=False)
+    prompt = f"""Analyze the sentiment of each text below.
+
+Respond ONLY with a JSON array containing one object per text, in this format:
+[{{"id":0,"sentiment":"Positive","confidence":"85%","tone":"Enthusiastic"}}]
+
+sentiment must be Positive, Negative or Neutral. Only respond with valid JSON, no other text.
+
+Texts to analyze (JSON):
+{payload}"""
+
+    parsed = {}
+    failure = "parse_error"
+    degraded = False
+    try:
+        async with semaphore:
+            response = await generate(prompt, priority=BATCH)
+        json_match = re.search(r'\[.*\]', response.text, re.DOTALL)
+        if json_match:
+            for entry in json.loads(json_match.group(0)):
+                if isinstance(entry, dict) and entry.get("sentiment"):
+                    parsed[entry.get("id")] = entry
+    except CircuitOpen as e:
+        failure = metrics.error_reason(e)
+        degraded = True
+    except Exception as e:
+        print(f"Batch sentiment error: {e}")
+        failure = metrics.error_reason(e)
+
+    results = {}
+    for i, text in items:
+        entry = parsed.get(i)
+        if entry is None:
+            # This item's part of the output is missing or malformed
+            metrics.fallback("sentiment", failure)
+            results[i] = answered_by(keyword_sentiment(text), "fallback")
+            if degraded:
+                circuit_breaker.degraded(results[i])
+        else:
+            results[i] = answered_by({
+                "sentiment": entry["sentiment"],
+                "confidence": entry.get("confidence", "75%"),
+                "tone": entry.get("tone", "Informative")
+            }, "llm")
+    return results
+
+@router.post("/feature-1/sentiment/batch")
+async def analyze_sentiment_batch(request: dict):
+    """
+    Score many texts at once, packing as many as the token budget allows into each prompt.
+    A single text may be given as a string.
+    """
+    try:
+        texts = request.get("texts") or []
+        if isinstance(texts, str):
+            texts = [texts]
+        if not isinstance(texts, list):
+            return {"error": "texts must be a list of strings", "results": []}
+        texts = [str(t) for t in texts]
+        for text in texts:
+            trending_terms.observe(text)
+        results = {}
+        pending = []
+        # Score the whole batch locally in one vectorized pass; only unsure items go to Gemini
+        scores = local_sentiment.score_batch(texts)
+        for i, text in enumerate(texts):
+            if not text:
+                results[i] = answered_by({"sentiment": "Neutral", "confidence": "0%", "tone": "Neutral"}, "local")
+            elif scores[i]["confidence"] >= local_sentiment.CONFIDENCE_THRESHOLD:
+                results[i] = answered_by(local_sentiment.as_response(scores[i]), "local")
+            else:
+                pending.append((i, text))
+
+        semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+        for pack_result in await asyncio.gather(*(score_pack(pack, semaphore) for pack in pack_texts(pending))):
+            results.update(pack_result)
+
+        return {"results": [{"text": text[:100], **results[i]} for i, text in enumerate(texts)]}
+    except Exception as e:
+        print(f"Batch Error: {e}")
+        return {"results": []}
\ No newline at end of file
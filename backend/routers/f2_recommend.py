@@ -1,61 +1,77 @@
 from fastapi import APIRouter
 from pydantic import BaseModel
-import google.generativeai as genai
-import os
-from dotenv import load_dotenv
+import asyncio
 import json
-from database import SessionLocal, ActivityLog
-
-load_dotenv()
-api_key = os.getenv("GEMINI_API_KEY") 
-
-if api_key:
-    genai.configure(api_key=api_key)
+import os
+from log_writer import log_activity
+from gemini_client import generate, INTERACTIVE, BATCH, CircuitOpen
+import circuit_breaker
+import article_catalog
+import metrics
 
 router = APIRouter()
 
-# --- MOCK DATABASE (Real News er moto) ---
-# Amra dhore nicchi ei news gulo amader database e ache.
+# Articles live in the articles table (see article_catalog.py).
 # AI er kaj hobe eikhan theke user er jonno best gulo select kora.
-ALL_ARTICLES = [
-    {"id": 101, "category": "Technology", "title": "SpaceX Starship Successfully Reaches Orbit", "source": "TechCrunch", "time": "1h ago", "image_prompt": "SpaceX rocket launching into space realistic"},
-    {"id": 102, "category": "Technology", "title": "Apple Vision Pro 2: Leaked Features Revealed", "source": "The Verge", "time": "3h ago", "image_prompt": "Futuristic VR headset apple style"},
-    {"id": 103, "category": "Technology", "title": "Python 4.0: Rumors vs Reality", "source": "RealPython", "time": "5h ago", "image_prompt": "Python programming code on computer screen matrix style"},
-    {"id": 104, "category": "Sports", "title": "Argentina Wins Copa America in Thrilling Final", "source": "ESPN", "time": "2h ago", "image_prompt": "Lionel Messi holding trophy stadium crowd"},
-    {"id": 105, "category": "Sports", "title": "Cricket World Cup 2027 Hosts Announced", "source": "ICC News", "time": "6h ago", "image_prompt": "Cricket stadium panorama with flags"},
-    {"id": 106, "category": "Finance", "title": "Bitcoin Hits New All-Time High at $80k", "source": "Bloomberg", "time": "30m ago", "image_prompt": "Bitcoin golden coin chart background"},
-    {"id": 107, "category": "Finance", "title": "Global Recession Fears: What Experts Say", "source": "Financial Times", "time": "4h ago", "image_prompt": "Stock market chart crashing red arrows"},
-    {"id": 108, "category": "Health", "title": "New Vaccine Shows Promise Against Malaria", "source": "WHO News", "time": "1d ago", "image_prompt": "Scientist in lab looking at microscope"},
-    {"id": 109, "category": "Health", "title": "Top 10 Foods for Better Mental Health", "source": "Healthline", "time": "8h ago", "image_prompt": "Healthy food fruits and vegetables on table"},
-    {"id": 110, "category": "Politics", "title": "UN Summit Discusses Climate Change Action", "source": "BBC News", "time": "2h ago", "image_prompt": "United Nations flags waving blue sky"},
-    {"id": 111, "category": "Gaming", "title": "GTA VI Trailer Breaks YouTube Records", "source": "IGN", "time": "12h ago", "image_prompt": "Vice City style sunset sports car"},
-    {"id": 112, "category": "Gaming", "title": "Esports Now Officially an Olympic Sport", "source": "Kotaku", "time": "1d ago", "image_prompt": "Esports arena gamers with headsets"},
-]
 
 class RecRequest(BaseModel):
     user_interests: list[str]
     available_articles: list[str]
+    rerank: bool = True
+    priority: str = "interactive"  # "batch" queues the re-rank call behind interactive requests
+
+# Local retrieval picks a shortlist; Gemini only re-ranks that shortlist
+SHORTLIST_SIZE = int(os.getenv("RECOMMEND_SHORTLIST_SIZE", "12"))
+LLM_RERANK = os.getenv("RECOMMEND_LLM_RERANK", "1") == "1"
+RECOMMEND_COUNT = 3
+
+def shortlist(catalog, interests, k=SHORTLIST_SIZE):
+    """Top-k articles for the interests, padded with the most recent ones when matches run out"""
+    rows = [row for row, _ in catalog.index.search(interests, k)]
+    target = max(len(rows), RECOMMEND_COUNT) if rows else k
+    for row in range(len(catalog.articles)):
+        if len(rows) >= target:
+            break
+        if row not in rows:
+            rows.append(row)
+    return [catalog.articles[row] for row in rows]
+
+def present(articles):
+    """Response copies of snapshot articles; the snapshot itself is never mutated"""
+    return [
+        {**article, "snippet": f"Recommended because you like {article['category']}..."}  # Simple snippet
+        for article in articles
+    ]
+
+@router.post("/feature-2/catalog/import")
+async def import_catalog(articles: list[dict]):
+    """Bulk insert/update articles (same fields as data/articles_seed.json)"""
+    count = await asyncio.to_thread(article_catalog.upsert_articles, articles)
+    catalog = await article_catalog.snapshot()
+    return {"imported": count, "catalog_version": catalog.version, "catalog_size": len(catalog.articles)}
 
 @router.post("/feature-2/recommend")
 async def get_recommendations(req: RecRequest):
-    model = genai.GenerativeModel('gemini-2.5-flash')
+    catalog = await article_catalog.snapshot()
+    candidates = shortlist(catalog, req.user_interests)
 
-    # AI ke amra Database er sob Title dicchi
-    # AI ke bolchi: "Eigulor moddhe konta user er valo lagbe?"
-    
-    available_titles = [f"ID {a['id']}: {a['title']} ({a['category']})" for a in ALL_ARTICLES]
-    available_titles_str = "\n".join(available_titles)
+    try:
+        if LLM_RERANK and req.rerank and len(candidates) > RECOMMEND_COUNT:
+            # AI ke sudhu shortlist er Title dicchi, puro database na
+            # AI ke bolchi: "Eigulor moddhe konta user er valo lagbe?"
+            available_titles = [f"ID {a['id']}: {a['title']} ({a['category']})" for a in candidates]
+            available_titles_str = "\n".join(available_titles)
 
-    prompt = f"""
+            prompt = f"""
     Act as a Recommendation System.
     
     USER PROFILE (Interests): {req.user_interests}
     
-    DATABASE OF ARTICLES:
+    CANDIDATE ARTICLES:
     {available_titles_str}
     
     TASK:
-    Select the top 3 articles from the database that match the user's interests best.
+    Select the top 3 articles from the candidates that match the user's interests best.
     If no direct match is found, pick the most popular/general ones.
     
     Return JSON with this EXACT format:
@@ -65,56 +81,48 @@ async def get_recommendations(req: RecRequest):
     Output ONLY Valid JSON.
     """
 
-    try:
-        response = model.generate_content(prompt)
-        clean_text = response.text.replace("```json", "").replace("```", "").strip()
-        result_ids = json.loads(clean_text).get("selected_ids", [])
-        
-        # Filter the full article objects based on the IDs selected by AI
-        recommended_articles = [article for article in ALL_ARTICLES if article["id"] in result_ids]
-        
-        # Add Images dynamically (using the pre-defined prompt)
-        for article in recommended_articles:
-            import urllib.parse
-            encoded_prompt = urllib.parse.quote(article["image_prompt"])
-            article["image"] = f"https://image.pollinations.ai/prompt/{encoded_prompt}?width=600&height=400&nologo=true"
-            article["snippet"] = f"Recommended because you like {article['category']}..." # Simple snippet
+            response = await generate(prompt, priority=BATCH if req.priority == "batch" else INTERACTIVE)
+            clean_text = response.text.replace("```json", "").replace("```", "").strip()
+            result_ids = json.loads(clean_text).get("selected_ids", [])
+
+            # Map the IDs selected by AI back to the shortlisted articles
+            by_id = {article["id"]: article for article in candidates}
+            recommended_articles = [by_id[i] for i in dict.fromkeys(result_ids) if i in by_id][:RECOMMEND_COUNT]
+            # Top up from the local ranking if the AI returned fewer valid IDs
+            for article in candidates:
+                if len(recommended_articles) >= RECOMMEND_COUNT:
+                    break
+                if article not in recommended_articles:
+                    recommended_articles.append(article)
+        else:
+            recommended_articles = candidates[:RECOMMEND_COUNT]
 
-        result = {"recommended_articles": recommended_articles}
+        # Image URLs are precomputed in the catalog; only the snippet is per request
+        result = {"recommended_articles": present(recommended_articles)}
         
         # Log activity
-        try:
-            db = SessionLocal()
-            log = ActivityLog(
-                feature="recommend",
-                input_text=json.dumps(req.user_interests)[:256],
-                output_result=f"{len(recommended_articles)} articles"
-            )
-            db.add(log)
-            db.commit()
-            db.close()
-        except Exception as log_err:
-            print(f"Log error: {log_err}")
+        await log_activity(
+            feature="recommend",
+            input_text=json.dumps(req.user_interests)[:256],
+            output_result=f"{len(recommended_articles)} articles"
+        )
         
         return result
     
     except Exception as e:
-        print(f"Error calling Gemini: {e}")
-        # Fallback: Just return the first 3 articles
-        result = {"recommended_articles": ALL_ARTICLES[:3]}
+        if not isinstance(e, CircuitOpen):
+            print(f"Error calling Gemini: {e}")
+        metrics.fallback("recommend", metrics.error_reason(e))
+        # Fallback: the local top 3 without re-ranking
+        result = {"recommended_articles": present(candidates[:RECOMMEND_COUNT])}
+        if isinstance(e, CircuitOpen):
+            circuit_breaker.degraded(result)
         
         # Log even on error
-        try:
-            db = SessionLocal()
-            log = ActivityLog(
-                feature="recommend",
-                input_text=json.dumps(req.user_interests)[:256],
-                output_result="3 fallback articles"
-            )
-            db.add(log)
-            db.commit()
-            db.close()
-        except Exception as log_err:
-            print(f"Log error: {log_err}")
+        await log_activity(
+            feature="recommend",
+            input_text=json.dumps(req.user_interests)[:256],
+            output_result="3 fallback articles"
+        )
         
         return result
\ No newline at end of file
@@ -1,34 +1,184 @@
 from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-import google.generativeai as genai
-import os
-from dotenv import load_dotenv
 import json
-import asyncio
-from google.api_core import exceptions as g_api_exceptions
-from database import SessionLocal, ActivityLog
+from log_writer import log_activity
+from gemini_client import generate, generate_stream, INTERACTIVE, BATCH, CircuitOpen
+import circuit_breaker
+import llm_cache
+import translation_memory
+import metrics
+from sse import sse_event, SSE_HEADERS
 
-# Load API Key
-load_dotenv()
-api_key = os.getenv("GEMINI_API_KEY")
+router = APIRouter()
 
-if api_key:
-    genai.configure(api_key=api_key)
+# Bump when the translation prompt changes so cached results are not reused
+PROMPT_VERSION = "v2"
+STREAM_PROMPT_VERSION = "stream-v1"
 
-router = APIRouter()
+# Prefer newest flash; fall back if quota is exhausted or the call fails
+MODEL_CANDIDATES = [
+    "gemini-2.5-flash",
+    "models/gemini-1.5-flash",  # v1beta-compatible name
+]
 
 class TranslateRequest(BaseModel):
     text: str
     target_language: str
+    priority: str = "interactive"  # "batch" queues the Gemini call behind interactive requests
+
+@router.get("/feature-3/stats")
+async def translation_stats():
+    """Translation memory hit/miss counters"""
+    return translation_memory.stats()
+
+def segments_prompt(segments, target_language):
+    payload = json.dumps([{"id": i, "text": seg} for i, seg in segments], ensure_ascii=False)
+    return f"""
+    Act as a professional translator.
+    
+    Target Language: "{target_language}"
+    
+    Task: Translate each input segment accurately into the target language. 
+    The segments are consecutive sentences of one text; maintain the original tone and meaning.
+    
+    Input Segments (JSON):
+    {payload}
+    
+    Return JSON with this EXACT format, one entry per input id:
+    {{
+        "translations": [{{"id": 0, "text": "Your translated segment here"}}]
+    }}
+    Output ONLY Valid JSON.
+    """
+
+async def translate_segments(segments, target_language, priority=INTERACTIVE):
+    """
+    Translate [(id, segment)] in one packed request.
+    Returns ({id: translation}, model_name); raises the last error if every model fails.
+    """
+    prompt = segments_prompt(segments, target_language)
+    wanted = {i for i, _ in segments}
+    last_error = None
+
+    for model_name in MODEL_CANDIDATES:
+        # Quota waits and ResourceExhausted retries happen in the shared scheduler
+        try:
+            response = await generate(prompt, model_name, priority=priority)
+            clean_text = response.text.replace("```json", "").replace("```", "").strip()
+            translations = {
+                entry["id"]: entry["text"]
+                for entry in json.loads(clean_text).get("translations", [])
+                if isinstance(entry, dict) and entry.get("id") in wanted and isinstance(entry.get("text"), str)
+            }
+            if len(translations) != len(wanted):
+                raise ValueError(f"expected {len(wanted)} segments, got {len(translations)}")
+            return translations, model_name
+        except Exception as e:
+            last_error = e
+
+    raise last_error
+
+def add_memory_stats(result, segments, missed):
+    """Report how many of the text's sentences did not need Gemini"""
+    needed = sum(1 for seg in segments if translation_memory.needs_translation(seg))
+    reused = needed - missed
+    result["memory_hits"] = reused
+    result["memory_segments"] = needed
+    result["memory_hit_ratio"] = round(reused / needed, 4) if needed else 1.0
+    return result
+
+def memory_only(segments, separators, translated):
+    """
+    Degraded translation while Gemini's circuit is open: sentences found in the
+    translation memory are translated, the rest are left in the source language.
+    Not cached, so the full translation is produced once Gemini is back.
+    """
+    output = [translated.get(i, seg) for i, seg in enumerate(segments)]
+    missed = sum(1 for i, seg in enumerate(segments) if i not in translated and translation_memory.needs_translation(seg))
+    result = {"translated_text": translation_memory.join(output, separators)}
+    return circuit_breaker.degraded(add_memory_stats(result, segments, missed))
 
 @router.post("/feature-3/translate")
 async def translate_text(req: TranslateRequest):
-    # Prefer newest flash; fall back if quota is exhausted
-    model_candidates = [
-        "gemini-2.5-flash",
-        "models/gemini-1.5-flash",  # v1beta-compatible name
-    ]
+    for model_name in MODEL_CANDIDATES:
+        cached = await llm_cache.get(llm_cache.make_key("translate", model_name, PROMPT_VERSION, req.target_language, req.text))
+        if cached is not None:
+            # Nothing went to Gemini for this request
+            add_memory_stats(cached, translation_memory.segment(req.text)[0], 0)
+            await log_activity(
+                feature="translate",
+                input_text=req.text[:256],
+                output_result=cached.get("translated_text", "")[:256]
+            )
+            return cached
+
+    # Sentence-level translation memory: only unseen sentences go to Gemini
+    segments, separators = translation_memory.segment(req.text)
+    translated = await translation_memory.lookup(segments, req.target_language)
+    misses = {}
+    for i, seg in enumerate(segments):
+        if i not in translated and translation_memory.needs_translation(seg):
+            misses.setdefault(llm_cache.normalize(seg), []).append(i)
+
+    model_name = MODEL_CANDIDATES[0]
+    try:
+        if misses:
+            unique = [(n, segments[ids[0]]) for n, ids in enumerate(misses.values())]
+            priority = BATCH if req.priority == "batch" else INTERACTIVE
+            new_translations, model_name = await translate_segments(unique, req.target_language, priority)
+            await translation_memory.store([(seg, new_translations[n]) for n, seg in unique], req.target_language)
+            for n, ids in enumerate(misses.values()):
+                for i in ids:
+                    translated[i] = new_translations[n]
+    except CircuitOpen as last_error:
+        metrics.fallback("translate", metrics.error_reason(last_error))
+        result = memory_only(segments, separators, translated)
+        await log_activity(
+            feature="translate",
+            input_text=req.text[:256],
+            output_result=result["translated_text"][:256]
+        )
+        return result
+    except Exception as last_error:
+        print(f"Error calling Gemini: {last_error}")
+        metrics.fallback("translate", metrics.error_reason(last_error))
+        error_result = {
+            "translated_text": "Error: Quota exceeded or service unavailable. Please retry in a bit or upgrade your Gemini plan."
+        }
+        
+        # Log even on error
+        await log_activity(
+            feature="translate",
+            input_text=req.text[:256],
+            output_result="Error"
+        )
+        
+        return error_result
+
+    output = [translated.get(i, seg) for i, seg in enumerate(segments)]
+    result = {"translated_text": translation_memory.join(output, separators)}
+    await llm_cache.put(llm_cache.make_key("translate", model_name, PROMPT_VERSION, req.target_language, req.text), result)
+    add_memory_stats(result, segments, sum(len(ids) for ids in misses.values()))
+    
+    # Log activity
+    await log_activity(
+        feature="translate",
+        input_text=req.text[:256],
+        output_result=result["translated_text"][:256]
+    )
+    
+    return result
 
+@router.post("/feature-3/translate/stream")
+async def translate_text_stream(req: TranslateRequest):
+    """
+    Stream the translation as Server-Sent Events.
+    Token events carry {"token": ...}; the final "done" event carries the full
+    /feature-3/translate result. The activity log row is queued before the final event,
+    so it is written even when the client disconnects as soon as "done" arrives.
+    """
+    # Plain-text output so every streamed token can be shown as-is
     prompt = f"""
     Act as a professional translator.
     
@@ -38,73 +188,70 @@ async def translate_text(req: TranslateRequest):
     Task: Translate the input text accurately into the target language. 
     Maintain the original tone and meaning.
     
-    Return JSON with this EXACT format:
-    {{
-        "translated_text": "Your translated text here"
-    }}
-    Output ONLY Valid JSON.
+    Output ONLY the translated text, with no quotes, labels or explanations.
     """
 
-    last_error = None
-
-    for model_name in model_candidates:
-        model = genai.GenerativeModel(model_name)
-
-        # Try twice per model to gracefully respect short retry windows
-        for _ in range(2):
-            try:
-                response = model.generate_content(prompt)
-                clean_text = response.text.replace("```json", "").replace("```", "").strip()
-                result = json.loads(clean_text)
-                
-                # Log activity
-                try:
-                    db = SessionLocal()
-                    log = ActivityLog(
+    async def events():
+        for model_name in MODEL_CANDIDATES:
+            for version in (PROMPT_VERSION, STREAM_PROMPT_VERSION):
+                cached = await llm_cache.get(llm_cache.make_key("translate", model_name, version, req.target_language, req.text))
+                if cached is not None:
+                    await log_activity(
                         feature="translate",
                         input_text=req.text[:256],
-                        output_result=result.get("translated_text", "")[:256]
+                        output_result=cached.get("translated_text", "")[:256]
                     )
-                    db.add(log)
-                    db.commit()
-                    db.close()
-                except Exception as log_err:
-                    print(f"Log error: {log_err}")
-                
-                return result
-            except g_api_exceptions.ResourceExhausted as e:
-                # Respect server suggested retry delay when present
-                retry_delay = getattr(e, "retry_delay", None)
-                if hasattr(retry_delay, "seconds"):
-                    delay_seconds = max(1, min(30, retry_delay.seconds))
-                elif isinstance(retry_delay, (int, float)):
-                    delay_seconds = max(1, min(30, int(retry_delay)))
-                else:
-                    delay_seconds = 15
-                last_error = e
-                await asyncio.sleep(delay_seconds)
-                continue
-            except Exception as e:  # Keep behavior unchanged for other errors
+                    yield sse_event({"token": cached.get("translated_text", "")})
+                    yield sse_event(cached, event="done")
+                    return
+
+        last_error = None
+        for model_name in MODEL_CANDIDATES:
+            pieces = []
+            try:
+                async for token in generate_stream(prompt, model_name):
+                    pieces.append(token)
+                    yield sse_event({"token": token})
+            except Exception as e:
                 last_error = e
+                if not pieces:
+                    # Nothing sent yet, so the next model can still answer cleanly
+                    continue
                 break
 
-    print(f"Error calling Gemini: {last_error}")
-    error_result = {
-        "translated_text": "Error: Quota exceeded or service unavailable. Please retry in a bit or upgrade your Gemini plan."
-    }
-    
-    # Log even on error
-    try:
-        db = SessionLocal()
-        log = ActivityLog(
+            result = {"translated_text": "".join(pieces).strip()}
+            await llm_cache.put(llm_cache.make_key("translate", model_name, STREAM_PROMPT_VERSION, req.target_language, req.text), result)
+            # Queued before "done": clients often close the stream as soon as it arrives
+            await log_activity(
+                feature="translate",
+                input_text=req.text[:256],
+                output_result=result["translated_text"][:256]
+            )
+            yield sse_event(result, event="done")
+            return
+
+        metrics.fallback("translate", metrics.error_reason(last_error))
+        if isinstance(last_error, CircuitOpen):
+            segments, separators = translation_memory.segment(req.text)
+            translated = await translation_memory.lookup(segments, req.target_language)
+            result = memory_only(segments, separators, translated)
+            await log_activity(
+                feature="translate",
+                input_text=req.text[:256],
+                output_result=result["translated_text"][:256]
+            )
+            yield sse_event({"token": result["translated_text"]})
+            yield sse_event(result, event="done")
+            return
+
+        print(f"Error calling Gemini: {last_error}")
+        await log_activity(
             feature="translate",
             input_text=req.text[:256],
             output_result="Error"
         )
-        db.add(log)
-        db.commit()
-        db.close()
-    except Exception as log_err:
-        print(f"Log error: {log_err}")
-    
-    return error_result
\ No newline at end of file
+        yield sse_event({
+            "translated_text": "Error: Quota exceeded or service unavailable. Please retry in a bit or upgrade your Gemini plan."
+        }, event="error")
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
\ No newline at end of file
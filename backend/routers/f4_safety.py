@@ -1,20 +1,54 @@
 from fastapi import APIRouter
-import google.generativeai as genai
-import os
+import asyncio
 import json
-from dotenv import load_dotenv
-from database import SessionLocal, ActivityLog
-
-load_dotenv()
-api_key = os.getenv("GEMINI_API_KEY")
-genai.configure(api_key=api_key)
+import os
+import re
+from log_writer import log_activity
+from gemini_client import generate, DEFAULT_MODEL, INTERACTIVE, BATCH, CircuitOpen
+import circuit_breaker
+import llm_cache
+import safety_filter
+import trending_terms
+import metrics
 
 router = APIRouter()
 
+# Bump when the safety prompt changes so cached results are not reused
+PROMPT_VERSION = "v1"
+
+# Batch moderation: texts per packed prompt, and packed prompts in flight per request
+BATCH_CHUNK_SIZE = int(os.getenv("SAFETY_BATCH_CHUNK_SIZE", "25"))
+BATCH_CONCURRENCY = int(os.getenv("SAFETY_BATCH_CONCURRENCY", "8"))
+
+def keyword_verdict(text):
+    """Local keyword fallback used when the model output cannot be parsed"""
+    hits = safety_filter.scan(text)
+    matched = [term for term, _ in hits["block"] + hits["flag"]]
+    is_unsafe = bool(matched)
+    return {
+        "status": "Unsafe" if is_unsafe else "Safe",
+        "type": "Detected Issue" if is_unsafe else "Verified Content",
+        "confidence": "75%",
+        "sources": ["Gemini AI"],
+        "issues": matched or ["Content analysis performed"]
+    }
+
+def add_flagged(result, flagged):
+    """Report pre-filter flagged terms alongside the model's issues"""
+    if flagged:
+        issues = list(result.get("issues") or [])
+        result["issues"] = issues + [term for term in flagged if term not in issues]
+    return result
+
 @router.get("/feature-4")
 async def feature_four_test():
     return {"message": "Safety Shield Ready"}
 
+@router.post("/feature-4/safety/reload")
+async def reload_safety_lists():
+    """Rebuild the pre-filter automaton from the block/allow list files"""
+    return safety_filter.reload()
+
 @router.post("/feature-4/safety")
 async def verify_content(request: dict):
     """
@@ -23,6 +57,9 @@ async def verify_content(request: dict):
     """
     try:
         text = request.get("text", "")
+        trending_terms.observe(text)
+        # Background jobs queue behind interactive requests
+        priority = BATCH if request.get("priority") == "batch" else INTERACTIVE
         if not text:
             return {
                 "status": "Safe",
@@ -30,8 +67,26 @@ async def verify_content(request: dict):
                 "confidence": "100%",
                 "sources": ["System Default"]
             }
-        
-        model = genai.GenerativeModel('gemini-2.5-flash')
+
+        # Obvious Unsafe / trivially Safe content never reaches the LLM
+        verdict, flagged = safety_filter.prefilter(text)
+        if verdict is not None:
+            await log_activity(
+                feature="safety",
+                input_text=text[:256],
+                output_result=verdict["status"]
+            )
+            return verdict
+
+        cache_key = llm_cache.make_key("safety", DEFAULT_MODEL, PROMPT_VERSION, text)
+        cached = await llm_cache.get(cache_key)
+        if cached is not None:
+            await log_activity(
+                feature="safety",
+                input_text=text[:256],
+                output_result=cached.get("status", "Unknown")
+            )
+            return cached
         
         # Detailed safety analysis prompt
         prompt = f"""Analyze the following content for safety issues and credibility.
@@ -50,7 +105,7 @@ Content to analyze:
 
 Respond with JSON only."""
 
-        response = model.generate_content(prompt)
+        response = await generate(prompt, priority=priority)
         response_text = response.text.strip()
         
         # Clean up markdown if present
@@ -67,52 +122,46 @@ Respond with JSON only."""
         # Add default sources
         if "sources" not in result:
             result["sources"] = ["Gemini AI", "Content Filter"]
+        add_flagged(result, flagged)
+
+        await llm_cache.put(cache_key, result)
         
         # Log activity
-        try:
-            db = SessionLocal()
-            log = ActivityLog(
-                feature="safety",
-                input_text=text[:256],
-                output_result=result.get("status", "Unknown")
-            )
-            db.add(log)
-            db.commit()
-            db.close()
-        except Exception as log_err:
-            print(f"Log error: {log_err}")
+        await log_activity(
+            feature="safety",
+            input_text=text[:256],
+            output_result=result.get("status", "Unknown")
+        )
         
         return result
         
     except json.JSONDecodeError as e:
         print(f"JSON Parse Error: {e}")
+        metrics.fallback("safety", "parse_error")
         # Fallback for JSON parsing errors
-        is_unsafe = any(word in text.lower() for word in ["hate", "kill", "fake", "lie", "scam", "spam", "abuse"])
-        result = {
-            "status": "Unsafe" if is_unsafe else "Safe",
-            "type": "Detected Issue" if is_unsafe else "Verified Content",
-            "confidence": "75%",
-            "sources": ["Gemini AI"],
-            "issues": ["Content analysis performed"]
-        }
+        result = keyword_verdict(text)
         
         # Log activity
-        try:
-            db = SessionLocal()
-            log = ActivityLog(
-                feature="safety",
-                input_text=text[:256],
-                output_result=result["status"]
-            )
-            db.add(log)
-            db.commit()
-            db.close()
-        except Exception as log_err:
-            print(f"Log error: {log_err}")
+        await log_activity(
+            feature="safety",
+            input_text=text[:256],
+            output_result=result["status"]
+        )
         
+        return result
+    except CircuitOpen as e:
+        # Gemini is failing: judge from the block/flag lists right away
+        metrics.fallback("safety", metrics.error_reason(e))
+        result = circuit_breaker.degraded(keyword_verdict(text))
+        await log_activity(
+            feature="safety",
+            input_text=text[:256],
+            output_result=result["status"]
+        )
         return result
     except Exception as e:
         print(f"Error: {e}")
+        metrics.fallback("safety", metrics.error_reason(e))
         result = {
             "status": "Safe",
             "type": "Analysis Failed",
@@ -121,44 +170,118 @@ Respond with JSON only."""
         }
         
         # Log activity
-        try:
-            db = SessionLocal()
-            log = ActivityLog(
-                feature="safety",
-                input_text=text[:256],
-                output_result="Error"
-            )
-            db.add(log)
-            db.commit()
-            db.close()
-        except Exception as log_err:
-            print(f"Log error: {log_err}")
+        await log_activity(
+            feature="safety",
+            input_text=text[:256],
+            output_result="Error"
+        )
         
         return result
 
+async def verify_chunk(items, semaphore):
+    """Verify one packed chunk of (index, text, flagged terms) with a single Gemini call"""
+    payload = json.dumps([{"id": i, "text": text} for i, text, _ in items], ensure_ascii=False)
+    prompt = f"""Analyze each of the following content items for safety issues and credibility.
+
+Respond ONLY with a JSON array (no markdown, no extra text) containing one object per item:
+[{{"id": 0, "status": "Safe|Unsafe", "type": "content_type", "confidence": "XX%", "issues": ["issue1", "issue2"]}}]
+
+Where:
+- id: the id of the item being judged
+- status: Safe if content is appropriate, Unsafe if it contains hate speech, misinformation, or harmful content
+- type: Brief description (e.g., "Credible News", "Potential Misinformation", "Hate Speech", "Cyberbullying", "Spam")
+- confidence: Confidence level (e.g., "95%", "85%", "70%")
+- issues: Array of detected issues (empty if safe)
+
+Items to analyze (JSON):
+{payload}
+
+Respond with the JSON array only."""
+
+    verdicts = {}
+    try:
+        async with semaphore:
+            response = await generate(prompt, priority=BATCH)
+        match = re.search(r'\[.*\]', response.text, re.DOTALL)
+        parsed = json.loads(match.group(0)) if match else []
+        for entry in parsed:
+            if isinstance(entry, dict) and entry.get("status") in ("Safe", "Unsafe"):
+                verdicts[entry.get("id")] = entry
+    except json.JSONDecodeError as e:
+        print(f"Batch JSON Parse Error: {e}")
+    except CircuitOpen as e:
+        metrics.fallback("safety", metrics.error_reason(e))
+        return {i: circuit_breaker.degraded(keyword_verdict(text)) for i, text, _ in items}
+    except Exception as e:
+        print(f"Batch Error: {e}")
+        metrics.fallback("safety", metrics.error_reason(e))
+        return {i: {
+            "status": "Safe",
+            "type": "Analysis Failed",
+            "confidence": "50%",
+            "sources": ["Fallback"]
+        } for i, _, _ in items}
+
+    results = {}
+    for i, text, flagged in items:
+        entry = verdicts.get(i)
+        if entry is None:
+            # Missing or malformed verdict for this item only
+            metrics.fallback("safety", "parse_error")
+            results[i] = keyword_verdict(text)
+            continue
+        results[i] = add_flagged({
+            "status": entry["status"],
+            "type": entry.get("type", "Unknown"),
+            "confidence": entry.get("confidence", "75%"),
+            "issues": entry.get("issues", []),
+            "sources": entry.get("sources", ["Gemini AI", "Content Filter"])
+        }, flagged)
+    return results
+
 @router.post("/feature-4/safety/batch")
 async def batch_verify(request: dict):
-    """Verify multiple content pieces at once"""
+    """
+    Verify many content pieces at once.
+    Texts are packed BATCH_CHUNK_SIZE per prompt and the chunks run concurrently.
+    Each result has the same fields as /feature-4/safety plus the (truncated) text.
+    A single text may be given as a string.
+    """
     try:
-        texts = request.get("texts", [])
-        results = []
-        
-        for text in texts[:5]:  # Limit to 5 items per batch
-            model = genai.GenerativeModel('gemini-2.5-flash')
-            prompt = f"""Quick safety check - is this safe? Reply only: Safe/Unsafe
-            
-Content: "{text}"
-
-Reply: """
-            
-            response = model.generate_content(prompt)
-            is_safe = "safe" in response.text.lower()
-            
-            results.append({
-                "text": text[:100],
-                "status": "Safe" if is_safe else "Unsafe"
-            })
-        
+        texts = request.get("texts") or []
+        if isinstance(texts, str):
+            texts = [texts]
+        if not isinstance(texts, list):
+            return {"error": "texts must be a list of strings", "results": []}
+        texts = [str(t) for t in texts]
+        for text in texts:
+            trending_terms.observe(text)
+        chunk_size = max(1, int(request.get("chunk_size", BATCH_CHUNK_SIZE)))
+        concurrency = max(1, min(BATCH_CONCURRENCY, int(request.get("concurrency", BATCH_CONCURRENCY))))
+
+        verdicts = {}
+        pending = []
+        for i, text in enumerate(texts):
+            if not text:
+                verdicts[i] = {
+                    "status": "Safe",
+                    "type": "Empty Content",
+                    "confidence": "100%",
+                    "sources": ["System Default"]
+                }
+            else:
+                verdict, flagged = safety_filter.prefilter(text)
+                if verdict is not None:
+                    verdicts[i] = verdict
+                else:
+                    pending.append((i, text, flagged))
+
+        semaphore = asyncio.Semaphore(concurrency)
+        chunks = [pending[n:n + chunk_size] for n in range(0, len(pending), chunk_size)]
+        for chunk_result in await asyncio.gather(*(verify_chunk(chunk, semaphore) for chunk in chunks)):
+            verdicts.update(chunk_result)
+
+        results = [{"text": text[:100], **verdicts[i]} for i, text in enumerate(texts)]
         return {"results": results}
     except Exception as e:
         print(f"Batch Error: {e}")
@@ -1,78 +1,105 @@
 from fastapi import APIRouter
-import google.generativeai as genai
-import os
-from database import SessionLocal, ActivityLog
-import json
+from log_writer import log_activity
+from gemini_client import generate, DEFAULT_MODEL, INTERACTIVE, BATCH, CircuitOpen
+import circuit_breaker
+from datetime import datetime
+import asyncio
+import llm_cache
+import topic_trends
+import trending_terms
+import metrics
 
 router = APIRouter()
 
-# Configure Gemini API
-api_key = os.getenv("GEMINI_API_KEY", "your-key-here")
-genai.configure(api_key=api_key)
+# Bump when the forecast prompt changes so cached results are not reused
+PROMPT_VERSION = "v1"
 
 @router.get("/feature-5")
 async def feature_five_test():
     return {"message": "Insights Analysis Ready"}
 
+@router.get("/feature-5/trending")
+async def trending(window: str = "hour", limit: int = 20):
+    """
+    Top terms and two-word phrases across sentiment, safety and summary inputs.
+    window is "hour" or "day"; scores are time-decayed mention counts.
+    """
+    if window not in trending_terms.WINDOWS:
+        window = "hour"
+    return trending_terms.trending(window, max(1, min(limit, trending_terms.TOP_K)))
+
+def default_forecast(prediction):
+    return {
+        "Rising": "Positive outlook",
+        "Falling": "Cooling interest",
+    }.get(prediction, "Steady interest")
+
+async def sentiment_forecast(topic, prediction, priority=INTERACTIVE):
+    """Short Gemini forecast text; cached per topic, trend and day"""
+    cache_key = llm_cache.make_key("insights", DEFAULT_MODEL, PROMPT_VERSION, topic, prediction, datetime.utcnow().strftime("%Y-%m-%d"))
+    cached = await llm_cache.get(cache_key)
+    if cached is not None:
+        return cached["sentiment_forecast"]
+
+    prompt = f"""Topic: {topic}
+    Measured trend: {prediction}
+    Give a one-sentence sentiment forecast for this topic. Respond with the sentence only."""
+    response = await generate(prompt, priority=priority)
+    forecast = response.text.strip().split("\n")[0] or default_forecast(prediction)
+    await llm_cache.put(cache_key, {"sentiment_forecast": forecast})
+    return forecast
+
 @router.post("/feature-5/insights")
 async def get_insights(request: dict):
+    """
+    Topic volume series from the topic_rollup table plus a local trend estimate.
+    Optional "granularity" (daily|hourly) and "points" select the chart window.
+    """
+    # The body is untyped JSON: non-string values are used as text rather than failing
+    topic = str(request.get("topic") or "Technology")
+    granularity = str(request.get("granularity") or "daily")
+    if granularity not in topic_trends.GRANULARITIES:
+        granularity = "daily"
     try:
-        topic = request.get("topic", "Technology")
-        
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        prompt = f"""Analyze trending insights for: {topic}
-        Respond with: trend_prediction (Rising/Stable/Falling), volume (number), sentiment_forecast (text)
-        Format: trend_prediction|volume|sentiment_forecast"""
-        
-        response = model.generate_content(prompt)
-        text = response.text.strip()
-        parts = text.split("|")
-        
-        result = {
-            "trend_prediction": parts[0] if len(parts) > 0 else "Rising",
-            "volume": parts[1] if len(parts) > 1 else "1.2M",
-            "sentiment_forecast": parts[2] if len(parts) > 2 else "Positive outlook",
-            "demographics": ["Gen Z", "Tech Professionals"],
-            "chart_data": [30, 45, 40, 60, 55, 80, 95]
-        }
-        
-        # Log activity
-        try:
-            db = SessionLocal()
-            log = ActivityLog(
-                feature="insights",
-                input_text=topic[:256],
-                output_result=result["trend_prediction"]
-            )
-            db.add(log)
-            db.commit()
-            db.close()
-        except Exception as log_err:
-            print(f"Log error: {log_err}")
-        
-        return result
+        points = int(request.get("points", 7 if granularity == "daily" else 24))
+    except (TypeError, ValueError):
+        points = 7
+    points = max(2, min(points, topic_trends.MAX_POINTS[granularity]))
+
+    try:
+        chart_data = await asyncio.to_thread(topic_trends.series, topic, granularity, points)
     except Exception as e:
         print(f"Error: {e}")
-        result = {
-            "trend_prediction": "Rising",
-            "volume": "1.2M",
-            "sentiment_forecast": "Positive outlook",
-            "demographics": ["General Audience"],
-            "chart_data": [30, 45, 40, 60, 55, 80, 95]
-        }
-        
-        # Log activity
-        try:
-            db = SessionLocal()
-            log = ActivityLog(
-                feature="insights",
-                input_text=topic[:256],
-                output_result="Error"
-            )
-            db.add(log)
-            db.commit()
-            db.close()
-        except Exception as log_err:
-            print(f"Log error: {log_err}")
-        
-        return result
\ No newline at end of file
+        metrics.fallback("insights", "error")
+        chart_data = [0] * points
+    estimate = topic_trends.trend(chart_data)
+
+    result = {
+        "trend_prediction": estimate["trend_prediction"],
+        "volume": topic_trends.format_volume(sum(chart_data)),
+        "sentiment_forecast": default_forecast(estimate["trend_prediction"]),
+        "demographics": ["General Audience"],
+        "chart_data": chart_data,
+        "granularity": granularity,
+        "trend": estimate,
+    }
+
+    try:
+        priority = BATCH if request.get("priority") == "batch" else INTERACTIVE
+        result["sentiment_forecast"] = await sentiment_forecast(topic, estimate["trend_prediction"], priority)
+    except CircuitOpen as e:
+        # Keep the local forecast text
+        metrics.fallback("insights", metrics.error_reason(e))
+        circuit_breaker.degraded(result)
+    except Exception as e:
+        print(f"Error: {e}")
+        metrics.fallback("insights", metrics.error_reason(e))
+
+    # Log activity
+    await log_activity(
+        feature="insights",
+        input_text=topic[:256],
+        output_result=result["trend_prediction"]
+    )
+
+    return result
@@ -1,14 +1,132 @@
 from fastapi import APIRouter
-import google.generativeai as genai
-import os
-from database import SessionLocal, ActivityLog
+from fastapi.responses import StreamingResponse
+from log_writer import log_activity
+from gemini_client import generate, generate_stream, estimate_tokens, DEFAULT_MODEL, INTERACTIVE, BATCH, CircuitOpen
+import circuit_breaker
+from sse import sse_event, SSE_HEADERS
+import llm_cache
+import trending_terms
+import metrics
+import asyncio
+import hashlib
 import json
+import os
+import re
 
 router = APIRouter()
 
-# Configure Gemini API
-api_key = os.getenv("GEMINI_API_KEY", "your-key-here")
-genai.configure(api_key=api_key)
+# Bump when the summary prompt changes so cached results are not reused
+PROMPT_VERSION = "v1"
+CHUNK_PROMPT_VERSION = "v1"
+
+# Map-reduce mode: documents above SUMMARY_CHUNK_TOKENS are split into chunks of at most
+# that many tokens, summarized concurrently, then the partial summaries are reduced.
+# Chunk boundaries are content-defined (see is_boundary), so editing one paragraph only
+# changes the chunk around it and the other chunk summaries come from the cache.
+CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "3000"))
+CHUNK_MIN_TOKENS = CHUNK_TOKENS // 4
+CHUNK_CONCURRENCY = int(os.getenv("SUMMARY_CHUNK_CONCURRENCY", "8"))
+
+def split_units(text):
+    """Paragraphs, falling back to sentences (then raw slices) for paragraphs over budget"""
+    units = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if estimate_tokens(paragraph) <= CHUNK_TOKENS:
+            units.append(paragraph)
+            continue
+        for sentence in re.split(r"(?<=[.!?])\s+", paragraph):
+            if estimate_tokens(sentence) <= CHUNK_TOKENS:
+                units.append(sentence)
+            else:
+                step = CHUNK_TOKENS * 4
+                units.extend(sentence[n:n + step] for n in range(0, len(sentence), step))
+    return units
+
+def is_boundary(unit):
+    """
+    Whether a chunk may end after this unit. Depends only on the unit's own text, with a
+    chance proportional to its size, so chunks average roughly 60% of CHUNK_TOKENS
+    whatever the paragraph lengths.
+    """
+    digest = hashlib.blake2b(unit.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") < estimate_tokens(unit) * 2 ** 64 // max(1, CHUNK_TOKENS // 2)
+
+def pack_units(units):
+    """Join units into chunks of at most CHUNK_TOKENS, cutting at content-defined boundaries"""
+    chunks, current, used = [], [], 0
+    for unit in units:
+        cost = estimate_tokens(unit)
+        if current and used + cost > CHUNK_TOKENS:
+            chunks.append("\n\n".join(current))
+            current, used = [], 0
+        current.append(unit)
+        used += cost
+        if used >= CHUNK_MIN_TOKENS and is_boundary(unit):
+            chunks.append("\n\n".join(current))
+            current, used = [], 0
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+async def summarize_chunk(chunk, semaphore, priority=INTERACTIVE):
+    """Summarize one section; cached so unchanged sections of an edited document are reused"""
+    cache_key = llm_cache.make_key("summary-chunk", DEFAULT_MODEL, CHUNK_PROMPT_VERSION, chunk)
+    cached = await llm_cache.get(cache_key)
+    if cached is not None:
+        return cached["summary"]
+    prompt = f"""Summarize this section of a longer document in one short paragraph.
+Keep the key facts, names and numbers:
+
+{chunk}"""
+    async with semaphore:
+        response = await generate(prompt, priority=priority)
+    summary = response.text.strip()
+    await llm_cache.put(cache_key, {"summary": summary})
+    return summary
+
+async def map_reduce_prompt(text, priority=INTERACTIVE):
+    """Summarize chunks concurrently and reduce them until they fit one final prompt"""
+    semaphore = asyncio.Semaphore(CHUNK_CONCURRENCY)
+    chunks = pack_units(split_units(text))
+    parts = await asyncio.gather(*(summarize_chunk(chunk, semaphore, priority) for chunk in chunks))
+
+    while len(parts) > 1 and estimate_tokens("\n\n".join(parts)) > CHUNK_TOKENS:
+        groups = pack_units(parts)
+        if len(groups) >= len(parts):
+            break
+        parts = await asyncio.gather(*(summarize_chunk(group, semaphore, priority) for group in groups))
+
+    combined = "\n\n".join(parts)
+    prompt = f"""These are summaries of consecutive sections of one document.
+Summarize the whole document in 2-3 sentences. Keep it concise and clear:
+
+{combined}"""
+    return prompt, len(chunks)
+
+async def map_reduce_summary(text, priority=INTERACTIVE):
+    """Map-reduce summary of a long document; returns (summary, chunk count)"""
+    prompt, chunk_count = await map_reduce_prompt(text, priority)
+    response = await generate(prompt, priority=priority)
+    return response.text.strip(), chunk_count
+
+def lead_summary(text):
+    """Degraded extractive summary (the first few sentences) served while Gemini's circuit is open"""
+    sentences = [s for s in re.split(r"(?<=[.!?])\s+", " ".join(text.split())) if s]
+    summary = " ".join(sentences[:3])
+    if len(summary) > 600:
+        summary = summary[:600].rsplit(" ", 1)[0] + "..."
+    return circuit_breaker.degraded({
+        "summary": summary,
+        "compression_ratio": f"{round(len(summary)/len(text)*100, 1)}%"
+    })
+
+def summary_prompt(text):
+    return f"""Summarize this text in 2-3 sentences. Keep it concise and clear:
+        
+        {text}"""
 
 @router.get("/feature-6")
 async def feature_six_test():
@@ -18,53 +136,147 @@ async def feature_six_test():
 async def summarize_text(request: dict):
     try:
         text = request.get("text", "")
+        trending_terms.observe(text)
         if not text or len(text) < 50:
             return {"summary": text}
+
+        # mode: "auto" (default) chunks only documents over the budget, "chunked" always does
+        mode = request.get("mode", "auto")
+        chunked = mode == "chunked" or (mode == "auto" and estimate_tokens(text) > CHUNK_TOKENS)
+        # Bulk callers (e.g. NDJSON ingestion) queue behind interactive requests
+        priority = BATCH if request.get("priority") == "batch" else INTERACTIVE
+
+        cache_key = llm_cache.make_key("summary", DEFAULT_MODEL, PROMPT_VERSION, text)
+        result = await llm_cache.get(cache_key)
+        if result is None and chunked:
+            summary, chunk_count = await map_reduce_summary(text, priority)
+            result = {
+                "summary": summary,
+                "compression_ratio": f"{round(len(summary)/len(text)*100, 1)}%",
+                "chunks": chunk_count
+            }
+            await llm_cache.put(cache_key, result)
+        elif result is None:
+            response = await generate(summary_prompt(text), priority=priority)
+            summary = response.text.strip()
         
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        prompt = f"""Summarize this text in 2-3 sentences. Keep it concise and clear:
-        
-        {text}"""
-        
-        response = model.generate_content(prompt)
-        summary = response.text.strip()
-        
-        result = {
-            "summary": summary,
-            "compression_ratio": f"{round(len(summary)/len(text)*100, 1)}%"
-        }
+            result = {
+                "summary": summary,
+                "compression_ratio": f"{round(len(summary)/len(text)*100, 1)}%"
+            }
+            await llm_cache.put(cache_key, result)
+        summary = result["summary"]
         
         # Log activity
-        try:
-            db = SessionLocal()
-            log = ActivityLog(
-                feature="summary",
-                input_text=text[:256],
-                output_result=summary[:256]
-            )
-            db.add(log)
-            db.commit()
-            db.close()
-        except Exception as log_err:
-            print(f"Log error: {log_err}")
+        await log_activity(
+            feature="summary",
+            input_text=text[:256],
+            output_result=summary[:256]
+        )
         
+        return result
+    except CircuitOpen as e:
+        # Gemini is failing: answer with the lead sentences right away, uncached
+        metrics.fallback("summary", metrics.error_reason(e))
+        result = lead_summary(text)
+        await log_activity(
+            feature="summary",
+            input_text=text[:256],
+            output_result=result["summary"][:256]
+        )
         return result
     except Exception as e:
         print(f"Error: {e}")
+        metrics.fallback("summary", metrics.error_reason(e))
         result = {"summary": "Summary generation failed", "compression_ratio": "0%"}
         
         # Log activity
+        await log_activity(
+            feature="summary",
+            input_text=text[:256] if text else "empty",
+            output_result="Error"
+        )
+        
+        return result
+
+@router.post("/feature-6/summary/stream")
+async def summarize_text_stream(request: dict):
+    """
+    Stream the summary as Server-Sent Events.
+    Token events carry {"token": ...}; the final "done" event carries the full
+    /feature-6/summary result including compression_ratio. Long documents run the
+    map phase first and stream only the final reduce step.
+    """
+    # The body is untyped JSON: non-string text is summarized as its string form
+    text = str(request.get("text") or "")
+    mode = request.get("mode", "auto")
+    trending_terms.observe(text)
+
+    async def events():
+        if not text or len(text) < 50:
+            yield sse_event({"summary": text}, event="done")
+            return
+
+        cache_key = llm_cache.make_key("summary", DEFAULT_MODEL, PROMPT_VERSION, text)
+        cached = await llm_cache.get(cache_key)
+        if cached is not None:
+            await log_activity(
+                feature="summary",
+                input_text=text[:256],
+                output_result=cached["summary"][:256]
+            )
+            yield sse_event({"token": cached["summary"]})
+            yield sse_event(cached, event="done")
+            return
+
+        pieces = []
+        chunk_count = None
         try:
-            db = SessionLocal()
-            log = ActivityLog(
+            chunked = mode == "chunked" or (mode == "auto" and estimate_tokens(text) > CHUNK_TOKENS)
+            if chunked:
+                prompt, chunk_count = await map_reduce_prompt(text)
+            else:
+                prompt = summary_prompt(text)
+            async for token in generate_stream(prompt):
+                pieces.append(token)
+                yield sse_event({"token": token})
+        except CircuitOpen as e:
+            # Raised before any token is sent, so the lead sentences can still answer
+            metrics.fallback("summary", metrics.error_reason(e))
+            result = lead_summary(text)
+            await log_activity(
                 feature="summary",
-                input_text=text[:256] if text else "empty",
+                input_text=text[:256],
+                output_result=result["summary"][:256]
+            )
+            yield sse_event({"token": result["summary"]})
+            yield sse_event(result, event="done")
+            return
+        except Exception as e:
+            print(f"Error: {e}")
+            metrics.fallback("summary", metrics.error_reason(e))
+            await log_activity(
+                feature="summary",
+                input_text=text[:256],
                 output_result="Error"
             )
-            db.add(log)
-            db.commit()
-            db.close()
-        except Exception as log_err:
-            print(f"Log error: {log_err}")
-        
-        return result
\ No newline at end of file
+            yield sse_event({"summary": "Summary generation failed", "compression_ratio": "0%"}, event="error")
+            return
+
+        summary = "".join(pieces).strip()
+        result = {
+            "summary": summary,
+            "compression_ratio": f"{round(len(summary)/len(text)*100, 1)}%"
+        }
+        if chunk_count is not None:
+            result["chunks"] = chunk_count
+        await llm_cache.put(cache_key, result)
+        # Queued before "done": clients often close the stream as soon as it arrives
+        await log_activity(
+            feature="summary",
+            input_text=text[:256],
+            output_result=summary[:256]
+        )
+        yield sse_event(result, event="done")
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
\ No newline at end of file
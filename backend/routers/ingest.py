@@ -0,0 +1,34 @@
+from fastapi import APIRouter, Request
+from fastapi.responses import StreamingResponse
+import json
+import ingest_pipeline
+
+router = APIRouter()
+
+@router.post("/ingest/ndjson")
+async def ingest_ndjson(request: Request, job_id: str = None, stages: str = ",".join(ingest_pipeline.STAGE_NAMES)):
+    """
+    Run an NDJSON body ({"id": ..., "text": ...} per line) through the sentiment,
+    safety and summary stages. Results stream back as NDJSON in input order, and the
+    final line is {"done": true, ...} with per-stage throughput. Sending the same
+    job_id again resumes after the last line the previous run emitted.
+    """
+    try:
+        selected = ingest_pipeline.parse_stages(stages)
+    except ValueError as e:
+        return {"error": str(e), "available_stages": list(ingest_pipeline.STAGE_NAMES)}
+    pipeline = ingest_pipeline.Pipeline(selected, job_id)
+    # The upload goes to a temporary file first; the pipeline then reads it incrementally
+    upload = await ingest_pipeline.spool(request.stream())
+
+    async def results():
+        try:
+            async for result in pipeline.run(ingest_pipeline.read_lines(ingest_pipeline.file_chunks(upload))):
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+        except Exception as e:
+            print(f"Ingest error: {e}")
+            yield json.dumps({"done": False, "error": str(e)}) + "\n"
+        finally:
+            upload.close()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
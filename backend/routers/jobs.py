@@ -0,0 +1,40 @@
+from fastapi import APIRouter
+from pydantic import BaseModel
+import job_queue
+
+router = APIRouter()
+
+class JobRequest(BaseModel):
+    kind: str  # one of job_queue.HANDLERS, e.g. "summary", "translate", "safety_batch"
+    payload: dict  # same body the matching endpoint takes
+    idempotency_key: str | None = None
+
+@router.post("/jobs")
+async def submit_job(req: JobRequest):
+    """
+    Queue a long-running analysis and return its job id right away.
+    Identical work (same kind and payload, or same idempotency_key) returns the existing job.
+    """
+    try:
+        return await job_queue.submit(req.kind, req.payload, req.idempotency_key)
+    except ValueError as e:
+        return {"error": str(e), "kinds": list(job_queue.HANDLERS)}
+
+@router.get("/jobs/stats")
+async def job_stats():
+    return job_queue.stats()
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Job status; succeeded jobs include the stored result, failed ones any fallback answer"""
+    job = await job_queue.get(job_id)
+    if job is None:
+        return {"job_id": job_id, "status": "not_found"}
+    return job
+
+@router.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    job = await job_queue.cancel(job_id)
+    if job is None:
+        return {"job_id": job_id, "status": "not_found"}
+    return job
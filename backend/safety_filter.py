@@ -0,0 +1,185 @@
+import os
+import re
+from collections import deque
+
+# Safety pre-filter.
+# Block/flag/allow terms are compiled into one Aho-Corasick automaton, so a post is
+# scanned in a single linear pass no matter how many terms are loaded.
+# Text and terms are normalized the same way (lowercase, leetspeak folded,
+# punctuation collapsed to single spaces) and matches must sit on word boundaries.
+#
+# List files are plain text, one entry per line, '#' for comments:
+#   blocklist: term,category,severity   (severity: block = Unsafe without the LLM,
+#                                        flag = reported in issues, LLM still decides)
+#   allowlist: term                      (text made only of allowlisted terms is Safe)
+
+LISTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "safety_lists")
+BLOCKLIST_PATH = os.getenv("SAFETY_BLOCKLIST_PATH", os.path.join(LISTS_DIR, "blocklist.txt"))
+ALLOWLIST_PATH = os.getenv("SAFETY_ALLOWLIST_PATH", os.path.join(LISTS_DIR, "allowlist.txt"))
+
+LEET_MAP = str.maketrans({
+    "0": "o", "1": "i", "3": "e", "4": "a", "5": "s", "7": "t", "8": "b", "@": "a", "$": "s",
+})
+
+_WORD_RE = re.compile(r"[\w@$]+")
+
+
+def _fold(match):
+    word = match.group(0)
+    # Only fold words that also contain letters, so plain numbers like 2024 stay intact
+    if any(ch.isalpha() for ch in word):
+        word = word.translate(LEET_MAP)
+    return word
+
+
+def normalize(text):
+    """Lowercase, fold leetspeak and collapse everything else that is not alphanumeric"""
+    folded = _WORD_RE.sub(_fold, text.lower())
+    return " ".join("".join(ch if ch.isalnum() else " " for ch in folded).split())
+
+
+class Automaton:
+    """Aho-Corasick automaton over normalized terms"""
+
+    def __init__(self, entries):
+        # entries: list of (term, kind, category); kind is block, flag or allow
+        self.goto = [{}]
+        self.fail = [0]
+        self.outputs = [[]]
+        self.entries = []
+        for term, kind, category in entries:
+            term = normalize(term)
+            if not term:
+                continue
+            self.entries.append((term, kind, category))
+            self._insert(term, len(self.entries) - 1)
+        self._build()
+
+    def _insert(self, term, index):
+        node = 0
+        for ch in term:
+            nxt = self.goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[node][ch] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.outputs.append([])
+            node = nxt
+        self.outputs[node].append(index)
+
+    def _build(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self.goto[node].items():
+                queue.append(nxt)
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.outputs[nxt] = self.outputs[nxt] + self.outputs[self.fail[nxt]]
+
+    def scan(self, normalized):
+        """Yield (start, end, entry) for every whole-word match in normalized text"""
+        node = 0
+        goto, fail, outputs, entries = self.goto, self.fail, self.outputs, self.entries
+        length = len(normalized)
+        for pos, ch in enumerate(normalized):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for index in outputs[node]:
+                term = entries[index][0]
+                start = pos - len(term) + 1
+                end = pos + 1
+                if (start == 0 or normalized[start - 1] == " ") and (end == length or normalized[end] == " "):
+                    yield start, end, entries[index]
+
+
+def _read_lines(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+
+def load_entries(blocklist_path=BLOCKLIST_PATH, allowlist_path=ALLOWLIST_PATH):
+    entries = []
+    for line in _read_lines(blocklist_path):
+        parts = [p.strip() for p in line.split(",")]
+        term = parts[0]
+        category = parts[1] if len(parts) > 1 and parts[1] else "Harmful Content"
+        kind = parts[2] if len(parts) > 2 and parts[2] in ("block", "flag") else "block"
+        entries.append((term, kind, category))
+    for term in _read_lines(allowlist_path):
+        entries.append((term, "allow", None))
+    return entries
+
+
+_automaton = Automaton(load_entries())
+
+
+def reload():
+    """Rebuild the automaton from the list files; the old one serves until the swap"""
+    global _automaton
+    _automaton = Automaton(load_entries())
+    return stats()
+
+
+def stats():
+    kinds = {"block": 0, "flag": 0, "allow": 0}
+    for _, kind, _ in _automaton.entries:
+        kinds[kind] += 1
+    return {**kinds, "states": len(_automaton.goto)}
+
+
+def scan(text):
+    """
+    Scan text once and group the matches.
+    Returns {"block": [(term, category)], "flag": [(term, category)], "all_allowed": bool}
+    """
+    normalized = normalize(text)
+    hits = {"block": [], "flag": []}
+    covered = [False] * len(normalized)
+    seen = set()
+    for start, end, (term, kind, category) in _automaton.scan(normalized):
+        if kind == "allow":
+            for i in range(start, end):
+                covered[i] = True
+        elif term not in seen:
+            seen.add(term)
+            hits[kind].append((term, category))
+    all_allowed = bool(normalized) and all(c or ch == " " for c, ch in zip(covered, normalized))
+    hits["all_allowed"] = all_allowed
+    return hits
+
+
+def prefilter(text):
+    """
+    Decide obvious cases without the LLM.
+    Returns (verdict or None, flagged terms). verdict has the /feature-4/safety shape.
+    """
+    hits = scan(text)
+    flagged = [term for term, _ in hits["flag"]]
+    if hits["block"]:
+        categories = []
+        for _, category in hits["block"]:
+            if category not in categories:
+                categories.append(category)
+        return {
+            "status": "Unsafe",
+            "type": categories[0],
+            "confidence": "95%",
+            "issues": [term for term, _ in hits["block"]] + flagged,
+            "sources": ["Safety Pre-filter"]
+        }, flagged
+    if hits["all_allowed"] and not flagged:
+        return {
+            "status": "Safe",
+            "type": "Verified Content",
+            "confidence": "95%",
+            "issues": [],
+            "sources": ["Safety Pre-filter"]
+        }, flagged
+    return None, flagged
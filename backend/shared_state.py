@@ -0,0 +1,269 @@
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from contextlib import contextmanager
+
+# State shared between uvicorn worker processes on one machine.
+# Multi-worker mode is on when WEB_CONCURRENCY > 1 (the variable uvicorn and
+# gunicorn read for their worker count). A small SQLite file next to the main
+# database then holds:
+#   - the Gemini quota buckets, which processes draw short leases from,
+#   - worker heartbeats, so work owned by a dead process can be taken over,
+#   - "run at most once per interval" claims for jobs like log maintenance,
+#   - per-worker snapshots (trending sketches, metrics) that readers merge.
+# Long one-off startup work (schema setup, backfills) is serialized by task_lock(),
+# which uses separate lock files so it never holds this file's write lock.
+# Transactions here are a few rows, so they stay well under a millisecond and never
+# wait on the main database's log writes. With one worker everything stays in-process
+# and this file is never created.
+
+WORKERS = int(os.getenv("WEB_CONCURRENCY", "1"))
+ENABLED = WORKERS > 1
+PATH = os.getenv("SHARED_STATE_PATH", "./.mediamind.shared.db")
+HEARTBEAT_SECONDS = float(os.getenv("SHARED_HEARTBEAT_SECONDS", "5"))
+# A worker whose heartbeat is older than this is treated as gone
+WORKER_TTL_SECONDS = float(os.getenv("SHARED_WORKER_TTL_SECONDS", "30"))
+
+WORKER_ID = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS quota (
+    model TEXT PRIMARY KEY, requests REAL, tokens REAL, updated REAL, blocked_until REAL
+);
+CREATE TABLE IF NOT EXISTS workers (id TEXT PRIMARY KEY, pid INTEGER, started REAL, heartbeat REAL);
+CREATE TABLE IF NOT EXISTS claims (name TEXT PRIMARY KEY, owner TEXT, until REAL);
+CREATE TABLE IF NOT EXISTS snapshots (
+    worker TEXT, name TEXT, updated REAL, meta TEXT, data BLOB, PRIMARY KEY (worker, name)
+);
+"""
+
+_conn = None
+_conn_pid = None
+_lock = threading.RLock()  # one statement or transaction at a time on the shared connection
+_publishers = {}  # snapshot name -> function returning (meta dict, bytes)
+_task = None
+_stats = {"draws": 0, "claims_won": 0, "snapshots_published": 0, "errors": 0}
+
+
+def _connection():
+    """This process's connection (reopened after a fork)"""
+    global _conn, _conn_pid
+    if _conn is None or _conn_pid != os.getpid():
+        conn = sqlite3.connect(PATH, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # Everything here is rebuilt from scratch after a crash, so skip fsyncs
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.executescript(SCHEMA)
+        _conn, _conn_pid = conn, os.getpid()
+    return _conn
+
+
+@contextmanager
+def _transaction():
+    with _lock:
+        conn = _connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+
+def _query(sql, params):
+    with _lock:
+        return _connection().execute(sql, params).fetchall()
+
+
+@contextmanager
+def task_lock(name):
+    """
+    Cross-process lock for one-off startup work (schema setup, backfills) that may run
+    for a long time. Waits as long as it takes, and lives in its own file, so quota
+    draws and claims on the shared file carry on meanwhile. Call it off the event loop.
+    """
+    if not ENABLED:
+        yield
+        return
+    conn = sqlite3.connect(f"{PATH}.{name}.lock", timeout=1, isolation_level=None)
+    try:
+        while True:
+            try:
+                conn.execute("BEGIN EXCLUSIVE")
+                break
+            except sqlite3.OperationalError as e:
+                if "locked" not in str(e):
+                    raise
+        try:
+            yield
+        finally:
+            conn.execute("ROLLBACK")
+    finally:
+        conn.close()
+
+
+def draw_quota(model_name, rpm, tpm, want_requests, want_tokens):
+    """
+    Take up to the wanted requests/tokens from the model's shared per-minute buckets.
+    Returns (requests granted, tokens granted, seconds the model is still blocked).
+    """
+    now = time.time()
+    with _transaction() as conn:
+        row = conn.execute(
+            "SELECT requests, tokens, updated, blocked_until FROM quota WHERE model = ?", (model_name,)
+        ).fetchone()
+        requests, tokens, updated, blocked_until = row if row else (rpm, tpm, now, 0.0)
+        elapsed = max(0.0, now - updated)
+        requests = min(rpm, requests + elapsed * rpm / 60)
+        tokens = min(tpm, tokens + elapsed * tpm / 60)
+        granted_requests = granted_tokens = 0.0
+        if blocked_until <= now:
+            granted_requests = min(want_requests, max(0.0, requests))
+            granted_tokens = min(want_tokens, max(0.0, tokens))
+        conn.execute(
+            "INSERT OR REPLACE INTO quota (model, requests, tokens, updated, blocked_until) VALUES (?, ?, ?, ?, ?)",
+            (model_name, requests - granted_requests, tokens - granted_tokens, now, blocked_until),
+        )
+    _stats["draws"] += 1
+    return granted_requests, granted_tokens, max(0.0, blocked_until - now)
+
+
+def block_quota(model_name, seconds, rpm, tpm):
+    """Pause the model for every worker after the server reported exhausted quota"""
+    until = time.time() + seconds
+    with _transaction() as conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO quota (model, requests, tokens, updated, blocked_until) VALUES (?, ?, ?, ?, 0)",
+            (model_name, rpm, tpm, time.time()),
+        )
+        conn.execute("UPDATE quota SET blocked_until = MAX(blocked_until, ?) WHERE model = ?", (until, model_name))
+
+
+def claim(name, seconds):
+    """
+    True for exactly one worker per `seconds` interval: the caller then owns `name`
+    until the interval ends. Always True with a single worker.
+    """
+    if not ENABLED:
+        return True
+    now = time.time()
+    try:
+        with _transaction() as conn:
+            row = conn.execute("SELECT owner, until FROM claims WHERE name = ?", (name,)).fetchone()
+            if row and row[1] > now:
+                return False
+            conn.execute("INSERT OR REPLACE INTO claims (name, owner, until) VALUES (?, ?, ?)", (name, WORKER_ID, now + seconds))
+        _stats["claims_won"] += 1
+        return True
+    except sqlite3.Error as e:
+        _stats["errors"] += 1
+        print(f"Shared state claim error: {e}")
+        return False
+
+
+def heartbeat():
+    now = time.time()
+    with _transaction() as conn:
+        conn.execute(
+            "INSERT INTO workers (id, pid, started, heartbeat) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET heartbeat = excluded.heartbeat",
+            (WORKER_ID, os.getpid(), now, now),
+        )
+        # Forget workers that have been gone for a while, with their snapshots
+        cutoff = now - 10 * WORKER_TTL_SECONDS
+        conn.execute("DELETE FROM snapshots WHERE worker IN (SELECT id FROM workers WHERE heartbeat < ?)", (cutoff,))
+        conn.execute("DELETE FROM workers WHERE heartbeat < ?", (cutoff,))
+
+
+def live_workers():
+    """Ids of workers with a recent heartbeat (always includes this one)"""
+    if not ENABLED:
+        return {WORKER_ID}
+    cutoff = time.time() - WORKER_TTL_SECONDS
+    rows = _query("SELECT id FROM workers WHERE heartbeat >= ?", (cutoff,))
+    return {row[0] for row in rows} | {WORKER_ID}
+
+
+def register_snapshot(name, publisher):
+    """publisher() -> (meta dict, bytes) is called on the event loop every heartbeat"""
+    _publishers[name] = publisher
+
+
+def _publish(name, meta, data):
+    data = zlib.compress(data, 1)
+    with _transaction() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO snapshots (worker, name, updated, meta, data) VALUES (?, ?, ?, ?, ?)",
+            (WORKER_ID, name, time.time(), json.dumps(meta), data),
+        )
+    _stats["snapshots_published"] += 1
+
+
+def other_snapshots(name):
+    """[(meta, bytes)] last published under name by the other live workers"""
+    if not ENABLED:
+        return []
+    cutoff = time.time() - WORKER_TTL_SECONDS
+    rows = _query(
+        "SELECT s.meta, s.data FROM snapshots s JOIN workers w ON w.id = s.worker "
+        "WHERE s.name = ? AND s.worker != ? AND w.heartbeat >= ?",
+        (name, WORKER_ID, cutoff),
+    )
+    return [(json.loads(meta), zlib.decompress(data)) for meta, data in rows]
+
+
+async def _run():
+    while True:
+        await asyncio.sleep(HEARTBEAT_SECONDS)
+        try:
+            await asyncio.to_thread(heartbeat)
+            for name, publisher in list(_publishers.items()):
+                # Snapshot on the loop (the data is mutated there), write in a thread
+                meta, data = publisher()
+                await asyncio.to_thread(_publish, name, meta, data)
+        except Exception as e:
+            _stats["errors"] += 1
+            print(f"Shared state error: {e}")
+
+
+async def start():
+    """Register this worker, then heartbeat and publish snapshots in the background (multi-worker mode only)"""
+    global _task
+    if ENABLED and (_task is None or _task.done()):
+        await asyncio.to_thread(heartbeat)
+        _task = asyncio.get_running_loop().create_task(_run())
+
+
+async def stop():
+    global _task
+    if _task is None:
+        return
+    _task.cancel()
+    try:
+        await _task
+    except asyncio.CancelledError:
+        pass
+    _task = None
+    try:
+        with _transaction() as conn:
+            conn.execute("DELETE FROM snapshots WHERE worker = ?", (WORKER_ID,))
+            conn.execute("DELETE FROM workers WHERE id = ?", (WORKER_ID,))
+    except sqlite3.Error as e:
+        print(f"Shared state error: {e}")
+
+
+def stats():
+    return {
+        **_stats,
+        "enabled": ENABLED,
+        "workers_configured": WORKERS,
+        "worker_id": WORKER_ID,
+        "live_workers": len(live_workers()) if ENABLED else 1,
+    }
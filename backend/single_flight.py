@@ -0,0 +1,45 @@
+import asyncio
+import hashlib
+from llm_cache import normalize
+
+# In-flight request coalescing.
+# Concurrent calls with the same key share one upstream call: the first caller
+# starts it, later callers await the same task until it finishes. The task is
+# shielded, so one caller disconnecting does not cancel the others.
+
+_inflight = {}  # key -> asyncio.Task
+_stats = {"calls": 0, "upstream_calls": 0, "coalesced": 0, "errors": 0}
+
+
+def make_key(*parts):
+    raw = "\x1f".join(normalize(p) for p in parts)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _done(key, task):
+    if _inflight.get(key) is task:
+        del _inflight[key]
+    if not task.cancelled() and task.exception() is not None:
+        _stats["errors"] += 1
+
+
+async def run(key, factory):
+    """Await factory() once for all concurrent callers with the same key"""
+    _stats["calls"] += 1
+    task = _inflight.get(key)
+    if task is None:
+        _stats["upstream_calls"] += 1
+        task = asyncio.ensure_future(factory())
+        _inflight[key] = task
+        task.add_done_callback(lambda t: _done(key, t))
+    else:
+        _stats["coalesced"] += 1
+    return await asyncio.shield(task)
+
+
+def stats():
+    return {
+        **_stats,
+        "saved_ratio": round(_stats["coalesced"] / _stats["calls"], 4) if _stats["calls"] else 0.0,
+        "in_flight": len(_inflight),
+    }
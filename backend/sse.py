@@ -0,0 +1,11 @@
+import json
+
+# Server-Sent Events helpers for the streaming endpoints
+
+def sse_event(data, event=None):
+    """Format one SSE message; data is sent as JSON"""
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+# Keep proxies (nginx etc.) from buffering the stream
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
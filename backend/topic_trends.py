@@ -0,0 +1,168 @@
+import os
+import re
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from database import SessionLocal, ActivityLog, TopicRollup
+from article_index import STOPWORDS
+
+# Topic volume time series for /feature-5/insights.
+# Every logged input is reduced to its distinct terms, and topic_rollup keeps one
+# count per (term, hour). A topic's series is read from that table in one indexed
+# range query; the trend is a local least-squares slope plus an EWMA forecast.
+
+# Features whose inputs count as topic mentions (insights queries themselves do not)
+EXCLUDED_FEATURES = {"insights"}
+MAX_TERMS_PER_ROW = int(os.getenv("TOPIC_MAX_TERMS_PER_ROW", "64"))
+
+# Relative change per bucket (slope / mean) beyond which a topic is Rising or Falling
+TREND_THRESHOLD = float(os.getenv("TOPIC_TREND_THRESHOLD", "0.05"))
+EWMA_ALPHA = 0.5
+
+GRANULARITIES = {"hourly": timedelta(hours=1), "daily": timedelta(days=1)}
+MAX_POINTS = {"hourly": 168, "daily": 90}
+
+TOPIC_STOPWORDS = STOPWORDS | {
+    "are", "as", "be", "but", "it", "its", "not", "or", "so", "that", "this", "was", "were", "will", "you",
+}
+
+_TERM_RE = re.compile(r"[a-z0-9]+")
+
+
+def is_term(token):
+    return len(token) > 1 and token not in TOPIC_STOPWORDS
+
+
+def tokens(text):
+    """Lowercase alphanumeric tokens of a text, stopwords included"""
+    return _TERM_RE.findall((text or "").lower())
+
+
+def terms(text):
+    """Distinct lowercase terms of a text, in first-seen order"""
+    seen = {}
+    for token in tokens(text):
+        if is_term(token):
+            seen.setdefault(token, None)
+            if len(seen) >= MAX_TERMS_PER_ROW:
+                break
+    return list(seen)
+
+
+def update_rollups(db, rows):
+    """Add a batch of ActivityLog row dicts to topic_rollup (caller commits)"""
+    counts = {}
+    for row in rows:
+        if row.get("feature") in EXCLUDED_FEATURES or row.get("timestamp") is None:
+            continue
+        hour = row["timestamp"].replace(minute=0, second=0, microsecond=0)
+        for term in terms(row.get("input_text")):
+            counts[(term, hour)] = counts.get((term, hour), 0) + 1
+    if not counts:
+        return
+    items = [{"term": term, "hour": hour, "count": n} for (term, hour), n in counts.items()]
+    # Stay well under SQLite's bound-parameter limit
+    for start in range(0, len(items), 300):
+        stmt = sqlite_insert(TopicRollup).values(items[start:start + 300])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["term", "hour"],
+            set_={"count": TopicRollup.count + stmt.excluded.count},
+        )
+        db.execute(stmt)
+
+
+def ensure_backfilled(batch_size=5000):
+    """One-time fill of topic_rollup from logs written before it existed"""
+    db = SessionLocal()
+    try:
+        if db.query(TopicRollup.term).first() is not None:
+            return
+        last_id = 0
+        while True:
+            batch = db.query(ActivityLog.id, ActivityLog.feature, ActivityLog.input_text, ActivityLog.timestamp).filter(
+                ActivityLog.id > last_id
+            ).order_by(ActivityLog.id).limit(batch_size).all()
+            if not batch:
+                break
+            update_rollups(db, [
+                {"feature": feature, "input_text": input_text, "timestamp": timestamp}
+                for _, feature, input_text, timestamp in batch
+            ])
+            last_id = batch[-1][0]
+        db.commit()
+    finally:
+        db.close()
+
+
+def _bucket_start(moment, granularity):
+    moment = moment.replace(minute=0, second=0, microsecond=0)
+    if granularity == "daily":
+        moment = moment.replace(hour=0)
+    return moment
+
+
+def series(topic, granularity="daily", points=7, now=None):
+    """
+    Mention counts per bucket for topic, oldest first; the last bucket is the current one.
+    A multi-word topic counts, per bucket, the smallest of its terms' counts.
+    """
+    step = GRANULARITIES[granularity]
+    end = _bucket_start(now or datetime.utcnow(), granularity)
+    start = end - step * (points - 1)
+    topic_terms = terms(topic)
+    if not topic_terms:
+        return [0] * points
+
+    db = SessionLocal()
+    try:
+        rows = db.query(TopicRollup.term, TopicRollup.hour, TopicRollup.count).filter(
+            TopicRollup.term.in_(topic_terms), TopicRollup.hour >= start
+        ).all()
+    finally:
+        db.close()
+
+    counts = np.zeros((len(topic_terms), points), dtype=np.int64)
+    position = {term: i for i, term in enumerate(topic_terms)}
+    for term, hour, n in rows:
+        bucket = int((_bucket_start(hour, granularity) - start) / step)
+        if 0 <= bucket < points:
+            counts[position[term], bucket] += n
+    return counts.min(axis=0).tolist()
+
+
+def trend(values):
+    """
+    Local trend estimate for a series whose last bucket is still filling.
+    Uses complete buckets only: least-squares slope relative to the mean, and an EWMA level.
+    """
+    complete = np.asarray(values[:-1] if len(values) > 2 else values, dtype=np.float64)
+    mean = float(complete.mean()) if complete.size else 0.0
+    slope = float(np.polyfit(np.arange(complete.size), complete, 1)[0]) if complete.size > 1 else 0.0
+    relative = slope / mean if mean > 0 else 0.0
+
+    level = complete[0] if complete.size else 0.0
+    for value in complete[1:]:
+        level = EWMA_ALPHA * value + (1 - EWMA_ALPHA) * level
+
+    if relative > TREND_THRESHOLD:
+        prediction = "Rising"
+    elif relative < -TREND_THRESHOLD:
+        prediction = "Falling"
+    else:
+        prediction = "Stable"
+    return {
+        "trend_prediction": prediction,
+        "slope": round(slope, 3),
+        "relative_slope": round(relative, 4),
+        "ewma": round(float(level), 2),
+        "forecast_next": max(0, round(float(level) + slope)),
+    }
+
+
+def format_volume(n):
+    """Compact volume label, e.g. 950, 12.3K, 1.2M"""
+    if n >= 1_000_000:
+        return f"{n / 1_000_000:.1f}M"
+    if n >= 1_000:
+        return f"{n / 1_000:.1f}K"
+    return str(n)
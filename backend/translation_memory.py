@@ -0,0 +1,146 @@
+import asyncio
+import hashlib
+import os
+import re
+from collections import OrderedDict
+from datetime import datetime
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from database import SessionLocal, TranslationSegment
+from llm_cache import normalize
+
+# Segment-level translation memory.
+# Input is split into sentences; each (normalized sentence, target language) pair is
+# looked up in the translation_memory table (fronted by a small LRU), so only unseen
+# sentences need Gemini. Shared boilerplate, headlines and disclaimers become free.
+# The LRU is used on the event loop; table reads and upserts run in a worker thread.
+
+MEMORY_MAX_ENTRIES = int(os.getenv("TRANSLATION_MEMORY_LRU_SIZE", "20000"))
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?。！？।])(\s+)|(\n+)")
+_lru = OrderedDict()
+_stats = {"segments": 0, "hits": 0, "misses": 0}
+
+
+def segment(text):
+    """
+    Split text into sentences.
+    Returns (segments, separators) where text == s0 + sep0 + s1 + sep1 + ... + sN.
+    """
+    segments, separators = [], []
+    last = 0
+    for match in _SENTENCE_RE.finditer(text):
+        segments.append(text[last:match.start()])
+        separators.append(match.group(0))
+        last = match.end()
+    segments.append(text[last:])
+    return segments, separators
+
+
+def join(segments, separators):
+    parts = []
+    for i, seg in enumerate(segments):
+        parts.append(seg)
+        if i < len(separators):
+            parts.append(separators[i])
+    return "".join(parts)
+
+
+def needs_translation(seg):
+    """Segments without letters (numbers, punctuation, blanks) pass through unchanged"""
+    return any(ch.isalpha() for ch in seg)
+
+
+def make_key(seg, target_language):
+    raw = f"{normalize(target_language).lower()}\x1f{normalize(seg)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _remember(key, translation):
+    _lru[key] = translation
+    _lru.move_to_end(key)
+    while len(_lru) > MEMORY_MAX_ENTRIES:
+        _lru.popitem(last=False)
+
+
+def _read_rows(keys):
+    db = SessionLocal()
+    try:
+        return db.query(TranslationSegment.key, TranslationSegment.translated_text).filter(
+            TranslationSegment.key.in_(keys)
+        ).all()
+    finally:
+        db.close()
+
+
+def _write_rows(rows):
+    db = SessionLocal()
+    try:
+        stmt = sqlite_insert(TranslationSegment).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["key"],
+            set_={"translated_text": stmt.excluded.translated_text, "created_at": stmt.excluded.created_at},
+        )
+        db.execute(stmt)
+        db.commit()
+    finally:
+        db.close()
+
+
+async def lookup(segments, target_language):
+    """Return {index: translation} for every segment already in memory"""
+    found = {}
+    keys = {}
+    for i, seg in enumerate(segments):
+        if not needs_translation(seg):
+            continue
+        key = make_key(seg, target_language)
+        if key in _lru:
+            _lru.move_to_end(key)
+            found[i] = _lru[key]
+        else:
+            keys.setdefault(key, []).append(i)
+
+    if keys:
+        try:
+            rows = await asyncio.to_thread(_read_rows, list(keys))
+            for key, translation in rows:
+                _remember(key, translation)
+                for i in keys[key]:
+                    found[i] = translation
+        except Exception as e:
+            print(f"Translation memory read error: {e}")
+
+    wanted = sum(1 for seg in segments if needs_translation(seg))
+    _stats["segments"] += wanted
+    _stats["hits"] += len(found)
+    _stats["misses"] += wanted - len(found)
+    return found
+
+
+async def store(pairs, target_language):
+    """Save (source segment, translation) pairs"""
+    rows = []
+    for seg, translation in pairs:
+        key = make_key(seg, target_language)
+        _remember(key, translation)
+        rows.append({
+            "key": key,
+            "target_language": target_language,
+            "source_text": seg,
+            "translated_text": translation,
+            "created_at": datetime.utcnow(),
+        })
+    if not rows:
+        return
+    try:
+        await asyncio.to_thread(_write_rows, rows)
+    except Exception as e:
+        print(f"Translation memory write error: {e}")
+
+
+def stats():
+    return {
+        **_stats,
+        "hit_ratio": round(_stats["hits"] / _stats["segments"], 4) if _stats["segments"] else 0.0,
+        "lru_entries": len(_lru),
+    }
@@ -0,0 +1,209 @@
+import hashlib
+import heapq
+import math
+import os
+import time
+import numpy as np
+from topic_trends import tokens, is_term
+import shared_state
+
+# "What's trending right now" over the texts sent to sentiment, safety and summary.
+# Each window (hour, day) is a Count-Min Sketch of exponentially decayed counts plus
+# a bounded top-k candidate heap, so memory is fixed and one observation costs
+# O(depth) per term (amortized O(log k) for the heap). Decay uses a growing weight instead of touching every cell:
+# a hit at time t adds e^((t - t0)/tau), and counts are read back divided by the
+# weight at "now". Before the exponent gets large enough to overflow (also after a
+# long idle gap), the arrays are rescaled and t0 moves to now.
+# With several worker processes each one publishes its sketches through shared_state;
+# Count-Min Sketches of the same shape add up, so trending() sums the decayed tables
+# of all live workers and re-scores the union of their candidates.
+
+SKETCH_WIDTH = int(os.getenv("TRENDING_SKETCH_WIDTH", "16384"))  # power of two, at most 65536
+SKETCH_DEPTH = 4
+TOP_K = int(os.getenv("TRENDING_TOP_K", "100"))
+# Cap on distinct terms counted per text, so long documents cost the same as posts
+MAX_TERMS_PER_TEXT = int(os.getenv("TRENDING_MAX_TERMS_PER_TEXT", "200"))
+
+WINDOWS = {"hour": 3600.0, "day": 86400.0}  # decay time constant per window (seconds)
+RESCALE_EXPONENT = math.log(1e50)
+
+
+def _columns(key):
+    """SKETCH_DEPTH column indexes from one 64-bit hash (16 bits per row)"""
+    h = int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+    return [(h >> (16 * row)) & (SKETCH_WIDTH - 1) for row in range(SKETCH_DEPTH)]
+
+
+class TopK:
+    """Heavy-hitter candidates: term -> score, with a lazily cleaned min-heap"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.scores = {}
+        self.heap = []  # (score, term); entries go stale when a score changes
+
+    def _min(self):
+        while self.heap:
+            score, term = self.heap[0]
+            if self.scores.get(term) == score:
+                return score, term
+            heapq.heappop(self.heap)
+        return None
+
+    def offer(self, term, score):
+        if term not in self.scores and len(self.scores) >= self.capacity:
+            smallest = self._min()
+            if smallest is None or score <= smallest[0]:
+                return
+            heapq.heappop(self.heap)
+            del self.scores[smallest[1]]
+        self.scores[term] = score
+        heapq.heappush(self.heap, (score, term))
+        if len(self.heap) > 4 * self.capacity:
+            self.heap = [(s, t) for t, s in self.scores.items()]
+            heapq.heapify(self.heap)
+
+    def scale(self, factor):
+        self.scores = {t: s * factor for t, s in self.scores.items()}
+        self.heap = [(s, t) for t, s in self.scores.items()]
+        heapq.heapify(self.heap)
+
+    def top(self, n):
+        return heapq.nlargest(n, self.scores.items(), key=lambda item: item[1])
+
+
+class DecayedWindow:
+    def __init__(self, tau):
+        self.tau = tau
+        self.t0 = time.time()
+        self.table = np.zeros((SKETCH_DEPTH, SKETCH_WIDTH), dtype=np.float64)
+        self.rows = np.arange(SKETCH_DEPTH)
+        self.terms = TopK(TOP_K)
+        self.phrases = TopK(TOP_K)
+
+    def _weight(self, now):
+        exponent = (now - self.t0) / self.tau
+        if exponent > RESCALE_EXPONENT:
+            # Scale by e^-exponent rather than dividing by e^exponent, which may not fit a float
+            factor = math.exp(-exponent)
+            self.table *= factor
+            self.terms.scale(factor)
+            self.phrases.scale(factor)
+            self.t0 = now
+            return 1.0
+        return math.exp(exponent)
+
+    def add(self, keys, phrases, cols, now):
+        """Count keys (cols is their SKETCH_DEPTH x len(keys) column matrix) once each"""
+        weight = self._weight(now)
+        np.add.at(self.table, (self.rows[:, None], cols), weight)
+        estimates = self.table[self.rows[:, None], cols].min(axis=0).tolist()
+        for key, phrase, estimate in zip(keys, phrases, estimates):
+            (self.phrases if phrase else self.terms).offer(key, estimate)
+
+    def top(self, n, now, phrase=False):
+        weight = self._weight(now)
+        tracker = self.phrases if phrase else self.terms
+        return [{"term": term, "score": round(score / weight, 2)} for term, score in tracker.top(n)]
+
+
+_windows = {name: DecayedWindow(tau) for name, tau in WINDOWS.items()}
+_stats = {"texts": 0, "terms": 0}
+_remote = {"fetched": 0.0, "snapshots": []}  # other workers' sketches, refreshed once per heartbeat
+
+
+def observe(text):
+    """Count the distinct terms and two-word phrases of one text in every window"""
+    # Routers call this before validating their input, so any JSON value may arrive here
+    words = tokens(text if isinstance(text, str) else str(text or ""))
+    keys = {}
+    for i, word in enumerate(words):
+        if len(keys) >= MAX_TERMS_PER_TEXT:
+            break
+        if not is_term(word):
+            continue
+        keys.setdefault(word, False)
+        if i + 1 < len(words) and is_term(words[i + 1]):
+            keys.setdefault(f"{word} {words[i + 1]}", True)
+    if not keys:
+        return
+    now = time.time()
+    cols = np.array([_columns(key) for key in keys], dtype=np.int64).T
+    phrases = list(keys.values())
+    for window in _windows.values():
+        window.add(list(keys), phrases, cols, now)
+    _stats["texts"] += 1
+    _stats["terms"] += len(keys)
+
+
+def snapshot():
+    """(meta, bytes) of this process's sketches, as counts decayed to the current time"""
+    now = time.time()
+    meta = {"published": now, "width": SKETCH_WIDTH, "windows": {}}
+    tables = []
+    for name, window in _windows.items():
+        tables.append(window.table / window._weight(now))
+        meta["windows"][name] = {"terms": list(window.terms.scores), "phrases": list(window.phrases.scores)}
+    return meta, np.stack(tables).astype(np.float32).tobytes()
+
+
+shared_state.register_snapshot("trending", snapshot)
+
+
+def _other_workers():
+    now = time.time()
+    if now - _remote["fetched"] >= shared_state.HEARTBEAT_SECONDS:
+        _remote["snapshots"] = shared_state.other_snapshots("trending")
+        _remote["fetched"] = now
+    return _remote["snapshots"]
+
+
+def _merged_top(name, limit, now, others):
+    """Top terms and phrases over this process's sketch plus the other workers' snapshots"""
+    window = _windows[name]
+    merged = window.table / window._weight(now)
+    candidates = {"terms": set(window.terms.scores), "phrases": set(window.phrases.scores)}
+    for meta, data in others:
+        if meta.get("width") != SKETCH_WIDTH or name not in meta["windows"]:
+            continue
+        tables = np.frombuffer(data, dtype=np.float32).reshape(-1, SKETCH_DEPTH, SKETCH_WIDTH)
+        age = now - meta["published"]
+        merged += tables[list(meta["windows"]).index(name)] * math.exp(-age / window.tau)
+        for kind in candidates:
+            candidates[kind].update(meta["windows"][name][kind])
+
+    result = {}
+    for kind, keys in candidates.items():
+        keys = list(keys)
+        if not keys:
+            result[kind] = []
+            continue
+        cols = np.array([_columns(key) for key in keys], dtype=np.int64).T
+        estimates = merged[window.rows[:, None], cols].min(axis=0)
+        order = np.argsort(-estimates, kind="stable")[:limit]
+        result[kind] = [{"term": keys[i], "score": round(float(estimates[i]), 2)} for i in order]
+    return result
+
+
+def trending(window="hour", limit=20):
+    """Top decayed terms and phrases for a window; scores are recent-weighted mention counts"""
+    now = time.time()
+    current = _windows[window]
+    others = _other_workers() if shared_state.ENABLED else []
+    if others:
+        return {"window": window, **_merged_top(window, limit, now, others)}
+    return {
+        "window": window,
+        "terms": current.top(limit, now),
+        "phrases": current.top(limit, now, phrase=True),
+    }
+
+
+def stats():
+    return {
+        **_stats,
+        "sketch_width": SKETCH_WIDTH,
+        "sketch_depth": SKETCH_DEPTH,
+        "top_k": TOP_K,
+        "windows": list(WINDOWS),
+    }